@@ -145,6 +145,14 @@ STATIC_URL = '/static/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'uploaded_files/')
 MEDIA_URL = '/media/'
 
+# Parsed waveforms are cached in memory up to this many bytes per process. Every web worker, the
+# grading daemon and each of its warm grading script workers keeps its own cache, hence the memory
+# used in total is this size times the number of such processes. To share them between processes,
+# set WAVEFORM_CACHE_DIR to a scratch directory outside of the source tree. The disk tier is not
+# bounded, hence the directory should be cleaned up periodically (e.g., by a cron job).
+WAVEFORM_CACHE_MAX_BYTES = 64 * 1024 * 1024
+WAVEFORM_CACHE_DIR = None
+
 ## Convenience related settings
 APPEND_SLASH = True
 
@@ -20,6 +20,7 @@ from serapis.utils import file_schema
 from serapis.utils import user_info_helper
 from serapis.utils import team_helper
 from serapis.utils import submission_helper
+from serapis.utils import result_cache
 
 from django.utils import timezone
 from datetime import timedelta
@@ -36,7 +37,7 @@ class AssignmentForm(ModelForm):
     class Meta:
         model = Assignment
         fields = ['name', 'release_time', 'deadline', 'problem_statement', 'testbed_type_fk',
-                'num_testbeds']
+                'num_testbeds', 'enable_result_cache']
         date_time_options = {
                 'format': 'mm/dd/yyyy hh:ii',
                 'autoclose': True,
@@ -363,10 +364,23 @@ class AssignmentSubmissionForm(Form):
         # dispatch grading tasks
         assignment_tasks = self.assignment.retrieve_assignment_tasks_by_accumulative_scope(
                 self.cleaned_data['execution_scope'])
+        # the submission files are hashed once for all the tasks
+        submission_files_hash = (result_cache.hash_submission_files(submission)
+                if self.assignment.enable_result_cache else None)
+        num_reused_tasks = 0
         for assignment_task in assignment_tasks:
+            if result_cache.create_task_grading_status_from_cache(submission, assignment_task,
+                    submission_files_hash):
+                num_reused_tasks += 1
+                continue
             grading_task= submission_helper.create_task_grading_status(submission, assignment_task)
             file_schema.create_empty_task_grading_status_schema_files(grading_task)
 
+        # the submission is graded already if all the results are taken from the cache
+        if len(assignment_tasks) > 0 and num_reused_tasks == len(assignment_tasks):
+            submission.status = Submission.STAT_GRADED
+            submission.save(update_fields=['status'])
+
         return submission
 
 
@@ -1,4 +1,5 @@
 from django import forms
+from django.db import transaction
 from django.utils import timezone
 
 from serapis.models import *
@@ -30,14 +31,17 @@ class ReturnDutOutputForm(forms.Form):
         Return:
           (task_grading_status, testbed)
         """
-        testbed_helper.finish_grading(
-                self.testbed, task_execution_status=TaskGradingStatus.EXEC_OK)
-
-        schema_name_2_files = {}
-        for schema_name in self.schema_names:
-            field_name = 'file_' + schema_name
-            schema_name_2_files[schema_name] = self.cleaned_data[field_name]
-        file_schema.save_dict_schema_name_to_task_grading_status_files(
-                self.task, schema_name_2_files)
+        # finish_grading() wakes up the scheduler to check the output once the transaction is
+        # committed, so the output files have to be saved in the same transaction
+        with transaction.atomic():
+            testbed_helper.finish_grading(
+                    self.testbed, task_execution_status=TaskGradingStatus.EXEC_OK)
+
+            schema_name_2_files = {}
+            for schema_name in self.schema_names:
+                field_name = 'file_' + schema_name
+                schema_name_2_files[schema_name] = self.cleaned_data[field_name]
+            file_schema.save_dict_schema_name_to_task_grading_status_files(
+                    self.task, schema_name_2_files)
 
         return (self.task, self.testbed)
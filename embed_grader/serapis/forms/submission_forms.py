@@ -15,6 +15,7 @@ from datetimewidget.widgets import DateTimeWidget, DateWidget, TimeWidget
 from serapis.models import *
 from serapis.utils import grading
 from serapis.utils import submission_helper
+from serapis.utils.grading_scheduler_wakeup import GradingSchedulerWakeup
 
 from datetime import timedelta
 
@@ -40,6 +41,13 @@ class RegradeForm(Form):
             (SUBMISSION_OPTION_CUSTOMIZED, 'Specify submission IDs'),
     )
 
+    MODE_OPTION_EXECUTE = '20'
+    MODE_OPTION_RESCORE = '21'
+    MODE_CHOICES = (
+            (MODE_OPTION_EXECUTE, 'Execute on testbeds again'),
+            (MODE_OPTION_RESCORE, 'Re-score the stored outputs with the current grading script'),
+    )
+
     def __init__(self, *args, **kwargs):
         assignment = kwargs.pop('assignment')
         super(RegradeForm, self).__init__(*args, **kwargs)
@@ -80,6 +88,13 @@ class RegradeForm(Form):
                 choices=assignment_task_choices,
                 initial=assignment_task_choices_id,
         )
+
+        self.fields['regrade_mode'] = forms.ChoiceField(
+                required=True,
+                widget=forms.RadioSelect,
+                choices=RegradeForm.MODE_CHOICES,
+                initial=RegradeForm.MODE_OPTION_EXECUTE,
+        )
         
         # set up variables to be used
         self.assignment = assignment
@@ -146,6 +161,18 @@ class RegradeForm(Form):
                 for atid in self.cleaned_data['assignment_task_choice']]
         assignment_task_set = set(assignment_tasks)
 
+        # re-score mode: the tasks which have stored outputs are checked again by the output
+        # checkers of the grading daemon, testbeds are not involved
+        if self.cleaned_data['regrade_mode'] == RegradeForm.MODE_OPTION_RESCORE:
+            num_affected_task_grading_status = 0
+            for s in submission_list:
+                task_grading_status_list = TaskGradingStatus.objects.filter(submission_fk=s)
+                for task_grading in task_grading_status_list:
+                    if (task_grading.assignment_task_fk in assignment_task_set
+                            and submission_helper.rescore_task_grading_status(task_grading)):
+                        num_affected_task_grading_status += 1
+            return (num_affected_submissions, num_affected_task_grading_status)
+
         # change TaskGradingStatus records
         affected_task_grading_status = set()
         for s in submission_list:
@@ -159,6 +186,8 @@ class RegradeForm(Form):
                     )
                     affected_task_grading_status.add(task_grading)
         num_affected_task_grading_status = len(affected_task_grading_status)
+        if num_affected_task_grading_status > 0:
+            GradingSchedulerWakeup.notify()
 
         # invalidate affected testbeds
         testbed_type = self.assignment.testbed_type_fk
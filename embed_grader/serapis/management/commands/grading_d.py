@@ -13,6 +13,8 @@ import traceback
 from django.core.files.base import ContentFile
 from django.core.management.base import BaseCommand
 from django.utils import timezone
+from django.db import transaction
+from django.db.models import Min
 from django.db.models import Q
 
 from embed_grader import settings
@@ -23,13 +25,29 @@ from serapis.utils import submission_helper
 from serapis.utils import testbed_helper
 from serapis.utils import team_helper
 from serapis.utils.grading_scheduler_heartbeat import GradingSchedulerHeartbeat
+from serapis.utils.grading_scheduler_wakeup import GradingSchedulerWakeup
+from serapis.utils.output_checker import OutputCheckerPool
+from serapis.utils.testbed_dispatcher import TestbedDispatcherPool
 
 K_TESTBED_INVALIDATION_OFFLINE_SEC = 30
 K_TESTBED_INVALIDATION_REMOVE_SEC = 10 * 60
 
 K_GRADING_GRACE_PERIOD_SEC = 60
 
-K_CYCLE_DURATION_SEC = 3
+K_NUM_DISPATCHERS = 8
+K_DISPATCH_CONNECT_TIMEOUT_SEC = 5
+K_DISPATCH_READ_TIMEOUT_SEC = 60
+
+K_NUM_OUTPUT_CHECKERS = 4
+K_GRADING_SCRIPT_TIMEOUT_SEC = 5 * 60
+
+# The scheduler sleeps until GradingSchedulerWakeup notifies a state change. This is the longest
+# time it sleeps without a notification, as a safety net for state changes which are not notified.
+K_CYCLE_DURATION_SEC = 10
+
+# Without LISTEN/NOTIFY (i.e., not on PostgreSQL), notifications from the web server processes
+# never reach the scheduler, hence it keeps polling on the original short cycle.
+K_POLLING_CYCLE_DURATION_SEC = 3
 
 
 class Command(BaseCommand):
@@ -63,61 +81,48 @@ class Command(BaseCommand):
             fo.write(log_msg + '\n')
         self.print_lock.release()
 
-    def _schemaFiles2postFiles(self, dict_schema_files):
-        postFiles = {}
-        for schema_name in dict_schema_files:
-            field_name = 'file_' + schema_name
-            postFiles[field_name] = ('filename',
-                    open(dict_schema_files[schema_name].file.path, 'rb'), 'text/plain')
-        return postFiles
-
-    def _grade(self, testbed, task):
-        TaskGradingStatusFile.objects.filter(
-                task_grading_status_fk=task).update(file=None)
-
-        self._printMessage('Send job for grading: task %d, sub=%s, hw_task=%s, hw=%s, course=%s' % (
-            task.id,
-            task.submission_fk,
-            task.assignment_task_fk,
-            task.submission_fk.assignment_fk,
-            task.submission_fk.assignment_fk.course_fk.course_code))
-
-        try:
-            submission = task.submission_fk
-            files = self._schemaFiles2postFiles(file_schema
-                    .get_dict_schema_name_to_submission_schema_files(submission))
-            
-            assignment_task = task.assignment_task_fk
-            files.update(self._schemaFiles2postFiles(file_schema
-                    .get_dict_schema_name_to_assignment_task_schema_files(assignment_task)))
-
-            data = {
-                    'execution_time': task.assignment_task_fk.execution_duration,
-                    'secret_code': testbed.secret_code,
-            }
-
-            url = 'http://' + testbed.ip_address + '/tb/grade_assignment/'
-            
-            r = requests.post(url, data=data, files=files)
-            if r.status_code != 200:  # testbed is not available
-                testbed_helper.abort_task(testbed, set_testbed_status=Testbed.STATUS_BUSY)
-                self._printMessage('Testbed id=%d abort task %d' % (testbed.id, task.id))
-                
-        except:
-            testbed_helper.abort_task(testbed, set_testbed_status=Testbed.STATUS_OFFLINE)
-            self._printMessage('Testbed id=%d goes offline since something goes wrong:'
-                    % testbed.id)
-            exc_type, exc_value, exc_tb = sys.exc_info()
-            traceback.print_exception(exc_type, exc_value, exc_tb)
+    def add_arguments(self, parser):
+        parser.add_argument('--num-dispatchers', type=int, default=K_NUM_DISPATCHERS,
+                help='Number of tasks which can be uploaded to testbeds concurrently')
+        parser.add_argument('--num-output-checkers', type=int, default=K_NUM_OUTPUT_CHECKERS,
+                help='Number of grading scripts which can be executed concurrently')
+        parser.add_argument('--grading-script-timeout', type=float,
+                default=K_GRADING_SCRIPT_TIMEOUT_SEC,
+                help='Wall-clock time limit of a grading script in seconds')
+        parser.add_argument('--warm-grading-workers', action='store_true',
+                help='Execute grading scripts in long-lived python processes')
 
     def handle(self, *args, **options):
         # heartbeat initialization
         heartbeat = GradingSchedulerHeartbeat()
 
+        # task dispatching initialization
+        dispatcher_pool = TestbedDispatcherPool(
+                num_workers=options['num_dispatchers'],
+                connect_timeout_sec=K_DISPATCH_CONNECT_TIMEOUT_SEC,
+                read_timeout_sec=K_DISPATCH_READ_TIMEOUT_SEC,
+                print_func=self._printMessage,
+        )
+
+        # output checking initialization
+        output_checker_pool = OutputCheckerPool(
+                num_workers=options['num_output_checkers'],
+                timeout_sec=options['grading_script_timeout'],
+                print_func=self._printMessage,
+                use_warm_workers=options['warm_grading_workers'],
+        )
+
+        # wake-up channel initialization
+        wakeup = GradingSchedulerWakeup()
+        cycle_duration_sec = (K_CYCLE_DURATION_SEC
+                if GradingSchedulerWakeup.can_wake_up_other_processes()
+                else K_POLLING_CYCLE_DURATION_SEC)
+
         # timer initialization
         timer_testbed_invalidation_offline = 0
         timer_testbed_invalidation_remove = 0
         timer_submission_invalidation = 0
+        last_cycle_time = time.time()
 
         while True:
             # at any given time, if we detect another grading scheduler running, this scheulder
@@ -129,9 +134,14 @@ class Command(BaseCommand):
             # leave a heartbeat
             heartbeat.send_heartbeat()
 
-            timer_testbed_invalidation_offline -= K_CYCLE_DURATION_SEC
-            timer_testbed_invalidation_remove -= K_CYCLE_DURATION_SEC
-            timer_submission_invalidation -= K_CYCLE_DURATION_SEC
+            # cycles have variable lengths since the scheduler can be woken up at any time
+            cur_cycle_time = time.time()
+            elapsed_sec = cur_cycle_time - last_cycle_time
+            last_cycle_time = cur_cycle_time
+
+            timer_testbed_invalidation_offline -= elapsed_sec
+            timer_testbed_invalidation_remove -= elapsed_sec
+            timer_submission_invalidation -= elapsed_sec
 
             now = timezone.now()
 
@@ -142,30 +152,35 @@ class Command(BaseCommand):
             # remove testbed records in database when timeout
             if timer_testbed_invalidation_remove <= 0:
                 threshold_time = now - datetime.timedelta(0, K_TESTBED_INVALIDATION_REMOVE_SEC)
-                testbed_list = Testbed.objects.filter(report_time__lt=threshold_time)
-                for testbed in testbed_list:
-                    # make sure that no task is associated with this testbed
-                    testbed_helper.abort_task(testbed, set_testbed_status=Testbed.STATUS_OFFLINE,
-                            enforce_task_present=False)
-                    self._printMessage('Testbed id=%d removed from testbed' % (testbed.id))
-                testbed_list.delete()
+                testbed_rows = list(Testbed.objects.filter(report_time__lt=threshold_time)
+                        .values_list('id', 'ip_address'))
+                for testbed_id, ip_address in testbed_rows:
+                    self._printMessage('Testbed id=%d removed from testbed' % (testbed_id))
+                    dispatcher_pool.discard_session(ip_address)
+                if len(testbed_rows) > 0:
+                    # make sure that no task is associated with these testbeds
+                    testbed_id_list = [testbed_id for testbed_id, _ in testbed_rows]
+                    testbed_helper.abort_tasks_of_testbeds(
+                            testbed_id_list, set_testbed_status=Testbed.STATUS_OFFLINE)
+                    Testbed.objects.filter(id__in=testbed_id_list).delete()
                 timer_testbed_invalidation_remove = K_TESTBED_INVALIDATION_REMOVE_SEC
 
             # set testbed to offline in database when timeout
             if timer_testbed_invalidation_offline <= 0:
                 threshold_time = now - datetime.timedelta(0, K_TESTBED_INVALIDATION_OFFLINE_SEC)
-                testbed_list = Testbed.objects.filter(
+                testbed_rows = list(Testbed.objects.filter(
                         ~Q(status=Testbed.STATUS_OFFLINE),
                         report_time__lt=threshold_time,
-                )
-                for testbed in testbed_list:
-                    self._printMessage('Set testbed id=%d offline' % (testbed.id))
-                    graded_task = testbed.task_being_graded
-                    if graded_task:
+                ).values_list('id', 'task_being_graded'))
+                for testbed_id, graded_task_id in testbed_rows:
+                    self._printMessage('Set testbed id=%d offline' % (testbed_id))
+                    if graded_task_id:
                         self._printMessage('Abort the grading task id=%d and reset to pending'
-                                % (graded_task.id))
-                    testbed_helper.abort_task(testbed, set_testbed_status=Testbed.STATUS_OFFLINE,
-                            enforce_task_present=False)
+                                % (graded_task_id))
+                if len(testbed_rows) > 0:
+                    testbed_helper.abort_tasks_of_testbeds(
+                            [testbed_id for testbed_id, _ in testbed_rows],
+                            set_testbed_status=Testbed.STATUS_OFFLINE)
                 
                 timer_testbed_invalidation_offline = K_TESTBED_INVALIDATION_OFFLINE_SEC
 
@@ -173,150 +188,71 @@ class Command(BaseCommand):
             # happen is that somehow some hardware (either hardware engine or DUT) go wrong but
             # they are not aware the error. If the testbed passed the grading deadline without
             # reporting grading results, we abort the grading task and reset the status
-            testbed_list = Testbed.objects.filter(
+            testbed_rows = list(Testbed.objects.filter(
                     status=Testbed.STATUS_BUSY,
-                    grading_deadline__lt=now)
-            for testbed in testbed_list:
-                graded_task = testbed.task_being_graded
-                self._printMessage('Testbed id=%d passed the grading deadline' % testbed.id)
-                if graded_task:
+                    grading_deadline__lt=now,
+            ).values_list('id', 'task_being_graded'))
+            for testbed_id, graded_task_id in testbed_rows:
+                self._printMessage('Testbed id=%d passed the grading deadline' % testbed_id)
+                if graded_task_id:
                     self._printMessage('Abort the grading task id=%d and reset to pending'
-                            % (graded_task.id))
+                            % (graded_task_id))
                 else:
                     self._printMessage('Wait, no grading task is found, why being busy then')
-                testbed_helper.abort_task(testbed, set_testbed_status=Testbed.STATUS_AVAILABLE,
-                        enforce_task_present=False)
+            if len(testbed_rows) > 0:
+                testbed_helper.abort_tasks_of_testbeds(
+                        [testbed_id for testbed_id, _ in testbed_rows],
+                        set_testbed_status=Testbed.STATUS_AVAILABLE)
 
             #TODO(#160): Remove the following code when the issue is resolved
             # What happens right now is that a testbed sometimes mysteriously detach the task
-            # which the testbed should be grading, leaving the task hanging on there and showing
-            # status as executing. The following is to clear this when orphan task grading status
-            # is found
-            executing_task_grading_status_list = TaskGradingStatus.objects.filter(
-                    grading_status=TaskGradingStatus.STAT_EXECUTING)
-            for task in executing_task_grading_status_list:
-                if Testbed.objects.filter(task_being_graded=task).count() == 0:
-                    self._printMessage('Orphan test grading status is found (id=%d)' % task.id)
-                    task.grading_status = TaskGradingStatus.STAT_PENDING
-                    task.save()
+            # which the testbed should be grading, leaving the task hanging on there and
+            # showing status as executing. The following is to clear this when orphan task
+            # grading status is found
+            for task_id in testbed_helper.reset_orphan_tasks():
+                self._printMessage('Orphan test grading status is found (id=%d)' % task_id)
 
             #
             # task assignment
             #
 
-            # task assignment policy: choose an available tesbed, find one task which can be
-            # executed on this testbed, and do it
-            testbed_list = Testbed.objects.filter(status=Testbed.STATUS_AVAILABLE)
-            for testbed in testbed_list:
-                # We choose a task whose belonged submission has the smallest execution scope.
-                task_list = (TaskGradingStatus.objects
-                        .filter(grading_status=TaskGradingStatus.STAT_PENDING,
-                            assignment_task_fk__assignment_fk__testbed_type_fk=testbed.testbed_type_fk)
-                        .order_by('submission_fk__task_scope', 'submission_fk', 'id'))
+            # only upload the tasks after the assignment is committed
+            testbed_task_pairs = testbed_helper.assign_pending_tasks(K_GRADING_GRACE_PERIOD_SEC)
+            for testbed, chosen_task in testbed_task_pairs:
+                dispatcher_pool.submit(testbed, chosen_task)
+            num_dispatched_tasks = len(testbed_task_pairs)
 
-                if task_list.count() == 0:
-                    # next testbed
-                    continue
-
-                chosen_task = task_list[0]
-
-                duration = (chosen_task.assignment_task_fk.execution_duration
-                        + K_GRADING_GRACE_PERIOD_SEC)
-                testbed_helper.grade_task(
-                        testbed, chosen_task, duration, force_detach_currently_graded_task=True)
-
-                threading.Thread(target=self._grade, name=('id=%s' % testbed.ip_address),
-                        kwargs={'testbed': testbed, 'task': chosen_task}).start()
+            if num_dispatched_tasks > 0:
+                self._printMessage('Dispatched %d tasks, dispatcher queue depth=%d' % (
+                        num_dispatched_tasks, dispatcher_pool.get_queue_depth()))
 
 
             #
             # output checking
             #
-            grading_task_list = TaskGradingStatus.objects.filter(
-                    grading_status=TaskGradingStatus.STAT_OUTPUT_TO_BE_CHECKED)
-            for grading_task in grading_task_list:
-                if grading_task.execution_status == TaskGradingStatus.EXEC_SEG_FAULT:
-                    submission_helper.update_task_grading_status(
-                            grading_task,
-                            grading_status=TaskGradingStatus.STAT_FINISH,
-                            points=0.0,
-                    )
-                else:
-                    assignment_task = grading_task.assignment_task_fk
-                    submission = grading_task.submission_fk
-                    grading_script_path = assignment_task.grading_script.path
-                    cmd = ['python3', grading_script_path]
-                    schema_files = {}
-                    schema_files.update(file_schema.
-                            get_dict_schema_name_to_assignment_task_schema_files(assignment_task))
-                    schema_files.update(file_schema.
-                            get_dict_schema_name_to_submission_schema_files(submission))
-                    schema_files.update(file_schema.
-                            get_dict_schema_name_to_task_grading_status_schema_files(grading_task))
-                    for field in schema_files:
-                        cmd.append('%s:%s' % (field, schema_files[field].file.path))
-
-                    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-                    try:
-                        result_pack = json.loads(proc.communicate()[0].decode('ascii'))
-                        normalized_score = float(result_pack['score'])
-                        normalized_score = min(1., max(0., normalized_score))
-                        grading_task.grading_detail.save(
-                                'description.txt', ContentFile(result_pack['detail']))
-                        points = assignment_task.points * normalized_score
-                        submission_helper.update_task_grading_status(
-                                grading_task,
-                                grading_status=TaskGradingStatus.STAT_FINISH,
-                                points=points,
-                                status_update_time=timezone.now(),
-                        )
-                    except (ValueError):
-                        submission_helper.update_task_grading_status(
-                                grading_task,
-                                grading_status=TaskGradingStatus.STAT_PENDING,
-                                points=0.0,
-                        )
-                        exc_type, exc_value, exc_tb = sys.exc_info()
-                        traceback.print_exception(exc_type, exc_value, exc_tb)
-
-                self._printMessage(
-                        'Graded task=%d, status=%s, pts=%f, sub=%s, hw_task=%s, hw=%s' % (
-                                grading_task.id, grading_task.get_grading_status_display(),
-                                grading_task.points, grading_task.submission_fk,
-                                grading_task.assignment_task_fk,
-                                grading_task.submission_fk.assignment_fk))
-
-                num_graded_tasks = len(TaskGradingStatus.objects.filter(
-                        Q(grading_status=TaskGradingStatus.STAT_FINISH)
-                        | Q(grading_status=TaskGradingStatus.STAT_INTERNAL_ERROR),
-                        submission_fk=grading_task.submission_fk))
-                num_assignment_tasks = len(TaskGradingStatus.objects.filter(
-                        submission_fk=grading_task.submission_fk))
-                self._printMessage('num_graded_tasks=%d, num_assignment_tasks=%d' % (
-                        num_graded_tasks, num_assignment_tasks))
-                if num_graded_tasks == num_assignment_tasks:
-                    submission = grading_task.submission_fk
-                    submission.status = Submission.STAT_GRADED
-                    submission.save()
-
-                    # send email to the student
-                    #subject = 'Your submission has been graded (ID:%d)' % submission.id
-                    #team = submission.team_fk
-                    #recipient_email_list = [tm.user_fk.email
-                    #        for tm in team_helper.get_team_members(team)]
-                    #context = {
-                    #        'user': submission.student_fk,
-                    #        'submission': submission,
-                    #        'assignment': submission.assignment_fk,
-                    #}
-                    #send_mail_helper.send_by_template(
-                    #        subject=subject,
-                    #        recipient_email_list=recipient_email_list,
-                    #        template_path='serapis/email/grading_done_email.html',
-                    #        context_dict=context,
-                    #)
-
-            # go to sleep
+
+            # grading scripts are executed by the output checker pool, here we only feed the tasks
+            # into its queue
+            grading_task_id_list = TaskGradingStatus.objects.filter(
+                    grading_status=TaskGradingStatus.STAT_OUTPUT_TO_BE_CHECKED,
+            ).values_list('id', flat=True)
+            for grading_task_id in grading_task_id_list:
+                output_checker_pool.submit(grading_task_id)
+
+            # go to sleep until either a state change is notified or a timer expires
             self._printAlive()
-            time.sleep(K_CYCLE_DURATION_SEC)
+            sleep_sec = min(
+                    cycle_duration_sec,
+                    timer_testbed_invalidation_offline,
+                    timer_testbed_invalidation_remove,
+            )
+
+            # wake up right after the earliest grading deadline, so that a testbed which passes it
+            # is aborted as soon as in the old fixed polling
+            next_grading_deadline = Testbed.objects.filter(status=Testbed.STATUS_BUSY).aggregate(
+                    Min('grading_deadline'))['grading_deadline__min']
+            if next_grading_deadline is not None:
+                sleep_sec = min(sleep_sec,
+                        max(1., (next_grading_deadline - timezone.now()).total_seconds() + 1.))
+            wakeup.wait(max(0., sleep_sec))
 
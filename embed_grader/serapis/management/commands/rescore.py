@@ -0,0 +1,84 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from serapis.models import *
+from serapis.utils import submission_helper
+from serapis.utils.grading_scheduler_heartbeat import GradingSchedulerHeartbeat
+from serapis.utils.output_checker import OutputCheckerPool
+
+K_NUM_OUTPUT_CHECKERS = 8
+K_GRADING_SCRIPT_TIMEOUT_SEC = 5 * 60
+
+
+class Command(BaseCommand):
+    help = ('Grade the stored outputs of an assignment again with the current grading scripts, '
+            'without executing the submissions on testbeds')
+
+    def add_arguments(self, parser):
+        parser.add_argument('assignment_id', type=int)
+        parser.add_argument('--assignment-task-ids', type=int, nargs='+',
+                help='Only re-score these assignment tasks (default: all the tasks)')
+        parser.add_argument('--submission-ids', type=int, nargs='+',
+                help='Only re-score these submissions (default: all the submissions)')
+        parser.add_argument('--last-submissions-only', action='store_true',
+                help='Only re-score the last submission of each student')
+        parser.add_argument('--num-output-checkers', type=int, default=K_NUM_OUTPUT_CHECKERS,
+                help='Number of grading scripts which can be executed concurrently')
+        parser.add_argument('--grading-script-timeout', type=float,
+                default=K_GRADING_SCRIPT_TIMEOUT_SEC,
+                help='Wall-clock time limit of a grading script in seconds')
+        parser.add_argument('--warm-grading-workers', action='store_true',
+                help='Execute grading scripts in long-lived python processes')
+
+    def handle(self, *args, **options):
+        try:
+            assignment = Assignment.objects.get(id=options['assignment_id'])
+        except Assignment.DoesNotExist:
+            raise CommandError('Assignment %d does not exist' % options['assignment_id'])
+
+        submission_list = Submission.objects.filter(assignment_fk=assignment)
+        if options['submission_ids']:
+            submission_list = submission_list.filter(id__in=options['submission_ids'])
+        if options['last_submissions_only']:
+            last_submission_ids = {}
+            for sid, student_id in submission_list.values_list('id', 'student_fk'):
+                last_submission_ids[student_id] = max(sid, last_submission_ids.get(student_id, 0))
+            submission_list = submission_list.filter(id__in=last_submission_ids.values())
+
+        task_list = (TaskGradingStatus.objects
+                .filter(submission_fk__in=submission_list)
+                .select_related('submission_fk', 'assignment_task_fk__assignment_fk')
+                .order_by('id'))
+        if options['assignment_task_ids']:
+            task_list = task_list.filter(assignment_task_fk__id__in=options['assignment_task_ids'])
+
+        # The tasks are checked by the output checkers of this command, hence the grading daemon is
+        # not notified. A running grading daemon still finds the tasks when it polls and executes
+        # the same grading scripts again, which wastes time but is consistent, because only the
+        # first result of a task is committed (see OutputCheckerPool._commit()). Better run this
+        # command while the grading daemon is stopped.
+        if GradingSchedulerHeartbeat.is_scheduler_running():
+            self.stderr.write('Warning: the grading daemon is running and may check the same '
+                    'tasks again')
+        task_ids = [t.id for t in task_list
+                if submission_helper.rescore_task_grading_status(t, notify_scheduler=False)]
+        num_skipped_tasks = len(task_list) - len(task_ids)
+        self.stdout.write('Re-score %d task(s), skip %d task(s) without stored outputs' % (
+                len(task_ids), num_skipped_tasks))
+        if not task_ids:
+            return
+
+        output_checker_pool = OutputCheckerPool(
+                num_workers=options['num_output_checkers'],
+                timeout_sec=options['grading_script_timeout'],
+                print_func=self.stdout.write,
+                use_warm_workers=options['warm_grading_workers'],
+        )
+
+        start_time = time.time()
+        for task_id in task_ids:
+            output_checker_pool.submit(task_id)
+        output_checker_pool.wait_until_done()
+
+        self.stdout.write('Done in %.1f seconds' % (time.time() - start_time))
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('serapis', '0006_gradingschedulerfootprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='enable_result_cache',
+            field=models.BooleanField(default=False, verbose_name='Reuse results of identical submissions'),
+        ),
+        migrations.AddField(
+            model_name='taskgradingstatus',
+            name='result_cache_key',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+    ]
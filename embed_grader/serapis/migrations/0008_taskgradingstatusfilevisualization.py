@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('serapis', '0007_result_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskGradingStatusFileVisualization',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('visualizer_version', models.IntegerField()),
+                ('visualizer_id', models.IntegerField()),
+                ('source_file_name', models.CharField(max_length=255)),
+                ('html', models.FileField(upload_to='TaskGradingStatusFileVisualization_html')),
+                ('parse_error', models.TextField(blank=True, default='')),
+                ('generation_time', models.DateTimeField()),
+                ('task_grading_status_file_fk', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='serapis.TaskGradingStatusFile')),
+            ],
+        ),
+    ]
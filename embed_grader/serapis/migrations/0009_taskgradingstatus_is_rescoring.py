@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('serapis', '0008_taskgradingstatusfilevisualization'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskgradingstatus',
+            name='is_rescoring',
+            field=models.BooleanField(default=False),
+        ),
+    ]
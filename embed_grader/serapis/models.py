@@ -5,6 +5,8 @@ from django.contrib.auth.models import User, Group
 from django.db import models
 from django.db import IntegrityError
 from django.db import transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Coalesce
 
 from django.core.validators import MinValueValidator
 
@@ -171,6 +173,11 @@ class Assignment(models.Model):
     testbed_type_fk = models.ForeignKey(TestbedType, null=True, blank=True)
     num_testbeds = models.IntegerField(default=0, null=True, blank=True)
 
+    # reuse the grading result of an identical submission instead of executing it on testbeds
+    # again. Should be disabled if the outputs are not deterministic.
+    enable_result_cache = models.BooleanField(default=False,
+            verbose_name='Reuse results of identical submissions')
+
     def __str__(self):
         return self.name
 
@@ -376,11 +383,9 @@ class Submission(models.Model):
         Return:
           (task_grading_status_list, sum_student_score, sum_total_score)
         """
-        task_grading_status_list = TaskGradingStatus.objects.filter(
-                submission_fk=self).order_by('assignment_task_fk')
-        if not include_hidden:
-            task_grading_status_list = [t for t in task_grading_status_list
-                    if t.assignment_task_fk.mode != AssignmentTask.MODE_HIDDEN]
+        # the assignment tasks are fetched by the same query, as each of them is visited below
+        task_grading_status_list = list(self._get_task_grading_status_queryset(include_hidden)
+                .select_related('assignment_task_fk').order_by('assignment_task_fk'))
 
         sum_student_score = 0.
         sum_total_score = 0.
@@ -391,6 +396,27 @@ class Submission(models.Model):
             sum_student_score += grading_status.points
         return (task_grading_status_list, sum_student_score, sum_total_score)
 
+    def retrieve_score_sum(self, include_hidden):
+        """
+        Same as retrieve_task_grading_status_and_score_sum(), but only the scores are computed, by
+        a single aggregate query.
+
+        Paremeter:
+          - include_hidden: boolean, set true if to include task grading status of hidden test
+                cases.
+        Return:
+          (sum_student_score, sum_total_score)
+        """
+        result = self._get_task_grading_status_queryset(include_hidden).aggregate(
+                sum_student_score=Coalesce(Sum(Case(
+                        When(grading_status=TaskGradingStatus.STAT_FINISH, then=F('points')),
+                        default=Value(0.),
+                        output_field=models.FloatField(),
+                )), Value(0.)),
+                sum_total_score=Coalesce(Sum('assignment_task_fk__points'), Value(0.)),
+        )
+        return (result['sum_student_score'], result['sum_total_score'])
+
     def is_fully_graded(self, include_hidden):
         """
         Paremeter:
@@ -399,9 +425,17 @@ class Submission(models.Model):
         Return:
           True if all tasks are graded (task_grading_status shows okay)
         """
-        (task_grading_status_list, _, _) = self.retrieve_task_grading_status_and_score_sum(
-                include_hidden)
-        return all([t.is_grading_done() for t in task_grading_status_list])
+        return not (self._get_task_grading_status_queryset(include_hidden)
+                .exclude(grading_status__in=[
+                        TaskGradingStatus.STAT_FINISH, TaskGradingStatus.STAT_INTERNAL_ERROR])
+                .exists())
+
+    def _get_task_grading_status_queryset(self, include_hidden):
+        task_grading_status_list = TaskGradingStatus.objects.filter(submission_fk=self)
+        if not include_hidden:
+            task_grading_status_list = task_grading_status_list.exclude(
+                    assignment_task_fk__mode=AssignmentTask.MODE_HIDDEN)
+        return task_grading_status_list
 
 
 class SubmissionFileSchema(models.Model):
@@ -460,6 +494,13 @@ class TaskGradingStatus(models.Model):
     grading_detail = models.FileField(upload_to='TaskGradingStatus_grading_detail',
             null=True, blank=True)
 
+    # hash of everything that determines the grading result, see serapis.utils.result_cache
+    result_cache_key = models.CharField(max_length=64, blank=True, default='', db_index=True)
+
+    # True while the stored outputs are checked again without executing the task, see
+    # serapis.utils.submission_helper.rescore_task_grading_status()
+    is_rescoring = models.BooleanField(default=False)
+
     def is_grading_done(self):
         return self.grading_status in [
                 TaskGradingStatus.STAT_FINISH, TaskGradingStatus.STAT_INTERNAL_ERROR]
@@ -482,6 +523,24 @@ class TaskGradingStatusFile(models.Model):
     file = models.FileField(upload_to='TaskGradingStatusFile_file', null=True, blank=True)
 
 
+class TaskGradingStatusFileVisualization(models.Model):
+    """
+    The rendered visualization of an output file, see serapis.utils.visualization_artifacts
+    """
+    task_grading_status_file_fk = models.OneToOneField(
+            TaskGradingStatusFile, on_delete=models.CASCADE)
+
+    # the artifact is only valid for the same visualizer version, the same visualizer id and the
+    # same stored file (a regraded task stores its outputs in new files)
+    visualizer_version = models.IntegerField()
+    visualizer_id = models.IntegerField()
+    source_file_name = models.CharField(max_length=255)
+
+    html = models.FileField(upload_to='TaskGradingStatusFileVisualization_html')
+    parse_error = models.TextField(blank=True, default='')
+    generation_time = models.DateTimeField()
+
+
 class Testbed(models.Model):
     #STATUS_RESERVED = 0
     STATUS_AVAILABLE = 1
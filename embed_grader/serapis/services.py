@@ -10,6 +10,7 @@ from django.utils import timezone
 from datetime import timedelta
 from serapis.models import *
 from serapis.forms.service_forms import *
+from serapis.utils.grading_scheduler_wakeup import GradingSchedulerWakeup
 
 from ipware.ip import get_ip
 
@@ -104,6 +105,11 @@ def testbed_show_summary_report(request):
         testbed.status = Testbed.STATUS_OFFLINE
         
     testbed.save()
+
+    # an idle testbed can take the next task right away
+    if testbed.status == Testbed.STATUS_AVAILABLE:
+        GradingSchedulerWakeup.notify()
+
     return HttpResponse("Gotcha!")
 
 
@@ -133,6 +139,7 @@ def testbed_show_status_report(request):
         testbed.status = Testbed.STATUS_AVAILABLE
         testbed.report_time = timezone.now()
         testbed.save()
+        GradingSchedulerWakeup.notify()
     elif status == 'TESTING':
         testbed.report_status = Testbed.STATUS_BUSY
         testbed.status = Testbed.STATUS_BUSY
@@ -0,0 +1,30 @@
+// A plain text visualizer only shows the beginning and the end of a large file. "Load more" fetches
+// the next page of the hidden part and appends it to the beginning, until the gap is closed.
+$(document).on("click", ".plain-text-load-more", function() {
+  var button = $(this);
+  var visualizer = button.closest(".plain-text-visualizer");
+  var gap = visualizer.find(".plain-text-gap");
+  var head = visualizer.find(".plain-text-head");
+
+  button.prop("disabled", true);
+  $.getJSON(visualizer.data("url"), {
+    "offset": gap.data("start"),
+    "end": gap.data("end"),
+  }, function(page) {
+    head.append(document.createTextNode(page.content));
+    if (page.end >= gap.data("end")) {
+      // the gap is closed, the head and the tail become one piece of text
+      var tail = visualizer.find(".plain-text-tail");
+      head.append(document.createTextNode(tail.text()));
+      head.css("margin-bottom", "");
+      tail.remove();
+      gap.remove();
+      return;
+    }
+    gap.data("start", page.end);
+    gap.find(".plain-text-gap-size").text(gap.data("end") - page.end);
+    button.prop("disabled", false);
+  }).fail(function() {
+    button.prop("disabled", false);
+  });
+});
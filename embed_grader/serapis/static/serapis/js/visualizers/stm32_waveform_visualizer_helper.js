@@ -1,12 +1,13 @@
 function draw_stm32_waveform_series(series_data) {
 
-  timestamps = series_data.timestamps;
-  values = series_data.values;
+  decoded_series = decode_waveform_series(series_data);
+  timestamps = decoded_series.timestamps;
+  values = decoded_series.values;
   label = series_data.label;
   div_id = series_data.id;
 
   waveform_data = [];
-  for (var i = 0; i < series_data.timestamps.length; i++) {
+  for (var i = 0; i < timestamps.length; i++) {
     waveform_data.push({
       "ms": timestamps[i],
       "value": values[i],
@@ -17,7 +18,7 @@ function draw_stm32_waveform_series(series_data) {
   gid = "g_" + div_id;
 
   //charts[cid] = AmCharts.makeChart(div_id, {
-  AmCharts.makeChart(div_id, {
+  var chart = AmCharts.makeChart(div_id, {
     "type": "xy",
     "titles": [{"text": label}],
     "theme": "light",
@@ -54,8 +55,64 @@ function draw_stm32_waveform_series(series_data) {
     }
   });
 
+  if (series_data.window_url) {
+    listen_stm32_waveform_zoom(chart, series_data);
+  }
+
   //function zoomChart() {
   //  charts[cid].zoomToIndexes(0, 20);
   //}
   //charts[cid].addListener("dataUpdated", zoomChart);
 }
+
+// The page only ships a downsampled overview of the waveform. When the user zooms in, fetch the
+// details of the visible window and splice them into the overview.
+function listen_stm32_waveform_zoom(chart, series_data) {
+  var overview_data = chart.dataProvider;
+  var fetched_start = null;
+  var fetched_end = null;
+  var pending_timer = null;
+
+  chart.valueAxes[1].addListener("axisZoomed", function(event) {
+    var start = event.startValue;
+    var end = event.endValue;
+    if (start == fetched_start && end == fetched_end) {
+      return;
+    }
+
+    // wait until the user stops dragging
+    clearTimeout(pending_timer);
+    pending_timer = setTimeout(function() {
+      $.getJSON(series_data.window_url, {
+        "plot_idx": series_data.plot_idx,
+        "start": start,
+        "end": end,
+        "num_pixels": Math.ceil($("#" + series_data.id).width()),
+        "encoding": "base64",
+      }, function(window_series_data) {
+        var window_data = decode_waveform_series(window_series_data);
+        var waveform_data = [];
+        for (var i = 0; i < overview_data.length && overview_data[i].ms < start; i++) {
+          waveform_data.push(overview_data[i]);
+        }
+        for (var i = 0; i < window_data.timestamps.length; i++) {
+          waveform_data.push({
+            "ms": window_data.timestamps[i],
+            "value": window_data.values[i],
+          });
+        }
+        for (var i = 0; i < overview_data.length; i++) {
+          if (overview_data[i].ms > end) {
+            waveform_data.push(overview_data[i]);
+          }
+        }
+
+        fetched_start = start;
+        fetched_end = end;
+        chart.dataProvider = waveform_data;
+        chart.validateData();
+        chart.valueAxes[1].zoomToValues(start, end);
+      });
+    }, 300);
+  });
+}
@@ -0,0 +1,27 @@
+// Decode a typed array encoded by serapis/utils/visualizers/typed_array_encoding.py
+function decode_waveform_typed_array(encoded) {
+  var binary = atob(encoded.data);
+  var bytes = new Uint8Array(binary.length);
+  for (var i = 0; i < binary.length; i++) {
+    bytes[i] = binary.charCodeAt(i);
+  }
+
+  if (encoded.type == "Uint32Array") {
+    return new Uint32Array(bytes.buffer);
+  }
+  return new Float64Array(bytes.buffer);
+}
+
+// Return the timestamps and the values of a plot, which are either typed arrays or plain lists
+function decode_waveform_series(series_data) {
+  if (series_data.encoding == "base64") {
+    return {
+      "timestamps": decode_waveform_typed_array(series_data.timestamps),
+      "values": decode_waveform_typed_array(series_data.values),
+    };
+  }
+  return {
+    "timestamps": series_data.timestamps,
+    "values": series_data.values,
+  };
+}
@@ -188,8 +188,7 @@ class RenderSubmissionTableRow:
         return '&nbsp;'.join(htmls)
 
     def _get_content_score(self):
-        (_, student_score, total_score) = (
-                self.submission.retrieve_task_grading_status_and_score_sum(self.include_hidden))
+        (student_score, total_score) = self.submission.retrieve_score_sum(self.include_hidden)
         return show_score(student_score, total_score)
 
     def _get_content_submission_time(self):
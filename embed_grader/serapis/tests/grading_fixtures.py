@@ -0,0 +1,96 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from serapis.models import *
+from serapis.utils import submission_helper
+
+"""
+Helpers which build the records of a graded assignment for the grading pipeline tests.
+"""
+
+
+def create_assignment(testbed_type=None, enable_result_cache=False, task_points=None,
+        task_modes=None):
+    """
+    Create a course with an assignment, which has one assignment task per element of task_points.
+
+    Returns:
+      (assignment, assignment_task_list)
+    """
+    now = timezone.now()
+    course = Course.objects.create(course_code='CS1', name='Course', year=2018,
+            quarter=Course.QUARTER_FALL)
+    assignment = Assignment.objects.create(
+            course_fk=course,
+            name='Assignment',
+            release_time=now - datetime.timedelta(days=1),
+            deadline=now + datetime.timedelta(days=1),
+            max_num_team_members=1,
+            max_num_submissions=Assignment.SUBMISSION_LIMIT_INFINITE,
+            testbed_type_fk=testbed_type,
+            enable_result_cache=enable_result_cache,
+    )
+
+    task_points = task_points or [10.]
+    task_modes = task_modes or [AssignmentTask.MODE_PUBLIC] * len(task_points)
+    assignment_task_list = []
+    for i, (points, mode) in enumerate(zip(task_points, task_modes)):
+        assignment_task = AssignmentTask(assignment_fk=assignment, brief_description='task%d' % i,
+                mode=mode, points=points, execution_duration=5.)
+        assignment_task.grading_script.save('grading%d.py' % i, ContentFile(b''), save=False)
+        assignment_task.save()
+        assignment_task_list.append(assignment_task)
+    return (assignment, assignment_task_list)
+
+def create_submission(assignment, username='student', create_tasks=True):
+    """
+    Create a submission of a new student, and a task grading status per assignment task.
+
+    Returns:
+      (submission, task_grading_status_list)
+    """
+    user = User.objects.create_user(username=username, password='password')
+    team = Team.objects.create(assignment_fk=assignment, passcode='team-%s' % username)
+    TeamMember.objects.create(assignment_fk=assignment, team_fk=team, user_fk=user,
+            is_leader=True)
+    submission = Submission.objects.create(
+            student_fk=user,
+            team_fk=team,
+            assignment_fk=assignment,
+            submission_time=timezone.now(),
+            grading_result=0.,
+            task_scope=AssignmentTask.MODE_HIDDEN,
+            num_graded_tasks=0,
+            num_total_tasks=0,
+    )
+
+    task_grading_status_list = []
+    if create_tasks:
+        for assignment_task in AssignmentTask.objects.filter(assignment_fk=assignment):
+            task_grading_status_list.append(submission_helper.create_task_grading_status(
+                    submission, assignment_task))
+    return (submission, task_grading_status_list)
+
+def create_testbed(testbed_type, ip_address, status=Testbed.STATUS_AVAILABLE, report_time=None,
+        grading_deadline=None):
+    now = timezone.now()
+    return Testbed.objects.create(
+            testbed_type_fk=testbed_type,
+            ip_address=ip_address,
+            grading_deadline=grading_deadline or now,
+            status=status,
+            report_time=report_time or now,
+            report_status=Testbed.STATUS_AVAILABLE,
+            secret_code='secret',
+    )
+
+def set_task_state(task_grading_status, grading_status, **kwargs):
+    """
+    Move a task to another state, keeping the counters of its submission consistent.
+    """
+    submission_helper.update_task_grading_status(task_grading_status, grading_status, **kwargs)
+    task_grading_status.refresh_from_db()
+    return task_grading_status
@@ -0,0 +1,70 @@
+from django.test import TestCase
+
+from serapis.utils.visualizers.fileio.binary_waveform_file_reader import BinaryWaveformFileReader
+from serapis.utils.visualizers.fileio.binary_waveform_file_writer import BinaryWaveformFileWriter
+
+class BinaryWaveformFileReaderTestCase(TestCase):
+
+    def _get_good_content(self):
+        output_path = '/tmp/BinaryWaveformFileReaderTestCase_good_8mfq2nb6xzo1ta0c'
+        writer = BinaryWaveformFileWriter(output_path)
+        writer.set_period_sec(2)
+        writer.add_display_param('CTL', 0)
+        writer.set_waveform([(0.5, 1), (1.5, 0)])
+        writer.marshal()
+        with open(output_path, 'rb') as f:
+            return f.read()
+
+    def test_empty_content_should_fail(self):
+        reader = BinaryWaveformFileReader(b'')
+        self.assertEqual(reader.is_successfully_parsed(), False)
+        self.assertEqual(reader.get_error_code(), BinaryWaveformFileReader.ERROR_CODE_EMPTY_FILE)
+        with self.assertRaises(Exception):
+            reader.get_period_sec()
+        with self.assertRaises(Exception):
+            reader.get_num_display_plots()
+        with self.assertRaises(Exception):
+            reader.get_event_series(0)
+
+    def test_text_content_should_fail(self):
+        content = "\n".join([
+            'Period: 1',
+            'Display start',
+            'CTL,0',
+            'Display end',
+            '==',
+            '0.000000000000000, 0',
+        ])
+        reader = BinaryWaveformFileReader(content.encode())
+        self.assertEqual(reader.is_successfully_parsed(), False)
+        self.assertEqual(reader.get_error_code(), BinaryWaveformFileReader.ERROR_CODE_FORMAT)
+
+    def test_truncated_content_should_fail(self):
+        content = self._get_good_content()
+        reader = BinaryWaveformFileReader(content[:-1])
+        self.assertEqual(reader.is_successfully_parsed(), False)
+        self.assertEqual(reader.get_error_code(), BinaryWaveformFileReader.ERROR_CODE_FORMAT)
+
+    def test_good_example(self):
+        reader = BinaryWaveformFileReader(self._get_good_content())
+        self.assertEqual(reader.is_successfully_parsed(), True)
+        self.assertEqual(reader.get_error_code(), None)
+        self.assertEqual(reader.get_period_sec(), 2.0)
+        self.assertEqual(reader.get_num_display_plots(), 1)
+        self.assertEqual(reader.get_event_series(0), (
+            'CTL',
+            [
+                (0.0, 0),
+                (0.5, 1),
+                (1.5, 0),
+                (2.0, 0),
+            ],
+        ))
+        self.assertEqual(reader.get_event_series(0, 1.0, 1.8), (
+            'CTL',
+            [
+                (1.0, 1),
+                (1.5, 0),
+                (1.8, 0),
+            ],
+        ))
@@ -0,0 +1,87 @@
+from django.test import TestCase
+
+from serapis.utils.visualizers.fileio.binary_waveform_file_writer import BinaryWaveformFileWriter
+from serapis.utils.visualizers.fileio.binary_waveform_file_writer import convert_stm32_waveform_file
+from serapis.utils.visualizers.fileio.binary_waveform_file_reader import BinaryWaveformFileReader
+
+class BinaryWaveformFileWriterTestCase(TestCase):
+ 
+    def test_case(self):
+        # Simulate a user tries to marshal the output whenever one thing is configured. Expect
+        # exceptions except the last step.
+
+        output_path = '/tmp/BinaryWaveformFileWriterTestCase_case_7c2mqkd0vbx1fz9hyw4tpl'
+
+        writer = BinaryWaveformFileWriter(output_path)
+
+        # add period
+        writer.set_period_sec(1)
+        with self.assertRaises(Exception):
+            writer.marshal()
+
+        # add display params
+        writer.add_display_param('CTL', 0)
+        writer.add_display_param('VAL', [3, 1])
+
+        # add data
+        writer.add_event(0.633994500, 1)
+        writer.add_event(0.673993125, 0)
+        writer.add_event(0.736037562, 8)
+
+        writer.marshal()
+
+        reader = BinaryWaveformFileReader.from_file(output_path)
+        self.assertEqual(reader.is_successfully_parsed(), True)
+        self.assertEqual(reader.get_period_sec(), 1.0)
+        self.assertEqual(reader.get_tick_frequency(), None)
+        self.assertEqual(reader.get_num_display_plots(), 2)
+        self.assertEqual(reader.get_event_series(0), (
+            'CTL',
+            [
+                (0.0, 0),
+                (0.6339945, 1),
+                (0.673993125, 0),
+                (1.0, 0),
+            ],
+        ))
+        self.assertEqual(reader.get_event_series(1), (
+            'VAL',
+            [
+                (0.0, 0),
+                (0.736037562, 2),
+                (1.0, 2),
+            ],
+        ))
+
+    def test_convert_stm32_waveform_file(self):
+        input_path = '/tmp/BinaryWaveformFileWriterTestCase_stm32_input_q8d1nzx0wjv3kf2'
+        output_path = '/tmp/BinaryWaveformFileWriterTestCase_stm32_output_0ahg3mv8rkwl1ce'
+        with open(input_path, 'w') as fo:
+            fo.write("\n".join([
+                'Period: 20',
+                'Tick frequency: 5000',
+                'Display start',
+                'CTL,0',
+                'VAL,2,1',
+                'Display end',
+                '==',
+                '68, 0, 0',
+                '68, 30000, 3',
+                '68, 70000, 4',
+            ]))
+
+        convert_stm32_waveform_file(input_path, output_path)
+
+        reader = BinaryWaveformFileReader.from_file(output_path)
+        self.assertEqual(reader.is_successfully_parsed(), True)
+        self.assertEqual(reader.get_period_ms(), 20000.)
+        self.assertEqual(reader.get_tick_frequency(), 5000.)
+        self.assertEqual(reader.get_event_series(1), (
+            'VAL',
+            [
+                (0.0, 0),
+                (6.0, 1),
+                (14.0, 2),
+                (20.0, 2),
+            ],
+        ))
@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.test import TransactionTestCase
+
+from serapis.utils.grading_scheduler_wakeup import GradingSchedulerWakeup
+
+
+class GradingSchedulerWakeupTestCase(TransactionTestCase):
+    """
+    The tests run on a database without LISTEN/NOTIFY, hence only the process-local path is
+    covered. TransactionTestCase is used so that on_commit() callbacks are executed.
+    """
+
+    def setUp(self):
+        # drain the notifications left by other tests
+        GradingSchedulerWakeup().wait(0.)
+
+    def test_wait_times_out_without_notification(self):
+        self.assertFalse(GradingSchedulerWakeup().wait(0.01))
+
+    def test_notify_wakes_up_waiter(self):
+        wakeup = GradingSchedulerWakeup()
+        GradingSchedulerWakeup.notify()
+        self.assertTrue(wakeup.wait(1.))
+
+        # the notification is consumed
+        self.assertFalse(wakeup.wait(0.01))
+
+    def test_notify_is_deferred_until_commit(self):
+        wakeup = GradingSchedulerWakeup()
+        with transaction.atomic():
+            GradingSchedulerWakeup.notify()
+            self.assertFalse(wakeup.wait(0.01))
+        self.assertTrue(wakeup.wait(1.))
+
+    def test_notify_is_dropped_on_rollback(self):
+        wakeup = GradingSchedulerWakeup()
+        try:
+            with transaction.atomic():
+                GradingSchedulerWakeup.notify()
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertFalse(wakeup.wait(0.01))
+
+    def test_scheduler_polls_without_listen_notify(self):
+        self.assertFalse(GradingSchedulerWakeup.can_wake_up_other_processes())
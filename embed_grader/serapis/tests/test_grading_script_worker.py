@@ -0,0 +1,121 @@
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from serapis.utils.grading_script_worker import GradingScriptWorker
+from serapis.utils.grading_script_worker import GradingScriptWorkerError
+
+
+K_SCRIPTS = {
+    'result.py': '\n'.join([
+        'import sys, json',
+        'print(json.dumps({"score": 0.5, "detail": " ".join(sys.argv[1:])}))',
+    ]),
+    'no_newline.py': 'import sys; sys.stdout.write("partial")',
+    'exit.py': 'import sys; print("before"); sys.exit(1); print("after")',
+    'crash.py': 'print("before"); raise RuntimeError("crash")',
+    'fd_level.py': '\n'.join([
+        'import os, sys, subprocess',
+        'print("print")',
+        'sys.stdout.flush()',
+        'os.write(1, b"fd\\n")',
+        'sys.__stdout__.write("dunder\\n")',
+        'sys.__stdout__.flush()',
+        'subprocess.check_call([sys.executable, "-c", "print(\'child\')"])',
+        'sys.stdout = open(os.devnull, "w")',
+        'print("hidden")',
+    ]),
+    'close_stdout.py': 'import sys; print("closed"); sys.stdout.close()',
+    'pollute.py': '\n'.join([
+        'import os, sys',
+        'import helper_module',
+        'os.chdir("/")',
+        'os.environ["SERAPIS_TEST_VARIABLE"] = "1"',
+        'sys.path.append("/nowhere")',
+        'print("polluted")',
+    ]),
+    'state.py': '\n'.join([
+        'import os, sys, json',
+        'print(json.dumps([os.getcwd(), os.environ.get("SERAPIS_TEST_VARIABLE"),',
+        '        "helper_module" in sys.modules, "/nowhere" in sys.path]))',
+    ]),
+    'helper_module.py': 'x = 1',
+    'sleep.py': 'import time; time.sleep(10)',
+    'os_exit.py': 'import os; print("bye"); os._exit(0)',
+    'pid.py': 'import os; print(os.getpid())',
+}
+
+
+class GradingScriptWorkerTestCase(SimpleTestCase):
+    """
+    The output of a warm worker is compared against running the same grading script in a new
+    python process, i.e., the cold path of the output checker.
+    """
+
+    def setUp(self):
+        self.script_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.script_dir)
+        for name, source in K_SCRIPTS.items():
+            with open(os.path.join(self.script_dir, name), 'w') as f:
+                f.write(source + '\n')
+
+        self.worker = GradingScriptWorker(working_dir=settings.BASE_DIR)
+        self.addCleanup(self.worker.close)
+
+    def _path(self, name):
+        return os.path.join(self.script_dir, name)
+
+    def _run_cold(self, name, args):
+        proc = subprocess.Popen([sys.executable, self._path(name)] + args,
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, cwd=settings.BASE_DIR)
+        stdout, _ = proc.communicate(timeout=10.)
+        return stdout
+
+    def _run_warm(self, name, args=[]):
+        return self.worker.run(self._path(name), args, 10.)
+
+    def test_output_equals_new_process(self):
+        for name, args in [('result.py', ['a:/x', 'b:/y']), ('no_newline.py', []),
+                ('exit.py', []), ('crash.py', []), ('fd_level.py', []),
+                ('close_stdout.py', [])]:
+            self.assertEqual(self._run_warm(name, args), self._run_cold(name, args), name)
+
+        # the protocol is intact after the grading scripts above
+        self.assertEqual(self._run_warm('result.py', ['c']),
+                b'{"score": 0.5, "detail": "c"}\n')
+
+    def test_fd_level_writes_are_captured(self):
+        self.assertEqual(self._run_warm('fd_level.py'), b'print\nfd\ndunder\nchild\n')
+
+    def test_state_is_restored(self):
+        expected_state = self._run_warm('state.py')
+        self.assertEqual(self._run_warm('pollute.py'), b'polluted\n')
+        self.assertEqual(self._run_warm('state.py'), expected_state)
+        self.assertEqual(expected_state, self._run_cold('state.py', []))
+
+    def test_timeout_respawns_worker(self):
+        pid = int(self._run_warm('pid.py'))
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.worker.run(self._path('sleep.py'), [], 0.5)
+        self.assertIsNone(self.worker.proc)
+
+        new_pid = int(self._run_warm('pid.py'))
+        self.assertNotEqual(new_pid, pid)
+        self.assertEqual(int(self._run_warm('pid.py')), new_pid)
+
+    def test_os_exit_is_worker_error(self):
+        with self.assertRaises(GradingScriptWorkerError):
+            self._run_warm('os_exit.py')
+        self.assertEqual(self._run_warm('no_newline.py'), b'partial')
+
+    def test_worker_is_recycled(self):
+        self.worker.max_num_runs = 2
+        pid_list = [int(self._run_warm('pid.py')) for _ in range(5)]
+        self.assertEqual(pid_list[0], pid_list[1])
+        self.assertEqual(pid_list[2], pid_list[3])
+        self.assertEqual(len(set(pid_list)), 3)
@@ -1,5 +1,8 @@
+import io
+
 from django.test import TestCase
 
+from serapis.utils.visualizers.fileio import waveform_cache
 from serapis.utils.visualizers.fileio.logic_saleae_waveform_file_reader import LogicSaleaeWaveformFileReader
 
 
@@ -103,3 +106,161 @@ class LogicSaleaeWaveformFileReaderTestCase(TestCase):
                 (1.0, 1),
             ],
         ))
+
+    def test_windows_line_endings_and_wide_hex_values(self):
+        content = "\r\n".join([
+            'Period: 1',
+            'Display start',
+            'HIGH,35,34',
+            'Display end',
+            '==',
+            'Time[s], Data[Hex]',
+            '0.000000000000000, 0',
+            '0.250000000000000,  C00000000',
+            '0.500000000000000, 400000000 ',
+            '0.750000000000000, 3ffffffff',
+        ])
+        reader = LogicSaleaeWaveformFileReader(content.encode())
+        self.assertEqual(reader.is_successfully_parsed(), True)
+        self.assertEqual(reader.get_event_series(0), (
+            'HIGH',
+            [
+                (0.0, 0),
+                (0.25, 3),
+                (0.5, 1),
+                (0.75, 0),
+                (1.0, 0),
+            ],
+        ))
+
+    def test_malformed_hex_value_should_fail(self):
+        content = "\n".join([
+            'Period: 1',
+            'Display start',
+            'CTL,0',
+            'Display end',
+            '==',
+            'Time[s], Data[Hex]',
+            '0.000000000000000, 0',
+            '0.633994500000000, 1 1',
+        ])
+        reader = LogicSaleaeWaveformFileReader(content.encode())
+        self.assertEqual(reader.is_successfully_parsed(), False)
+        self.assertEqual(reader.get_error_code(), LogicSaleaeWaveformFileReader.ERROR_CODE_FORMAT)
+
+    def test_negative_hex_values(self):
+        # negative bus values read as two's complement, i.e., -1 sets all the pins
+        content = "\n".join([
+            'Period: 1',
+            'Display start',
+            'VAL,1,0',
+            'HIGH,63',
+            'Display end',
+            '==',
+            'Time[s], Data[Hex]',
+            '0.000000000000000, 0',
+            '0.250000000000000, -1',
+            '0.500000000000000, -2',
+        ])
+        reader = LogicSaleaeWaveformFileReader(content.encode())
+        self.assertEqual(reader.is_successfully_parsed(), True)
+        self.assertEqual(reader.get_event_series(0), (
+            'VAL',
+            [(0.0, 0), (0.25, 3), (0.5, 2), (1.0, 2)],
+        ))
+        self.assertEqual(reader.get_event_series(1), (
+            'HIGH',
+            [(0.0, 0), (0.25, 1), (1.0, 1)],
+        ))
+
+    def test_from_file_in_small_chunks(self):
+        content = "\n".join([
+            'Period: 1',
+            'Display start',
+            'CTL,0',
+            'VAL,3,1',
+            'Display end',
+            '==',
+            'Time[s], Data[Hex]',
+            '-0.100000000000000, 1',
+            '0.250000000000000, 0',
+            '0.500000000000000, A',
+            '0.500000000000000, 8',
+            '0.750000000000000, 1',
+            '1.500000000000000, 0',
+            '',
+        ]).encode()
+        expected_reader = LogicSaleaeWaveformFileReader(content)
+
+        reader = LogicSaleaeWaveformFileReader.from_file(io.BytesIO(content), chunk_size=16)
+        self.assertEqual(reader.is_successfully_parsed(), True)
+        self.assertEqual(reader.get_period_sec(), 1.0)
+        self.assertEqual(reader.get_num_display_plots(), 2)
+        self.assertEqual(reader.data, expected_reader.data)
+        self.assertEqual(reader.get_event_series(1), expected_reader.get_event_series(1))
+
+        reader = LogicSaleaeWaveformFileReader.from_file(
+                io.BytesIO(content), load_waveform=False, chunk_size=16)
+        self.assertEqual(reader.is_successfully_parsed(), True)
+        events = []
+        for chunk in reader.iter_waveform_chunks():
+            events.extend(chunk)
+        self.assertEqual(events, list(expected_reader.data))
+
+    def test_from_file_with_cache_key(self):
+        content = "\n".join([
+            'Period: 1',
+            'Display start',
+            'CTL,0',
+            'Display end',
+            '==',
+            'Time[s], Data[Hex]',
+            '0.000000000000000, 0',
+            '0.633994500000000, 1',
+        ]).encode()
+        waveform_cache.get_waveform_cache().clear()
+        f = io.BytesIO(content)
+        cache_key = waveform_cache.WaveformCache.compute_file_key('logicsaleae', f)
+        self.assertEqual(cache_key,
+                waveform_cache.WaveformCache.compute_key('logicsaleae', content))
+        self.assertEqual(f.tell(), 0)
+
+        reader = LogicSaleaeWaveformFileReader.from_file(f, cache_key=cache_key)
+        self.assertEqual(reader.cache_key, cache_key)
+        expected_data = reader.data
+
+        # the file is not read again once the waveform is cached, and the readers of the raw
+        # content share the same entry
+        f = io.BytesIO(b'')
+        reader = LogicSaleaeWaveformFileReader.from_file(f, cache_key=cache_key)
+        self.assertEqual(reader.is_successfully_parsed(), True)
+        self.assertEqual(reader.get_num_display_plots(), 1)
+        self.assertEqual(reader.data, expected_data)
+        self.assertEqual(f.tell(), 0)
+        self.assertEqual(LogicSaleaeWaveformFileReader(content).cache_key, cache_key)
+
+    def test_from_file_with_bad_content_should_fail(self):
+        content = "\n".join([
+            'Period: 1',
+            'Display start',
+            'CTL,0',
+            'Display end',
+            '==',
+            'Time[s], Data[Hex]',
+            '0.000000000000000, 0',
+            '',
+            '0.633994500000000, 1',
+        ]).encode()
+        reader = LogicSaleaeWaveformFileReader.from_file(io.BytesIO(content), chunk_size=16)
+        self.assertEqual(reader.is_successfully_parsed(), False)
+        self.assertEqual(reader.get_error_code(), LogicSaleaeWaveformFileReader.ERROR_CODE_FORMAT)
+
+        reader = LogicSaleaeWaveformFileReader.from_file(io.BytesIO(b''))
+        self.assertEqual(reader.get_error_code(),
+                LogicSaleaeWaveformFileReader.ERROR_CODE_EMPTY_FILE)
+
+        # non-ascii bytes in a later chunk
+        reader = LogicSaleaeWaveformFileReader.from_file(
+                io.BytesIO(content.replace(b'0.633994500000000', b'0.6339945\xff')), chunk_size=16)
+        self.assertEqual(reader.get_error_code(),
+                LogicSaleaeWaveformFileReader.ERROR_CODE_NON_ASCII)
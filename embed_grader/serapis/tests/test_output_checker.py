@@ -0,0 +1,164 @@
+import sys
+import subprocess
+from unittest import mock
+
+from django.test import TestCase
+
+from serapis.models import *
+from serapis.tests import grading_fixtures
+from serapis.utils.grading_script_worker import GradingScriptWorkerError
+from serapis.utils.output_checker import GradingResultError
+from serapis.utils.output_checker import OutputCheckerPool
+from serapis.utils.output_checker import run_grading_script
+
+
+class OutputCheckerPoolTestCase(TestCase):
+    """
+    The pool is created without worker threads, and the tasks are checked by calling
+    _check_output() directly.
+    """
+
+    def setUp(self):
+        self.assignment, _ = grading_fixtures.create_assignment(task_points=[10., 20.])
+        self.submission, self.task_list = grading_fixtures.create_submission(self.assignment)
+        for task in self.task_list:
+            grading_fixtures.set_task_state(task, TaskGradingStatus.STAT_OUTPUT_TO_BE_CHECKED,
+                    execution_status=TaskGradingStatus.EXEC_OK)
+        self.pool = OutputCheckerPool(num_workers=0, timeout_sec=1., print_func=lambda s: None)
+
+    def _check_output(self, task, side_effect):
+        with mock.patch('serapis.utils.output_checker.run_grading_script',
+                side_effect=side_effect):
+            self.pool._check_output(task.id, None)
+        task.refresh_from_db()
+        self.submission.refresh_from_db()
+
+    def test_finish(self):
+        self._check_output(self.task_list[0], [(0.5, 'half')])
+        self.assertEqual(self.task_list[0].grading_status, TaskGradingStatus.STAT_FINISH)
+        self.assertEqual(self.task_list[0].points, 5.)
+        self.assertEqual(self.submission.num_graded_tasks, 1)
+        self.assertEqual(self.submission.status, Submission.STAT_RECEIVED)
+
+        self._check_output(self.task_list[1], [(1., 'full')])
+        self.assertEqual(self.submission.num_graded_tasks, 2)
+        self.assertEqual(self.submission.status, Submission.STAT_GRADED)
+
+    def test_result_is_remembered_outside_commit_lock(self):
+        def remember_result(grading_task):
+            self.assertFalse(self.pool.commit_lock.locked())
+            self.assertEqual(grading_task.grading_status, TaskGradingStatus.STAT_FINISH)
+
+        with mock.patch('serapis.utils.output_checker.result_cache.remember_result',
+                side_effect=remember_result) as remember:
+            self._check_output(self.task_list[0], [(0.5, 'half')])
+        self.assertEqual(remember.call_count, 1)
+
+    def test_timeout_is_internal_error(self):
+        self._check_output(self.task_list[0], subprocess.TimeoutExpired('grading.py', 1.))
+        self.assertEqual(self.task_list[0].grading_status, TaskGradingStatus.STAT_INTERNAL_ERROR)
+        self.assertEqual(self.task_list[0].points, 0.)
+        self.assertEqual(self.submission.num_graded_tasks, 1)
+
+        self.task_list[0].grading_detail.open('rb')
+        try:
+            self.assertIn(b'time limit', self.task_list[0].grading_detail.read())
+        finally:
+            self.task_list[0].grading_detail.close()
+
+    def test_malformed_output_is_sent_back(self):
+        self._check_output(self.task_list[0], ValueError('not a JSON object'))
+        self.assertEqual(self.task_list[0].grading_status, TaskGradingStatus.STAT_PENDING)
+        self.assertEqual(self.submission.num_graded_tasks, 0)
+
+    def test_invalid_result_is_internal_error(self):
+        self._check_output(self.task_list[0], GradingResultError('no score'))
+        self.assertEqual(self.task_list[0].grading_status, TaskGradingStatus.STAT_INTERNAL_ERROR)
+        self.assertEqual(self.submission.num_graded_tasks, 1)
+
+        self.task_list[0].grading_detail.open('rb')
+        try:
+            self.assertIn(b'no score', self.task_list[0].grading_detail.read())
+        finally:
+            self.task_list[0].grading_detail.close()
+
+    def test_worker_error_is_internal_error(self):
+        self._check_output(self.task_list[0], GradingScriptWorkerError('exited unexpectedly'))
+        self.assertEqual(self.task_list[0].grading_status, TaskGradingStatus.STAT_INTERNAL_ERROR)
+        self.assertEqual(self.submission.num_graded_tasks, 1)
+
+        self.task_list[0].grading_detail.open('rb')
+        try:
+            self.assertIn(b'exited unexpectedly', self.task_list[0].grading_detail.read())
+        finally:
+            self.task_list[0].grading_detail.close()
+
+    def test_result_of_regraded_task_is_dropped(self):
+        task = self.task_list[0]
+
+        def regrade_while_running(grading_task, timeout_sec, warm_worker):
+            grading_fixtures.set_task_state(TaskGradingStatus.objects.get(id=task.id),
+                    TaskGradingStatus.STAT_PENDING)
+            return (1., 'full')
+
+        self._check_output(task, regrade_while_running)
+        self.assertEqual(task.grading_status, TaskGradingStatus.STAT_PENDING)
+        self.assertEqual(task.points, 0.)
+        self.assertEqual(self.submission.num_graded_tasks, 0)
+
+    def test_commit_drops_result_of_task_not_waiting(self):
+        task = grading_fixtures.set_task_state(self.task_list[0], TaskGradingStatus.STAT_FINISH,
+                points=3.)
+        self.assertFalse(self.pool._commit(task.id, TaskGradingStatus.STAT_FINISH, 10., None, None))
+
+        task.refresh_from_db()
+        self.submission.refresh_from_db()
+        self.assertEqual(task.points, 3.)
+        self.assertEqual(self.submission.num_graded_tasks, 1)
+
+    def test_work_closes_connections_around_each_task(self):
+        calls = []
+        task_id = self.task_list[0].id
+        self.pool.submit(task_id)
+        with mock.patch('serapis.utils.output_checker.close_old_connections',
+                side_effect=lambda: calls.append('close')), \
+                mock.patch.object(self.pool, '_check_output',
+                        side_effect=lambda task_id, warm_worker: calls.append(task_id)), \
+                mock.patch.object(self.pool.task_queue, 'get',
+                        side_effect=[task_id, _StopWorker()]):
+            with self.assertRaises(_StopWorker):
+                self.pool._work()
+        self.assertEqual(calls, ['close', task_id, 'close'])
+        self.assertEqual(self.pool.get_num_unfinished_tasks(), 0)
+
+
+class _StopWorker(Exception):
+    """
+    Raised by the queue to leave the worker loop, which never returns otherwise
+    """
+    pass
+
+
+class RunGradingScriptTestCase(TestCase):
+
+    def _run(self, output):
+        cmd = [sys.executable, '-c', 'import sys; sys.stdout.write(%r)' % output]
+        with mock.patch('serapis.utils.output_checker.get_grading_script_command',
+                return_value=cmd):
+            return run_grading_script(None, timeout_sec=10.)
+
+    def test_result(self):
+        self.assertEqual(self._run('{"score": 0.5, "detail": "half"}'), (0.5, 'half'))
+        self.assertEqual(self._run('{"score": "2", "detail": ""}'), (1., ''))
+
+    def test_malformed_output(self):
+        with self.assertRaises(ValueError):
+            self._run('Traceback (most recent call last):')
+        with self.assertRaises(ValueError):
+            self._run('')
+
+    def test_invalid_result(self):
+        for output in ['{"detail": "no score"}', '{"score": 1}', '{"score": "x", "detail": ""}',
+                '{"score": null, "detail": ""}', '{"score": 1, "detail": 3}', '[1, 2]', '1']:
+            with self.assertRaises(GradingResultError):
+                self._run(output)
@@ -0,0 +1,51 @@
+import io
+
+from django.test import TestCase
+
+from serapis.utils.visualizers import plain_text_visualizer
+from serapis.utils.visualizers.plain_text_visualizer import read_text_page
+
+
+class PlainTextVisualizerTestCase(TestCase):
+
+    def test_read_text_page_aligns_to_lines(self):
+        f = io.BytesIO(b'line 0\nline 1\nline 2\n')
+
+        page = read_text_page(f, 0, length=10)
+        self.assertEqual(page['content'], 'line 0\n')
+        self.assertEqual((page['start'], page['end'], page['file_size']), (0, 7, 21))
+
+        page = read_text_page(f, page['end'], length=10)
+        self.assertEqual(page['content'], 'line 1\n')
+
+        # the page stops at `end` even in the middle of a line
+        page = read_text_page(f, 7, length=100, end=17)
+        self.assertEqual(page['content'], 'line 1\nlin')
+
+        # a line longer than a page is cut
+        page = read_text_page(io.BytesIO(b'x' * 20), 0, length=8)
+        self.assertEqual((page['end'], page['content']), (8, 'x' * 8))
+
+    def test_read_text_page_replaces_non_ascii(self):
+        page = read_text_page(io.BytesIO(b'a\xffb'), 0)
+        self.assertEqual(page['content'], 'a�b')
+
+    def test_large_file_shows_head_and_tail(self):
+        lines = [('line %d\n' % i).encode('ascii') for i in range(100000)]
+        f = io.BytesIO(b''.join(lines))
+        context = plain_text_visualizer._get_template_context(f, 0, None)
+
+        head, tail = context['head'], context['tail']
+        self.assertEqual(head['start'], 0)
+        self.assertTrue(head['content'].startswith('line 0\n'))
+        self.assertTrue(head['content'].endswith('\n'))
+        self.assertLessEqual(len(head['content']), plain_text_visualizer.K_PAGE_SIZE)
+        self.assertTrue(tail['content'].startswith('line '))
+        self.assertTrue(tail['content'].endswith('line 99999\n'))
+        self.assertEqual(tail['end'], len(f.getvalue()))
+        self.assertEqual(context['num_hidden_bytes'], tail['start'] - head['end'])
+
+        # a small file is shown as a whole
+        context = plain_text_visualizer._get_template_context(io.BytesIO(b'a\nb'), 0, None)
+        self.assertEqual(context['head']['content'], 'a\nb')
+        self.assertIsNone(context['tail'])
@@ -0,0 +1,144 @@
+import io
+import sys
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase
+from django.test import TransactionTestCase
+
+from serapis.models import *
+from serapis.tests import grading_fixtures
+from serapis.utils import file_schema
+from serapis.utils import submission_helper
+from serapis.utils.output_checker import OutputCheckerPool
+
+K_NOTIFY = 'serapis.utils.grading_scheduler_wakeup.GradingSchedulerWakeup.notify'
+K_RUN_GRADING_SCRIPT = 'serapis.utils.output_checker.run_grading_script'
+K_GET_GRADING_SCRIPT_COMMAND = 'serapis.utils.output_checker.get_grading_script_command'
+
+
+def _create_graded_submission(test_case):
+    """
+    Create a submission with two finished tasks, one executed fine with a stored output file and
+    one which crashed.
+    """
+    assignment, _ = grading_fixtures.create_assignment(task_points=[10., 20.])
+    TaskGradingStatusFileSchema.objects.create(assignment_fk=assignment, field='log')
+    submission, task_list = grading_fixtures.create_submission(assignment)
+    for task, execution_status in zip(task_list,
+            [TaskGradingStatus.EXEC_OK, TaskGradingStatus.EXEC_SEG_FAULT]):
+        file_schema.create_empty_task_grading_status_schema_files(task)
+        log_file = TaskGradingStatusFile.objects.get(task_grading_status_fk=task)
+        log_file.file.save('log.txt', ContentFile(b'output'))
+        grading_fixtures.set_task_state(task, TaskGradingStatus.STAT_FINISH,
+                execution_status=execution_status, points=1.)
+    submission.refresh_from_db()
+    return (assignment, submission, task_list)
+
+
+class RescoreTaskGradingStatusTestCase(TestCase):
+
+    def setUp(self):
+        self.assignment, self.submission, self.task_list = _create_graded_submission(self)
+
+    def test_rescore_notifies_scheduler(self):
+        with mock.patch(K_NOTIFY) as notify:
+            self.assertTrue(submission_helper.rescore_task_grading_status(self.task_list[0]))
+        self.assertTrue(notify.called)
+
+        self.task_list[0].refresh_from_db()
+        self.submission.refresh_from_db()
+        self.assertEqual(self.task_list[0].grading_status,
+                TaskGradingStatus.STAT_OUTPUT_TO_BE_CHECKED)
+        self.assertEqual(self.submission.num_graded_tasks, 1)
+
+    def test_rescore_without_notification(self):
+        with mock.patch(K_NOTIFY) as notify:
+            self.assertTrue(submission_helper.rescore_task_grading_status(
+                    self.task_list[0], notify_scheduler=False))
+        self.assertFalse(notify.called)
+
+    def test_task_without_stored_outputs_is_skipped(self):
+        TaskGradingStatusFile.objects.filter(task_grading_status_fk=self.task_list[0]).update(
+                file=None)
+        self.assertFalse(submission_helper.rescore_task_grading_status(self.task_list[0]))
+
+    def test_unparseable_output_is_internal_error(self):
+        task = self.task_list[0]
+        submission_helper.rescore_task_grading_status(task, notify_scheduler=False)
+        pool = OutputCheckerPool(num_workers=0, timeout_sec=10., print_func=lambda s: None)
+
+        cmd = [sys.executable, '-c', 'print("garbage")']
+        with mock.patch(K_NOTIFY) as notify, \
+                mock.patch(K_GET_GRADING_SCRIPT_COMMAND, return_value=cmd), \
+                mock.patch('traceback.print_exception'):
+            pool._check_output(task.id, None)
+        self.assertFalse(notify.called)
+
+        # the task is not sent back to the testbeds
+        task.refresh_from_db()
+        self.submission.refresh_from_db()
+        self.assertEqual(task.grading_status, TaskGradingStatus.STAT_INTERNAL_ERROR)
+        self.assertFalse(task.is_rescoring)
+        self.assertEqual(task.points, 0.)
+        self.assertEqual(self.submission.num_graded_tasks, 2)
+        task.grading_detail.open('rb')
+        try:
+            self.assertIn(b'not a JSON object', task.grading_detail.read())
+        finally:
+            task.grading_detail.close()
+
+    def test_rescoring_flag_is_cleared_on_update(self):
+        task = self.task_list[0]
+        submission_helper.rescore_task_grading_status(task, notify_scheduler=False)
+        task.refresh_from_db()
+        self.assertTrue(task.is_rescoring)
+
+        # e.g., the task is regraded on the testbeds
+        submission_helper.update_task_grading_status(task, TaskGradingStatus.STAT_PENDING)
+        task.refresh_from_db()
+        self.assertFalse(task.is_rescoring)
+
+    def test_result_is_committed_once(self):
+        # both the grading daemon and the rescore command check the same task
+        task = self.task_list[0]
+        submission_helper.rescore_task_grading_status(task, notify_scheduler=False)
+        pool_list = [OutputCheckerPool(num_workers=0, timeout_sec=1., print_func=lambda s: None)
+                for _ in range(2)]
+
+        self.assertTrue(pool_list[0]._commit(
+                task.id, TaskGradingStatus.STAT_FINISH, 5., None, timezone.now()))
+        self.assertFalse(pool_list[1]._commit(
+                task.id, TaskGradingStatus.STAT_FINISH, 8., None, timezone.now()))
+
+        task.refresh_from_db()
+        self.submission.refresh_from_db()
+        self.assertEqual(task.points, 5.)
+        self.assertEqual(self.submission.num_graded_tasks, 2)
+        self.assertEqual(self.submission.num_total_tasks, 2)
+
+
+class RescoreCommandTestCase(TransactionTestCase):
+    """
+    TransactionTestCase is used because the output checkers of the command run in other threads.
+    """
+
+    def test_rescore_assignment(self):
+        assignment, submission, task_list = _create_graded_submission(self)
+
+        stdout = io.StringIO()
+        with mock.patch(K_NOTIFY) as notify, \
+                mock.patch(K_RUN_GRADING_SCRIPT, return_value=(0.5, 'half')) as run_grading_script:
+            call_command('rescore', str(assignment.id), '--num-output-checkers', '1',
+                    stdout=stdout, stderr=io.StringIO())
+        self.assertFalse(notify.called)
+        self.assertEqual(run_grading_script.call_count, 1)
+        self.assertIn('Re-score 2 task(s)', stdout.getvalue())
+
+        # the crashed task is graded without the grading script
+        points_list = [TaskGradingStatus.objects.get(id=task.id).points for task in task_list]
+        self.assertEqual(points_list, [5., 0.])
+        submission.refresh_from_db()
+        self.assertEqual(submission.num_graded_tasks, 2)
+        self.assertEqual(submission.status, Submission.STAT_GRADED)
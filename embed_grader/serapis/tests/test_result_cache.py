@@ -0,0 +1,101 @@
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import TestCase
+
+from serapis.models import *
+from serapis.tests import grading_fixtures
+from serapis.utils import file_schema
+from serapis.utils import result_cache
+
+
+class ResultCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.assignment, (self.assignment_task,) = grading_fixtures.create_assignment(
+                enable_result_cache=True)
+        TaskGradingStatusFileSchema.objects.create(assignment_fk=self.assignment, field='log')
+
+        # a submission which is graded already
+        self.graded_submission, (self.graded_task,) = grading_fixtures.create_submission(
+                self.assignment, 'alice')
+        file_schema.create_empty_task_grading_status_schema_files(self.graded_task)
+        log_file = TaskGradingStatusFile.objects.get(task_grading_status_fk=self.graded_task)
+        log_file.file.save('log.txt', ContentFile(b'output'))
+        self.graded_task = grading_fixtures.set_task_state(self.graded_task,
+                TaskGradingStatus.STAT_FINISH, execution_status=TaskGradingStatus.EXEC_OK,
+                points=7.)
+        result_cache.remember_result(self.graded_task)
+
+        self.submission, _ = grading_fixtures.create_submission(
+                self.assignment, 'bob', create_tasks=False)
+
+    def test_hit_creates_finished_task(self):
+        with mock.patch('serapis.utils.grading_scheduler_wakeup.GradingSchedulerWakeup.notify') \
+                as notify:
+            grading_task = result_cache.create_task_grading_status_from_cache(
+                    self.submission, self.assignment_task)
+        self.assertFalse(notify.called)
+
+        grading_task.refresh_from_db()
+        self.assertEqual(grading_task.grading_status, TaskGradingStatus.STAT_FINISH)
+        self.assertEqual(grading_task.execution_status, TaskGradingStatus.EXEC_OK)
+        self.assertEqual(grading_task.points, 7.)
+        self.assertEqual(grading_task.result_cache_key, self.graded_task.result_cache_key)
+
+        # the output files are shared with the graded task
+        output_files = file_schema.get_dict_schema_name_to_task_grading_status_schema_files(
+                grading_task)
+        self.assertEqual(output_files['log'].file.name,
+                TaskGradingStatusFile.objects.get(
+                        task_grading_status_fk=self.graded_task).file.name)
+
+        self.submission.refresh_from_db()
+        self.assertEqual(self.submission.num_total_tasks, 1)
+        self.assertEqual(self.submission.num_graded_tasks, 1)
+        self.assertTrue(self.submission.is_fully_graded(include_hidden=True))
+
+    def test_miss_creates_nothing(self):
+        self.assignment_task.grading_script.save('changed.py', ContentFile(b'# changed'))
+
+        self.assertIsNone(result_cache.create_task_grading_status_from_cache(
+                self.submission, self.assignment_task))
+        self.assertEqual(TaskGradingStatus.objects.filter(
+                submission_fk=self.submission).count(), 0)
+        self.submission.refresh_from_db()
+        self.assertEqual(self.submission.num_total_tasks, 0)
+
+    def test_unfinished_task_is_not_reused(self):
+        grading_fixtures.set_task_state(self.graded_task, TaskGradingStatus.STAT_PENDING)
+
+        self.assertIsNone(result_cache.create_task_grading_status_from_cache(
+                self.submission, self.assignment_task))
+
+    def test_disabled_cache(self):
+        Assignment.objects.filter(id=self.assignment.id).update(enable_result_cache=False)
+        assignment_task = AssignmentTask.objects.get(id=self.assignment_task.id)
+
+        self.assertEqual(result_cache.find_cached_task(self.submission, assignment_task),
+                (None, None))
+        self.assertIsNone(result_cache.create_task_grading_status_from_cache(
+                self.submission, assignment_task))
+
+        # finished tasks do not remember a key either
+        task = grading_fixtures.create_submission(self.assignment, 'carol')[1][0]
+        task = grading_fixtures.set_task_state(task, TaskGradingStatus.STAT_FINISH)
+        result_cache.remember_result(task)
+        task.refresh_from_db()
+        self.assertEqual(task.result_cache_key, '')
+
+    def test_submission_files_are_hashed_once(self):
+        submission_files_hash = result_cache.hash_submission_files(self.submission)
+        self.assertEqual(
+                result_cache.compute_result_cache_key(
+                        self.submission, self.assignment_task, submission_files_hash),
+                result_cache.compute_result_cache_key(self.submission, self.assignment_task))
+
+        with mock.patch('serapis.utils.result_cache.hash_submission_files') as hash_files:
+            grading_task = result_cache.create_task_grading_status_from_cache(
+                    self.submission, self.assignment_task, submission_files_hash)
+        self.assertFalse(hash_files.called)
+        self.assertEqual(grading_task.result_cache_key, self.graded_task.result_cache_key)
@@ -0,0 +1,18 @@
+import numpy
+
+from django.test import TestCase
+
+from serapis.utils.visualizers.step_series import get_step_series
+
+
+class StepSeriesTestCase(TestCase):
+
+    def test_get_step_series(self):
+        timestamps, values = get_step_series([0., 1., 3., 10.], [0, 1, 2, 2], 0.5)
+        self.assertEqual(timestamps.tolist(), [0., 0.5, 1., 2.5, 3., 9.5])
+        self.assertEqual(values.tolist(), [0, 0, 1, 1, 2, 2])
+
+    def test_single_event_has_no_step(self):
+        timestamps, values = get_step_series(numpy.array([5.]), numpy.array([1]), 0.1)
+        self.assertEqual(len(timestamps), 0)
+        self.assertEqual(len(values), 0)
@@ -185,3 +185,28 @@ class STM32WaveformFileReaderTestCase(TestCase):
                     [(0., 0), (20., 1), (40., 0), (80., 1), (100., 1)],
                 ),
         )
+
+    def test_negative_bus_values(self):
+        # negative bus values read as two's complement, i.e., -1 sets all the pins
+        content = "\n".join([
+            'Period: 0.03',
+            'Tick frequency: 100',
+            'Display start',
+            'CTL,0',
+            'VAL,2,1',
+            'Display end',
+            '==',
+            '68, 0, 0',
+            '68, 1, -1',
+            '68, 2, -6',
+        ])
+        reader = STM32WaveformFileReader(content.encode())
+        self.assertEqual(reader.is_successfully_parsed(), True)
+        self.assertEqual(reader.get_event_series(series_idx=0), (
+            'CTL',
+            [(0., 0), (10., 1), (20., 0), (30., 0)],
+        ))
+        self.assertEqual(reader.get_event_series(series_idx=1), (
+            'VAL',
+            [(0., 0), (10., 3), (20., 1), (30., 1)],
+        ))
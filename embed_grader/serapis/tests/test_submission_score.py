@@ -0,0 +1,80 @@
+from django.test import TestCase
+
+from serapis.models import *
+from serapis.tests import grading_fixtures
+
+
+class SubmissionScoreTestCase(TestCase):
+    """
+    The aggregate query of retrieve_score_sum() has to agree with the scores summed up in python
+    by retrieve_task_grading_status_and_score_sum().
+    """
+
+    def setUp(self):
+        self.assignment, _ = grading_fixtures.create_assignment(
+                task_points=[10., 20., 30., 40.],
+                task_modes=[AssignmentTask.MODE_PUBLIC, AssignmentTask.MODE_FEEDBACK,
+                        AssignmentTask.MODE_HIDDEN, AssignmentTask.MODE_HIDDEN])
+        self.submission, self.task_list = grading_fixtures.create_submission(self.assignment)
+
+    def _set_states(self, state_list):
+        for task, (grading_status, points) in zip(self.task_list, state_list):
+            grading_fixtures.set_task_state(task, grading_status, points=points)
+
+    def assertScoresAgree(self, submission, expected_scores):
+        for include_hidden, expected in zip([False, True], expected_scores):
+            _, sum_student_score, sum_total_score = \
+                    submission.retrieve_task_grading_status_and_score_sum(include_hidden)
+            self.assertEqual((sum_student_score, sum_total_score), expected)
+            self.assertEqual(submission.retrieve_score_sum(include_hidden), expected)
+
+    def test_finished_tasks(self):
+        self._set_states([(TaskGradingStatus.STAT_FINISH, points)
+                for points in [1., 2., 3., 4.]])
+        self.assertScoresAgree(self.submission, [(3., 30.), (10., 100.)])
+
+    def test_unfinished_tasks_score_nothing(self):
+        # the points left behind by an unfinished grading do not count
+        self._set_states([
+                (TaskGradingStatus.STAT_PENDING, 1.),
+                (TaskGradingStatus.STAT_FINISH, 2.),
+                (TaskGradingStatus.STAT_INTERNAL_ERROR, 3.),
+                (TaskGradingStatus.STAT_OUTPUT_TO_BE_CHECKED, 4.),
+        ])
+        self.assertScoresAgree(self.submission, [(2., 30.), (2., 100.)])
+
+        self._set_states([(TaskGradingStatus.STAT_EXECUTING, 5.)] * 2
+                + [(TaskGradingStatus.STAT_SKIPPED, 6.), (TaskGradingStatus.STAT_FINISH, 7.)])
+        self.assertScoresAgree(self.submission, [(0., 30.), (7., 100.)])
+
+    def test_submission_without_tasks(self):
+        submission, _ = grading_fixtures.create_submission(self.assignment, 'alice',
+                create_tasks=False)
+        self.assertScoresAgree(submission, [(0., 0.), (0., 0.)])
+        self.assertTrue(submission.is_fully_graded(include_hidden=True))
+
+    def test_is_fully_graded(self):
+        self._set_states([(TaskGradingStatus.STAT_FINISH, 0.)] * 4)
+        self.assertTrue(self.submission.is_fully_graded(include_hidden=True))
+
+        # an internal error ends the grading of a task as well
+        self._set_states([(TaskGradingStatus.STAT_INTERNAL_ERROR, 0.)] * 4)
+        self.assertTrue(self.submission.is_fully_graded(include_hidden=True))
+
+        # a hidden task still being graded only matters if hidden tasks are included
+        self._set_states([(TaskGradingStatus.STAT_FINISH, 0.)] * 3
+                + [(TaskGradingStatus.STAT_PENDING, 0.)])
+        self.assertTrue(self.submission.is_fully_graded(include_hidden=False))
+        self.assertFalse(self.submission.is_fully_graded(include_hidden=True))
+
+        for grading_status in [TaskGradingStatus.STAT_PENDING, TaskGradingStatus.STAT_EXECUTING,
+                TaskGradingStatus.STAT_OUTPUT_TO_BE_CHECKED, TaskGradingStatus.STAT_SKIPPED]:
+            self._set_states([(grading_status, 0.)])
+            self.assertFalse(self.submission.is_fully_graded(include_hidden=False))
+
+        # the same answer as checking each task on its own
+        for include_hidden in [False, True]:
+            task_grading_status_list, _, _ = \
+                    self.submission.retrieve_task_grading_status_and_score_sum(include_hidden)
+            self.assertEqual(self.submission.is_fully_graded(include_hidden),
+                    all(t.is_grading_done() for t in task_grading_status_list))
@@ -0,0 +1,118 @@
+from unittest import mock
+
+import requests
+
+from django.test import TestCase
+
+from serapis.models import *
+from serapis.tests import grading_fixtures
+from serapis.utils import testbed_helper
+from serapis.utils.testbed_dispatcher import TestbedDispatcherPool
+
+
+class _StopWorker(Exception):
+    """
+    Raised by the queue to leave the worker loop, which never returns otherwise
+    """
+    pass
+
+
+@mock.patch('serapis.utils.testbed_dispatcher.requests.Session')
+class TestbedDispatcherPoolTestCase(TestCase):
+    """
+    The pool is created without worker threads, and the jobs are uploaded by calling _grade()
+    directly. The sessions are mocked, so that nothing is sent over the network.
+    """
+
+    def setUp(self):
+        testbed_type = TestbedType.objects.create(name='type')
+        assignment, _ = grading_fixtures.create_assignment(
+                testbed_type=testbed_type, task_points=[1., 2., 3.])
+        _, self.task_list = grading_fixtures.create_submission(assignment)
+        self.testbed_list = [grading_fixtures.create_testbed(testbed_type, ip_address)
+                for ip_address in ['10.0.0.1', '10.0.0.2']]
+        self.pool = TestbedDispatcherPool(num_workers=0, connect_timeout_sec=1.,
+                read_timeout_sec=2., print_func=lambda s: None)
+
+    def _grade(self, testbed, task):
+        testbed_helper.grade_task(testbed, task, 60.)
+        self.pool._grade(testbed, task)
+        testbed.refresh_from_db()
+        task.refresh_from_db()
+
+    def test_session_is_reused_per_testbed(self, session_class):
+        session_class.side_effect = lambda: mock.MagicMock(
+                **{'post.return_value.status_code': 200})
+        testbed_list = [self.testbed_list[0], self.testbed_list[0], self.testbed_list[1]]
+        for testbed, task in zip(testbed_list, self.task_list):
+            self._grade(testbed, task)
+            self.assertEqual(testbed.status, Testbed.STATUS_BUSY)
+            self.assertEqual(task.grading_status, TaskGradingStatus.STAT_EXECUTING)
+            # the testbed reports that the task is done
+            Testbed.objects.filter(id=testbed.id).update(
+                    status=Testbed.STATUS_AVAILABLE, task_being_graded=None)
+            testbed.refresh_from_db()
+
+        # the first testbed is sent two tasks over the same session
+        self.assertEqual(session_class.call_count, 2)
+        self.assertEqual(set(self.pool.idle_sessions), set(['10.0.0.1', '10.0.0.2']))
+        session = self.pool.idle_sessions['10.0.0.1']
+        self.assertEqual(session.post.call_count, 2)
+        url = session.post.call_args[0][0]
+        self.assertEqual(url, 'http://10.0.0.1/tb/grade_assignment/')
+        self.assertEqual(session.post.call_args[1]['timeout'], (1., 2.))
+
+        self.pool.discard_session('10.0.0.1')
+        session.close.assert_called_once_with()
+        self.assertEqual(set(self.pool.idle_sessions), set(['10.0.0.2']))
+
+    def test_timeout_takes_testbed_offline(self, session_class):
+        session = session_class.return_value
+        session.post.side_effect = requests.exceptions.Timeout()
+        testbed, task = self.testbed_list[0], self.task_list[0]
+        self._grade(testbed, task)
+
+        self.assertEqual(testbed.status, Testbed.STATUS_OFFLINE)
+        self.assertIsNone(testbed.task_being_graded)
+        self.assertEqual(task.grading_status, TaskGradingStatus.STAT_PENDING)
+
+        # the broken connection is not reused
+        session.close.assert_called_once_with()
+        self.assertEqual(self.pool.idle_sessions, {})
+
+    def test_rejected_task_is_aborted(self, session_class):
+        session = session_class.return_value
+        session.post.return_value.status_code = 500
+        testbed, task = self.testbed_list[0], self.task_list[0]
+        self._grade(testbed, task)
+
+        self.assertEqual(testbed.status, Testbed.STATUS_BUSY)
+        self.assertIsNone(testbed.task_being_graded)
+        self.assertEqual(task.grading_status, TaskGradingStatus.STAT_PENDING)
+
+        # the testbed answered, hence the connection is still good
+        session.close.assert_not_called()
+        self.assertEqual(self.pool.idle_sessions, {'10.0.0.1': session})
+
+    def test_queue_depth(self, session_class):
+        self.assertEqual(self.pool.get_queue_depth(), 0)
+        for testbed, task in zip(self.testbed_list, self.task_list):
+            self.pool.submit(testbed, task)
+        self.assertEqual(self.pool.get_queue_depth(), 2)
+
+        self.pool.job_queue.get()
+        self.assertEqual(self.pool.get_queue_depth(), 1)
+
+    def test_work_closes_connections_around_each_job(self, session_class):
+        calls = []
+        job = (self.testbed_list[0], self.task_list[0])
+        with mock.patch('serapis.utils.testbed_dispatcher.close_old_connections',
+                side_effect=lambda: calls.append('close')), \
+                mock.patch.object(self.pool, '_grade',
+                        side_effect=lambda testbed, task: calls.append(task.id)), \
+                mock.patch.object(self.pool.job_queue, 'get', side_effect=[job, _StopWorker()]), \
+                mock.patch.object(self.pool.job_queue, 'task_done') as task_done:
+            with self.assertRaises(_StopWorker):
+                self.pool._work()
+        self.assertEqual(calls, ['close', self.task_list[0].id, 'close'])
+        task_done.assert_called_once_with()
@@ -0,0 +1,224 @@
+import datetime
+
+from django.db import transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from serapis.models import *
+from serapis.tests import grading_fixtures
+from serapis.utils import testbed_helper
+
+
+class _Rollback(Exception):
+    pass
+
+
+class TestbedHelperTestCase(TestCase):
+    """
+    The set-based helpers are compared against the per-row path they replace, i.e., the same
+    helpers called one testbed at a time. Each path runs in a transaction which is rolled back, so
+    that both start from the same records.
+    """
+
+    def setUp(self):
+        self.testbed_type = TestbedType.objects.create(name='type')
+        self.other_testbed_type = TestbedType.objects.create(name='other type')
+        self.assignment, _ = grading_fixtures.create_assignment(
+                testbed_type=self.testbed_type, task_points=[1., 2., 3.])
+        self.submission_list = []
+        for username in ['alice', 'bob']:
+            submission, _ = grading_fixtures.create_submission(self.assignment, username)
+            self.submission_list.append(submission)
+
+    def _snapshot(self):
+        return {
+                'tasks': list(TaskGradingStatus.objects.order_by('id').values_list(
+                        'id', 'grading_status', 'points')),
+                'submissions': list(Submission.objects.order_by('id').values_list(
+                        'id', 'num_graded_tasks', 'num_total_tasks', 'status')),
+                'testbeds': list(Testbed.objects.order_by('id').values_list(
+                        'id', 'status', 'task_being_graded')),
+        }
+
+    def _run_and_roll_back(self, func):
+        """
+        Returns:
+          (the return value of func, a snapshot of the records after func)
+        """
+        try:
+            with transaction.atomic():
+                result = func()
+                snapshot = self._snapshot()
+                raise _Rollback()
+        except _Rollback:
+            pass
+        return (result, snapshot)
+
+    def _create_testbeds(self, num_testbeds, testbed_type=None):
+        return [grading_fixtures.create_testbed(testbed_type or self.testbed_type,
+                '10.0.0.%d' % Testbed.objects.count()) for _ in range(num_testbeds)]
+
+    def test_assign_more_pending_tasks_than_testbeds(self):
+        testbed_list = self._create_testbeds(4)
+        self._create_testbeds(1, self.other_testbed_type)
+        grading_fixtures.create_testbed(self.testbed_type, '10.0.1.0',
+                status=Testbed.STATUS_BUSY)
+
+        def assign_one_by_one():
+            # the per-row path: each available testbed takes the first pending task of its type
+            testbed_task_pairs = []
+            for testbed in Testbed.objects.filter(status=Testbed.STATUS_AVAILABLE).order_by('id'):
+                task_list = (TaskGradingStatus.objects
+                        .filter(grading_status=TaskGradingStatus.STAT_PENDING,
+                            assignment_task_fk__assignment_fk__testbed_type_fk=
+                                    testbed.testbed_type_fk)
+                        .order_by('submission_fk__task_scope', 'submission_fk', 'id'))
+                if task_list.count() > 0:
+                    chosen_task = task_list[0]
+                    testbed_helper.grade_task(testbed, chosen_task, 60.,
+                            force_detach_currently_graded_task=True)
+                    testbed_task_pairs.append((testbed.id, chosen_task.id))
+            return testbed_task_pairs
+
+        def assign_in_batch():
+            return [(testbed.id, task.id)
+                    for testbed, task in testbed_helper.assign_pending_tasks(60.)]
+
+        expected_pairs, expected_snapshot = self._run_and_roll_back(assign_one_by_one)
+        pairs, snapshot = self._run_and_roll_back(assign_in_batch)
+        self.assertEqual(pairs, expected_pairs)
+        self.assertEqual(snapshot, expected_snapshot)
+
+        # 4 of the 6 pending tasks are assigned, in the order of the submissions
+        first_tasks = list(TaskGradingStatus.objects.order_by('submission_fk', 'id')[:4])
+        self.assertEqual(pairs, [(testbed.id, task.id)
+                for testbed, task in zip(testbed_list, first_tasks)])
+        task_status_list = [status for _, status, _ in snapshot['tasks']]
+        self.assertEqual(task_status_list.count(TaskGradingStatus.STAT_EXECUTING), 4)
+        self.assertEqual(task_status_list.count(TaskGradingStatus.STAT_PENDING), 2)
+        for _, num_graded_tasks, num_total_tasks, _ in snapshot['submissions']:
+            self.assertEqual((num_graded_tasks, num_total_tasks), (0, 3))
+
+    def test_assign_prefers_smaller_task_scope(self):
+        self._create_testbeds(1)
+        Submission.objects.filter(id=self.submission_list[1].id).update(
+                task_scope=AssignmentTask.MODE_PUBLIC)
+
+        testbed_task_pairs = testbed_helper.assign_pending_tasks(60.)
+        self.assertEqual(len(testbed_task_pairs), 1)
+        self.assertEqual(testbed_task_pairs[0][1].submission_fk_id, self.submission_list[1].id)
+
+    def test_assign_without_pending_tasks(self):
+        self._create_testbeds(2)
+        TaskGradingStatus.objects.update(grading_status=TaskGradingStatus.STAT_FINISH)
+
+        self.assertEqual(testbed_helper.assign_pending_tasks(60.), [])
+        self.assertEqual(Testbed.objects.filter(status=Testbed.STATUS_AVAILABLE).count(), 2)
+
+    def test_assign_detaches_task_left_on_available_testbed(self):
+        testbed = self._create_testbeds(1)[0]
+        stale_task = grading_fixtures.set_task_state(
+                TaskGradingStatus.objects.order_by('-id')[0], TaskGradingStatus.STAT_EXECUTING)
+        Testbed.objects.filter(id=testbed.id).update(task_being_graded=stale_task)
+
+        testbed_task_pairs = testbed_helper.assign_pending_tasks(60.)
+        self.assertEqual(len(testbed_task_pairs), 1)
+        chosen_task = testbed_task_pairs[0][1]
+        self.assertNotEqual(chosen_task.id, stale_task.id)
+
+        testbed.refresh_from_db()
+        stale_task.refresh_from_db()
+        self.assertEqual(testbed.task_being_graded_id, chosen_task.id)
+        self.assertEqual(testbed.status, Testbed.STATUS_BUSY)
+        self.assertEqual(stale_task.grading_status, TaskGradingStatus.STAT_PENDING)
+
+    def _attach_tasks(self, testbed_list):
+        """
+        Let each testbed execute a task, and finish another task of the first submission so that
+        its counters are not all zero.
+        """
+        pending_task_list = list(TaskGradingStatus.objects.order_by('id'))
+        grading_fixtures.set_task_state(pending_task_list.pop(), TaskGradingStatus.STAT_FINISH,
+                points=3.)
+        for testbed, task in zip(testbed_list, pending_task_list):
+            testbed_helper.grade_task(testbed, task, 60.)
+
+    def test_abort_tasks_of_expired_testbeds(self):
+        now = timezone.now()
+        expired_testbed_list = [grading_fixtures.create_testbed(self.testbed_type,
+                '10.0.0.%d' % i, report_time=now - datetime.timedelta(minutes=5))
+                for i in range(3)]
+        alive_testbed = grading_fixtures.create_testbed(self.testbed_type, '10.0.0.9')
+        self._attach_tasks(expired_testbed_list[:2] + [alive_testbed])
+
+        threshold_time = now - datetime.timedelta(minutes=1)
+
+        def abort_one_by_one():
+            for testbed in Testbed.objects.filter(report_time__lt=threshold_time):
+                testbed_helper.abort_task(testbed, set_testbed_status=Testbed.STATUS_OFFLINE,
+                        check_task_presence=False)
+
+        def abort_in_batch():
+            testbed_id_list = Testbed.objects.filter(
+                    report_time__lt=threshold_time).values_list('id', flat=True)
+            return testbed_helper.abort_tasks_of_testbeds(
+                    list(testbed_id_list), set_testbed_status=Testbed.STATUS_OFFLINE)
+
+        _, expected_snapshot = self._run_and_roll_back(abort_one_by_one)
+        aborted_task_id_list, snapshot = self._run_and_roll_back(abort_in_batch)
+        self.assertEqual(snapshot, expected_snapshot)
+
+        self.assertEqual(sorted(aborted_task_id_list), sorted(
+                [testbed.task_being_graded_id for testbed in expired_testbed_list[:2]]))
+        testbed_state_list = [(status, task_id) for _, status, task_id in snapshot['testbeds']]
+        self.assertEqual(testbed_state_list[:3], [(Testbed.STATUS_OFFLINE, None)] * 3)
+        self.assertEqual(testbed_state_list[3],
+                (Testbed.STATUS_BUSY, alive_testbed.task_being_graded_id))
+        self.assertEqual([status for _, status, _ in snapshot['tasks']], [
+                TaskGradingStatus.STAT_PENDING, TaskGradingStatus.STAT_PENDING,
+                TaskGradingStatus.STAT_EXECUTING, TaskGradingStatus.STAT_PENDING,
+                TaskGradingStatus.STAT_PENDING, TaskGradingStatus.STAT_FINISH])
+        self.assertEqual([row[1:3] for row in snapshot['submissions']], [(0, 3), (1, 3)])
+
+    def test_abort_tasks_of_testbeds_leaves_finished_task(self):
+        testbed = self._create_testbeds(1)[0]
+        task = TaskGradingStatus.objects.order_by('id')[0]
+        testbed_helper.grade_task(testbed, task, 60.)
+        grading_fixtures.set_task_state(task, TaskGradingStatus.STAT_OUTPUT_TO_BE_CHECKED)
+
+        self.assertEqual(testbed_helper.abort_tasks_of_testbeds(
+                [testbed.id], set_testbed_status=Testbed.STATUS_AVAILABLE), [task.id])
+        task.refresh_from_db()
+        testbed.refresh_from_db()
+        self.assertEqual(task.grading_status, TaskGradingStatus.STAT_OUTPUT_TO_BE_CHECKED)
+        self.assertEqual(testbed.status, Testbed.STATUS_AVAILABLE)
+        self.assertIsNone(testbed.task_being_graded)
+
+    def test_reset_orphan_tasks(self):
+        testbed_list = self._create_testbeds(2)
+        self._attach_tasks(testbed_list)
+
+        # the first testbed loses its task, and another task shows executing without a testbed
+        orphan_task_id = testbed_list[0].task_being_graded_id
+        Testbed.objects.filter(id=testbed_list[0].id).update(task_being_graded=None)
+        lost_task = TaskGradingStatus.objects.filter(
+                grading_status=TaskGradingStatus.STAT_PENDING).order_by('id')[0]
+        grading_fixtures.set_task_state(lost_task, TaskGradingStatus.STAT_EXECUTING)
+
+        def reset_one_by_one():
+            for task in TaskGradingStatus.objects.filter(
+                    grading_status=TaskGradingStatus.STAT_EXECUTING):
+                if Testbed.objects.filter(task_being_graded=task).count() == 0:
+                    task.grading_status = TaskGradingStatus.STAT_PENDING
+                    task.save()
+
+        _, expected_snapshot = self._run_and_roll_back(reset_one_by_one)
+        orphan_task_id_list, snapshot = self._run_and_roll_back(testbed_helper.reset_orphan_tasks)
+        self.assertEqual(snapshot, expected_snapshot)
+        self.assertEqual(sorted(orphan_task_id_list), sorted([orphan_task_id, lost_task.id]))
+
+        # the task still being graded is untouched
+        self.assertEqual(dict((row[0], row[1]) for row in snapshot['tasks'])[
+                testbed_list[1].task_being_graded_id], TaskGradingStatus.STAT_EXECUTING)
+        self.assertEqual(testbed_helper.reset_orphan_tasks(), orphan_task_id_list)
+        self.assertEqual(testbed_helper.reset_orphan_tasks(), [])
@@ -0,0 +1,34 @@
+import base64
+import numpy
+
+from django.test import TestCase
+
+from serapis.utils.visualizers import typed_array_encoding
+
+
+class TypedArrayEncodingTestCase(TestCase):
+
+    def test_encode_plot_series(self):
+        encoded = typed_array_encoding.encode_plot_series([0., 1.5, 20.], [0, 3, 3])
+        self.assertEqual(encoded['encoding'], 'base64')
+
+        self.assertEqual(encoded['timestamps']['type'], 'Float64Array')
+        timestamps = numpy.frombuffer(
+                base64.b64decode(encoded['timestamps']['data']), dtype='<f8')
+        self.assertEqual(timestamps.tolist(), [0., 1.5, 20.])
+
+        self.assertEqual(encoded['values']['type'], 'Uint32Array')
+        values = numpy.frombuffer(base64.b64decode(encoded['values']['data']), dtype='<u4')
+        self.assertEqual(values.tolist(), [0, 3, 3])
+
+    def test_encode_wide_bus_values(self):
+        encoded = typed_array_encoding.encode_typed_array(
+                numpy.array([1, 1 << 40], dtype=numpy.uint64))
+        self.assertEqual(encoded['type'], 'Float64Array')
+        values = numpy.frombuffer(base64.b64decode(encoded['data']), dtype='<f8')
+        self.assertEqual(values.tolist(), [1., float(1 << 40)])
+
+    def test_encode_json(self):
+        encoded = typed_array_encoding.encode_plot_series([0., 1.5], [2, 2],
+                encoding=typed_array_encoding.K_ENCODING_JSON)
+        self.assertEqual(encoded, {'encoding': 'json', 'timestamps': [0., 1.5], 'values': [2, 2]})
@@ -0,0 +1,198 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.db import IntegrityError
+from django.test import TestCase
+from django.test import override_settings
+
+from serapis.models import *
+from serapis.tests import grading_fixtures
+from serapis.utils import file_schema
+from serapis.utils import visualization_artifacts
+from serapis.utils.visualizer_manager import K_VISUALIZER_VERSION
+from serapis.utils.visualizer_manager import VisualizerManager
+
+
+K_WAVEFORM_CONTENT = '\n'.join([
+    'Period: 20',
+    'Tick frequency: 5000',
+    'Display start',
+    'CTL,0',
+    'Display end',
+    '==',
+    '68, 0, 0',
+    '68, 30000, 1',
+]).encode('ascii')
+
+K_LOGIC_SALEAE_WAVEFORM_CONTENT = '\n'.join([
+    'Period: 1',
+    'Display start',
+    'CTL,0',
+    'Display end',
+    '==',
+    'Time[s], Data[Hex]',
+    '0.000000000000000, 0',
+    '0.600000000000000, 1',
+]).encode('ascii')
+
+K_HTML_DIR = 'TaskGradingStatusFileVisualization_html'
+
+
+def _render_file_html(field_name, raw_content, visualizer_id, window_url=None):
+    return '<p>%s %d %d</p>' % (field_name, visualizer_id, len(raw_content))
+
+def _render_waveform_file_html(field_name, f, visualizer_id, window_url=None, path=None):
+    return (_render_file_html(field_name, f.read(), visualizer_id), None)
+
+_real_render_waveform_file_html = VisualizerManager.render_waveform_file_html
+
+
+@mock.patch('serapis.utils.visualization_artifacts.VisualizerManager.render_waveform_file_html',
+        side_effect=_render_waveform_file_html)
+class VisualizationArtifactsTestCase(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        assignment, _ = grading_fixtures.create_assignment()
+        TaskGradingStatusFileSchema.objects.create(assignment_fk=assignment,
+                field='trace.stm32.waveform')
+        TaskGradingStatusFileSchema.objects.create(assignment_fk=assignment, field='log')
+        TaskGradingStatusFileSchema.objects.create(assignment_fk=assignment,
+                field='trace.logicsaleae.waveform')
+
+        _, (self.task,) = grading_fixtures.create_submission(assignment)
+        file_schema.create_empty_task_grading_status_schema_files(self.task)
+        output_files = file_schema.get_dict_schema_name_to_task_grading_status_schema_files(
+                self.task)
+        self.schema_file = output_files['trace.stm32.waveform']
+        self.schema_file.file.save('trace.txt', ContentFile(K_WAVEFORM_CONTENT))
+        output_files['log'].file.save('log.txt', ContentFile(b'output'))
+        self.logic_schema_file = output_files['trace.logicsaleae.waveform']
+        self.logic_schema_file.file.save('logic.txt', ContentFile(K_LOGIC_SALEAE_WAVEFORM_CONTENT))
+        self.task = grading_fixtures.set_task_state(self.task, TaskGradingStatus.STAT_FINISH,
+                execution_status=TaskGradingStatus.EXEC_OK, points=10.)
+
+    def _get_visualization(self):
+        return TaskGradingStatusFileVisualization.objects.get(
+                task_grading_status_file_fk=self.schema_file)
+
+    def _list_html_files(self):
+        storage = TaskGradingStatusFileVisualization._meta.get_field('html').storage
+        if not storage.exists(K_HTML_DIR):
+            return set()
+        return set(storage.listdir(K_HTML_DIR)[1])
+
+    def test_generate_visualizations(self, render_waveform_file_html):
+        visualization_artifacts.generate_visualizations(self.task)
+
+        # plain text files are rendered from the file on demand, hence not stored
+        self.assertEqual(TaskGradingStatusFileVisualization.objects.filter(
+                task_grading_status_file_fk__task_grading_status_fk=self.task).count(), 2)
+        visualization = self._get_visualization()
+        self.assertEqual(visualization.task_grading_status_file_fk, self.schema_file)
+        self.assertEqual(visualization.visualizer_version, K_VISUALIZER_VERSION)
+        self.assertEqual(visualization.source_file_name, self.schema_file.file.name)
+        self.assertEqual(visualization.parse_error, '')
+
+        visualizer_id = visualization.visualizer_id
+        self.assertEqual(
+                visualization_artifacts.get_stored_visualization_html(
+                        self.schema_file, visualizer_id),
+                _render_file_html('trace.stm32.waveform', K_WAVEFORM_CONTENT, visualizer_id))
+
+    def test_outdated_visualization(self, render_waveform_file_html):
+        visualization_artifacts.generate_visualization(
+                self.task, 'trace.stm32.waveform', self.schema_file, 0)
+        self.assertIsNotNone(
+                visualization_artifacts.get_stored_visualization_html(self.schema_file, 0))
+
+        # another visualizer id
+        self.assertIsNone(
+                visualization_artifacts.get_stored_visualization_html(self.schema_file, 1))
+
+        # another visualizer version
+        TaskGradingStatusFileVisualization.objects.update(
+                visualizer_version=K_VISUALIZER_VERSION - 1)
+        self.assertIsNone(
+                visualization_artifacts.get_stored_visualization_html(self.schema_file, 0))
+        TaskGradingStatusFileVisualization.objects.update(visualizer_version=K_VISUALIZER_VERSION)
+
+        # the task is regraded, and the output is stored in a new file
+        self.schema_file.file.save('trace.txt', ContentFile(K_WAVEFORM_CONTENT))
+        self.assertIsNone(
+                visualization_artifacts.get_stored_visualization_html(self.schema_file, 0))
+
+    def test_regenerate_replaces_file(self, render_waveform_file_html):
+        visualization_artifacts.generate_visualization(
+                self.task, 'trace.stm32.waveform', self.schema_file, 0)
+        old_html_name = self._get_visualization().html.name
+
+        visualization_artifacts.generate_visualization(
+                self.task, 'trace.stm32.waveform', self.schema_file, 1)
+        new_html_name = self._get_visualization().html.name
+        self.assertNotEqual(new_html_name, old_html_name)
+        self.assertEqual(self._list_html_files(), set([new_html_name.split('/')[-1]]))
+        self.assertEqual(
+                visualization_artifacts.get_stored_visualization_html(self.schema_file, 1),
+                _render_file_html('trace.stm32.waveform', K_WAVEFORM_CONTENT, 1))
+
+    def test_failed_save_keeps_previous_file(self, render_waveform_file_html):
+        visualization_artifacts.generate_visualization(
+                self.task, 'trace.stm32.waveform', self.schema_file, 0)
+        html_files = self._list_html_files()
+
+        with mock.patch.object(TaskGradingStatusFileVisualization, 'save',
+                side_effect=IntegrityError):
+            visualization_artifacts.generate_visualization(
+                    self.task, 'trace.stm32.waveform', self.schema_file, 1)
+
+        # the stored visualization is intact, and the new file is removed
+        self.assertEqual(self._list_html_files(), html_files)
+        self.assertEqual(
+                visualization_artifacts.get_stored_visualization_html(self.schema_file, 0),
+                _render_file_html('trace.stm32.waveform', K_WAVEFORM_CONTENT, 0))
+
+    def test_visualizer_error(self, render_waveform_file_html):
+        render_waveform_file_html.side_effect = ValueError('<bad>')
+        html = visualization_artifacts.generate_visualization(
+                self.task, 'trace.stm32.waveform', self.schema_file, 0)
+
+        self.assertIn('(Visualizer error: &lt;bad&gt;)', html)
+        self.assertEqual(self._get_visualization().parse_error, 'Visualizer error: <bad>')
+        self.assertEqual(
+                visualization_artifacts.get_stored_visualization_html(self.schema_file, 0), html)
+
+    def test_logic_saleae_waveform_is_read_from_file(self, render_waveform_file_html):
+        render_waveform_file_html.side_effect = _real_render_waveform_file_html
+        with mock.patch.object(VisualizerManager, 'render_file_html') as render_file_html:
+            html = visualization_artifacts.generate_visualization(
+                    self.task, 'trace.logicsaleae.waveform', self.logic_schema_file, 2)
+        self.assertFalse(render_file_html.called)
+        self.assertIn('vis2', html)
+
+        visualization = TaskGradingStatusFileVisualization.objects.get(
+                task_grading_status_file_fk=self.logic_schema_file)
+        self.assertEqual(visualization.parse_error, '')
+        self.assertEqual(
+                visualization_artifacts.get_stored_visualization_html(self.logic_schema_file, 2),
+                html)
+
+    def test_logic_saleae_waveform_with_format_error(self, render_waveform_file_html):
+        render_waveform_file_html.side_effect = _real_render_waveform_file_html
+        content = K_LOGIC_SALEAE_WAVEFORM_CONTENT.replace(b'Period: 1', b'Period: x')
+        self.logic_schema_file.file.save('logic.txt', ContentFile(content))
+        html = visualization_artifacts.generate_visualization(
+                self.task, 'trace.logicsaleae.waveform', self.logic_schema_file, 2)
+
+        # the original content is shown in place of the plots
+        self.assertIn('Period: x', html)
+        visualization = TaskGradingStatusFileVisualization.objects.get(
+                task_grading_status_file_fk=self.logic_schema_file)
+        self.assertEqual(visualization.parse_error, 'Parsing error: file format is not correct')
@@ -0,0 +1,162 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.urlresolvers import reverse
+from django.test import SimpleTestCase
+from django.test import TestCase
+from django.test import override_settings
+
+from guardian.shortcuts import assign_perm
+
+from serapis.models import *
+from serapis.tests import grading_fixtures
+from serapis.utils import file_schema
+from serapis.utils import visualization_artifacts
+from serapis.utils.visualizer_manager import VisualizerManager
+from serapis.utils.visualizers.stm32_waveform_visualizer import STM32WaveformVisualizer
+
+
+K_WAVEFORM_CONTENT = '\n'.join([
+    'Period: 20',
+    'Tick frequency: 5000',
+    'Display start',
+    'CTL,0',
+    'Display end',
+    '==',
+    '68, 0, 0',
+    '68, 30000, 1',
+]).encode('ascii')
+
+K_GENERATE_VISUALIZATION = 'serapis.utils.visualization_artifacts.generate_visualization'
+
+
+class TaskGradingVisualizationViewTestCase(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media_settings = override_settings(MEDIA_ROOT=media_root)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        assignment, _ = grading_fixtures.create_assignment()
+        TaskGradingStatusFileSchema.objects.create(assignment_fk=assignment,
+                field='trace.stm32.waveform')
+        TaskGradingStatusFileSchema.objects.create(assignment_fk=assignment, field='log')
+        TaskGradingStatusFileSchema.objects.create(assignment_fk=assignment, field='missing')
+
+        _, (self.task,) = grading_fixtures.create_submission(assignment, 'alice')
+        assign_perm('view_assignment', User.objects.get(username='alice'), assignment.course_fk)
+        file_schema.create_empty_task_grading_status_schema_files(self.task)
+        output_files = file_schema.get_dict_schema_name_to_task_grading_status_schema_files(
+                self.task)
+        self.schema_file = output_files['trace.stm32.waveform']
+        self.schema_file.file.save('trace.txt', ContentFile(K_WAVEFORM_CONTENT))
+        output_files['log'].file.save('log.txt', ContentFile(b'hello from the testbed'))
+        self.task = grading_fixtures.set_task_state(self.task, TaskGradingStatus.STAT_FINISH,
+                execution_status=TaskGradingStatus.EXEC_OK, points=10.)
+
+        User.objects.create_user(username='mallory', password='password')
+
+    def _get_visualization(self, username, field_name, visualizer_id=0, is_ajax=True):
+        self.client.login(username=username, password='password')
+        extra = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'} if is_ajax else {}
+        return self.client.get(
+                reverse('ajax-get-task-grading-visualization', args=(self.task.id,)),
+                {'field_name': field_name, 'visualizer_id': visualizer_id}, **extra)
+
+    def assertBadRequest(self, response, message):
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.content, message)
+        # errors are not kept by the browser
+        self.assertNotIn('max-age', response.get('Cache-Control', ''))
+
+    def assertCached(self, response):
+        self.assertEqual(response.status_code, 200)
+        cache_control = set(response['Cache-Control'].split(', '))
+        self.assertEqual(cache_control, set(['private', 'max-age=86400']))
+
+    def test_permission(self):
+        self.assertBadRequest(self._get_visualization('mallory', 'log'), b'Not enough privilege')
+        self.assertBadRequest(self._get_visualization('alice', 'log', is_ajax=False),
+                b'Not enough privilege')
+
+    def test_invalid_parameters(self):
+        self.assertBadRequest(self._get_visualization('alice', 'log', visualizer_id='x'),
+                b'Invalid parameters')
+        self.assertBadRequest(self._get_visualization('alice', 'nothing'),
+                b'Output file cannot be found')
+        self.assertBadRequest(self._get_visualization('alice', 'missing'),
+                b'Output file cannot be found')
+
+    def test_plain_text_is_rendered_from_file(self):
+        with mock.patch(K_GENERATE_VISUALIZATION) as generate_visualization:
+            response = self._get_visualization('alice', 'log', visualizer_id=1)
+        self.assertCached(response)
+        self.assertIn(b'hello from the testbed', response.content)
+        self.assertFalse(generate_visualization.called)
+        self.assertEqual(TaskGradingStatusFileVisualization.objects.count(), 0)
+
+    def test_stored_waveform_is_served(self):
+        visualization_artifacts.generate_visualization(
+                self.task, 'trace.stm32.waveform', self.schema_file, 0)
+        stored_html = visualization_artifacts.get_stored_visualization_html(self.schema_file, 0)
+
+        with mock.patch(K_GENERATE_VISUALIZATION) as generate_visualization:
+            response = self._get_visualization('alice', 'trace.stm32.waveform')
+        self.assertCached(response)
+        self.assertEqual(response.content.decode('utf-8'), stored_html)
+        self.assertFalse(generate_visualization.called)
+
+    def test_waveform_is_regenerated(self):
+        # nothing is stored yet
+        response = self._get_visualization('alice', 'trace.stm32.waveform', visualizer_id=0)
+        self.assertCached(response)
+        self.assertIn(b'vis0', response.content)
+        visualization = TaskGradingStatusFileVisualization.objects.get(
+                task_grading_status_file_fk=self.schema_file)
+        self.assertEqual(visualization.visualizer_id, 0)
+
+        # the stored visualization belongs to another visualizer id
+        response = self._get_visualization('alice', 'trace.stm32.waveform', visualizer_id=2)
+        self.assertCached(response)
+        self.assertIn(b'vis2', response.content)
+        self.assertNotIn(b'vis0', response.content)
+        visualization.refresh_from_db()
+        self.assertEqual(visualization.visualizer_id, 2)
+
+
+class AddLazyFileTestCase(SimpleTestCase):
+
+    def test_visualizer_id_is_appended(self):
+        visualizer_manager = VisualizerManager()
+        visualizer_manager.add_lazy_file('log', '/log.txt', '/visualization/?field_name=log')
+        visualizer_manager.add_lazy_file('trace.stm32.waveform', '/trace.txt', '/visualization/')
+
+        visualizations = visualizer_manager.get_visualizations()
+        self.assertEqual(visualizations, [
+                {
+                    'field_name': 'log',
+                    'html': None,
+                    'url': '/log.txt',
+                    'visualization_url': '/visualization/?field_name=log&visualizer_id=0',
+                },
+                {
+                    'field_name': 'trace.stm32.waveform',
+                    'html': None,
+                    'url': '/trace.txt',
+                    'visualization_url': '/visualization/?visualizer_id=1',
+                },
+        ])
+
+    def test_assets_of_lazy_files(self):
+        visualizer_manager = VisualizerManager()
+        visualizer_manager.add_lazy_file('a.stm32.waveform', '/a.txt', '/visualization/')
+        visualizer_manager.add_lazy_file('b.stm32.waveform', '/b.txt', '/visualization/')
+
+        # the assets are requested once, even if several files share the same visualizer
+        self.assertEqual(visualizer_manager.js_files, STM32WaveformVisualizer.get_js_files())
+        self.assertEqual(visualizer_manager.css_files, STM32WaveformVisualizer.get_css_files())
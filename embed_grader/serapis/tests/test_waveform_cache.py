@@ -0,0 +1,217 @@
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+
+from serapis.utils.visualizers.fileio import waveform_cache
+from serapis.utils.visualizers.fileio.waveform_cache import WaveformCache
+from serapis.utils.visualizers.fileio.waveform_cache import CachedWaveform
+from serapis.utils.visualizers.fileio.waveform_query_base import WaveformData
+from serapis.utils.visualizers.fileio.stm32_waveform_file_reader import STM32WaveformFileReader
+from serapis.utils.visualizers.waveform_pyramid import get_plot_pyramid
+from serapis.utils.visualizers.waveform_pyramid import get_plot_event_series
+
+
+def _make_cached_waveform(num_events):
+    data = WaveformData(range(num_events), [0] * num_events)
+    return CachedWaveform(float(num_events - 1), None, [{'name': 'CLK', 'pins': [0]}], data)
+
+
+class WaveformCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_evict_least_recently_used(self):
+        # each waveform of 10 events takes 160 bytes
+        cache = WaveformCache(max_num_bytes=400)
+        cache.put('a', _make_cached_waveform(10))
+        cache.put('b', _make_cached_waveform(10))
+        self.assertIsNotNone(cache.get('a'))
+
+        cache.put('c', _make_cached_waveform(10))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
+        self.assertEqual(cache.num_bytes, 320)
+
+        # too large to be cached
+        cache.put('d', _make_cached_waveform(100))
+        self.assertIsNone(cache.get('d'))
+        self.assertEqual(cache.num_bytes, 320)
+
+    def test_derived_objects(self):
+        cache = WaveformCache(max_num_bytes=400)
+        cache.put('a', _make_cached_waveform(10))
+        cache.put('b', _make_cached_waveform(10))
+
+        # not stored without the waveform, or if the entry would not fit
+        cache.put_derived('c', 'pyramid', 'c-pyramid', 10)
+        self.assertIsNone(cache.get_derived('c', 'pyramid'))
+        cache.put_derived('a', 'pyramid', 'a-pyramid', 300)
+        self.assertIsNone(cache.get_derived('a', 'pyramid'))
+
+        # derived objects count towards the size, hence 'b' is evicted
+        cache.put_derived('a', 'pyramid', 'a-pyramid', 100)
+        self.assertEqual(cache.get_derived('a', 'pyramid'), 'a-pyramid')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.num_bytes, 260)
+
+        # replaced, and evicted along with the waveform
+        cache.put_derived('a', 'pyramid', 'a-pyramid-2', 80)
+        self.assertEqual(cache.num_bytes, 240)
+        cache.put('c', _make_cached_waveform(10))
+        cache.put('d', _make_cached_waveform(10))
+        self.assertIsNone(cache.get_derived('a', 'pyramid'))
+        self.assertEqual(cache.num_bytes, 320)
+
+    def test_disk_tier(self):
+        disk_dir = os.path.join(self.tmp_dir, 'waveform_cache')
+        cache = WaveformCache(disk_dir=disk_dir)
+        cache.put('a', _make_cached_waveform(10))
+
+        # a new process only sees the disk tier
+        cache = WaveformCache(disk_dir=disk_dir)
+        cached_waveform = cache.get('a')
+        self.assertEqual(cached_waveform.period_sec, 9.)
+        self.assertEqual(cached_waveform.display_params, [{'name': 'CLK', 'pins': [0]}])
+        self.assertEqual(list(cached_waveform.data), [(float(i), 0) for i in range(10)])
+        self.assertIsNone(cache.get('b'))
+
+    def test_reader_uses_cache(self):
+        raw_content = '\n'.join([
+            'Period: 20',
+            'Tick frequency: 5000',
+            'Display start',
+            'CTL,0',
+            'Display end',
+            '==',
+            '68, 0, 0',
+            '68, 30000, 1',
+        ]).encode('ascii')
+        key = WaveformCache.compute_key('stm32', raw_content)
+        waveform_cache.get_waveform_cache().clear()
+
+        reader = STM32WaveformFileReader(raw_content)
+        self.assertIsNotNone(waveform_cache.get_waveform_cache().get(key))
+
+        cached_reader = STM32WaveformFileReader(raw_content)
+        self.assertTrue(cached_reader.is_successfully_parsed())
+        self.assertIs(cached_reader.data, reader.data)
+        self.assertEqual(cached_reader.get_tick_frequency(), 5000.)
+        self.assertEqual(cached_reader.get_event_series(0), reader.get_event_series(0))
+
+    def test_stored_file_key(self):
+        raw_content = '\n'.join([
+            'Period: 20',
+            'Tick frequency: 5000',
+            'Display start',
+            'CTL,0',
+            'Display end',
+            '==',
+            '68, 0, 0',
+            '68, 30000, 1',
+        ]).encode('ascii')
+        path = os.path.join(self.tmp_dir, 'trace.txt')
+        with open(path, 'wb') as f:
+            f.write(raw_content)
+        key = WaveformCache.compute_stored_file_key('stm32', path)
+        self.assertEqual(WaveformCache.compute_stored_file_key('stm32', path), key)
+        self.assertNotEqual(WaveformCache.compute_stored_file_key('logicsaleae', path), key)
+        waveform_cache.get_waveform_cache().clear()
+
+        self.assertIsNone(STM32WaveformFileReader.from_cache(key))
+        reader = STM32WaveformFileReader(raw_content, cache_key=key)
+        cached_reader = STM32WaveformFileReader.from_cache(key)
+        self.assertEqual(cached_reader.cache_key, key)
+        self.assertIs(cached_reader.data, reader.data)
+        self.assertEqual(cached_reader.get_tick_frequency(), 5000.)
+
+        # a modified file gets another key
+        with open(path, 'ab') as f:
+            f.write(b'\n68, 40000, 0')
+        self.assertNotEqual(WaveformCache.compute_stored_file_key('stm32', path), key)
+
+    def test_edge_index_is_not_shared(self):
+        raw_content = '\n'.join([
+            'Period: 20',
+            'Tick frequency: 5000',
+            'Display start',
+            'CTL,0',
+            'Display end',
+            '==',
+            '68, 0, 0',
+            '68, 30000, 1',
+        ]).encode('ascii')
+        waveform_cache.get_waveform_cache().clear()
+        reader = STM32WaveformFileReader(raw_content)
+
+        # the indexed reader shares the columns, but not the index, with the cached waveform
+        indexed_reader = STM32WaveformFileReader(raw_content, build_edge_index=True)
+        self.assertIsNotNone(indexed_reader.data.edge_index)
+        self.assertIs(indexed_reader.data.timestamps, reader.data.timestamps)
+        self.assertIsNone(reader.data.edge_index)
+        self.assertIsNone(STM32WaveformFileReader(raw_content).data.edge_index)
+        self.assertEqual(indexed_reader._get_rising_edge_events(indexed_reader.data, 0),
+                reader._get_rising_edge_events(reader.data, 0))
+
+    def test_plot_pyramid_is_cached(self):
+        raw_content = '\n'.join([
+            'Period: 20',
+            'Tick frequency: 5000',
+            'Display start',
+            'CTL,0',
+            'Display end',
+            '==',
+            '68, 0, 0',
+            '68, 30000, 1',
+        ]).encode('ascii')
+        waveform_cache.get_waveform_cache().clear()
+
+        plot_name, pyramid = get_plot_pyramid(STM32WaveformFileReader(raw_content), 0)
+        self.assertEqual(plot_name, 'CTL')
+        self.assertEqual(pyramid.get_event_series(100)[0].tolist(), [0., 6000., 20000.])
+
+        # built again for another time unit, but not for another reader of the same file
+        reader = STM32WaveformFileReader(raw_content)
+        self.assertIs(get_plot_pyramid(reader, 0)[1], pyramid)
+        self.assertIsNot(get_plot_pyramid(reader, 0, time_scale=1e3)[1], pyramid)
+
+        # a reader which does not use the cache builds a new one
+        reader.cache_key = None
+        self.assertIsNot(get_plot_pyramid(reader, 0)[1], pyramid)
+
+    def test_window_without_pyramid(self):
+        raw_content = '\n'.join([
+            'Period: 20',
+            'Tick frequency: 5000',
+            'Display start',
+            'CTL,0',
+            'Display end',
+            '==',
+            '68, 0, 0',
+            '68, 30000, 1',
+        ]).encode('ascii')
+        waveform_cache.get_waveform_cache().clear()
+        reader = STM32WaveformFileReader(raw_content)
+
+        # a window only slices the events, and does not build the pyramid
+        plot_name, timestamps, values = get_plot_event_series(reader, 0, 100, 2000., 10000.)
+        self.assertEqual(plot_name, 'CTL')
+        self.assertEqual(timestamps.tolist(), [2000., 6000., 10000.])
+        self.assertEqual(values.tolist(), [0, 1, 1])
+        self.assertIsNone(waveform_cache.load_derived(reader, 'pyramid-0-1.0'))
+
+        # a window before the waveform starts is empty
+        _, timestamps, values = get_plot_event_series(reader, 0, 100, -5000., -1000.)
+        self.assertEqual(timestamps.tolist(), [0.])
+
+        # the whole plot builds the pyramid, which serves the windows from now on
+        get_plot_event_series(reader, 0, 100)
+        self.assertIsNotNone(waveform_cache.load_derived(reader, 'pyramid-0-1.0'))
+        _, timestamps, values = get_plot_event_series(reader, 0, 100, 2000., 10000.)
+        self.assertEqual(timestamps.tolist(), [2000., 6000., 10000.])
@@ -0,0 +1,82 @@
+import numpy
+
+from django.test import TestCase
+
+from serapis.utils.visualizers.waveform_pyramid import WaveformPyramid
+from serapis.utils.visualizers.waveform_pyramid import downsample_event_series
+
+
+class WaveformPyramidTestCase(TestCase):
+
+    def test_few_transitions_are_exact(self):
+        pyramid = WaveformPyramid([0., 1., 2., 5., 10.], [0, 1, 0, 3, 3])
+
+        timestamps, values = pyramid.get_event_series(num_pixels=100)
+        self.assertEqual(timestamps.tolist(), [0., 1., 2., 5., 10.])
+        self.assertEqual(values.tolist(), [0, 1, 0, 3, 3])
+
+        timestamps, values = pyramid.get_event_series(num_pixels=100, start_time=1.5,
+                end_time=7.)
+        self.assertEqual(timestamps.tolist(), [1.5, 2., 5., 7.])
+        self.assertEqual(values.tolist(), [1, 0, 3, 3])
+
+    def test_busy_waveform_is_bounded(self):
+        # a clock which toggles every 1 time unit, with a single glitch to 7 in the middle
+        num_events = 100000
+        timestamps = numpy.arange(num_events + 1, dtype=numpy.float64)
+        values = numpy.arange(num_events + 1, dtype=numpy.uint64) % 2
+        values[50001] = 7
+        pyramid = WaveformPyramid(timestamps, values)
+
+        num_pixels = 100
+        ds_timestamps, ds_values = pyramid.get_event_series(num_pixels)
+        self.assertLessEqual(len(ds_timestamps), 4 * num_pixels + 4)
+        self.assertEqual(ds_timestamps[0], 0.)
+        self.assertEqual(ds_timestamps[-1], num_events)
+        self.assertTrue((numpy.diff(ds_timestamps) > 0).all())
+        self.assertEqual(ds_values.max(), 7)
+        self.assertEqual(ds_values.min(), 0)
+
+        # zoom in the glitch
+        ds_timestamps, ds_values = pyramid.get_event_series(num_pixels, start_time=49990.,
+                end_time=50010.)
+        self.assertEqual(ds_timestamps.tolist(), list(range(49990, 50011)))
+        self.assertEqual(ds_values.tolist()[10:13], [0, 7, 0])
+
+    def test_deep_zoom_is_downsampled_from_events(self):
+        # the finest level has 16 buckets of 6250 time units, far wider than a pixel of the window
+        num_events = 100000
+        timestamps = numpy.arange(num_events + 1, dtype=numpy.float64)
+        values = numpy.arange(num_events + 1, dtype=numpy.uint64) % 2
+        values[50001] = 7
+        pyramid = WaveformPyramid(timestamps, values, max_num_buckets=16)
+
+        num_pixels = 100
+        ds_timestamps, ds_values = pyramid.get_event_series(num_pixels, start_time=45000.5,
+                end_time=55000.5)
+        self.assertLessEqual(len(ds_timestamps), 4 * num_pixels + 4)
+        self.assertEqual(ds_timestamps[0], 45000.5)
+        self.assertEqual(ds_timestamps[-1], 55000.5)
+        self.assertTrue((numpy.diff(ds_timestamps) > 0).all())
+        self.assertEqual(ds_values.max(), 7)
+
+        # every pixel is resolved, instead of one step per coarse bucket
+        self.assertGreaterEqual(len(ds_timestamps), 2 * num_pixels)
+
+    def test_downsample_event_series(self):
+        timestamps = numpy.array([2., 3., 4., 6.])
+        values = numpy.array([1, 0, 1, 1], dtype=numpy.uint64)
+        ds_timestamps, ds_values = downsample_event_series(timestamps, values, num_pixels=100)
+        self.assertEqual(ds_timestamps.tolist(), [2., 3., 4., 6.])
+        self.assertEqual(ds_values.tolist(), [1, 0, 1, 1])
+
+        timestamps = numpy.arange(10001, dtype=numpy.float64)
+        values = numpy.arange(10001, dtype=numpy.uint64) % 2
+        ds_timestamps, ds_values = downsample_event_series(timestamps, values, num_pixels=10)
+        self.assertLessEqual(len(ds_timestamps), 4 * 10 + 4)
+        self.assertEqual((ds_timestamps[0], ds_timestamps[-1]), (0., 10000.))
+
+    def test_num_bytes(self):
+        pyramid = WaveformPyramid(numpy.arange(8.), numpy.zeros(8, dtype=numpy.uint64))
+        # 8 events of 16 bytes, and 1 + 2 + 4 + 8 buckets of 16 bytes
+        self.assertEqual(pyramid.get_num_bytes(), 8 * 16 + 15 * 16)
@@ -1,6 +1,9 @@
+import numpy
+
 from django.test import TestCase
 
 from serapis.utils.visualizers.fileio.waveform_query_base import WaveformQueryBase
+from serapis.utils.visualizers.fileio.waveform_query_base import WaveformData
 
 
 class MinimumWaveformQueryHelper(WaveformQueryBase):
@@ -110,6 +113,20 @@ class WaveformFileWriterTestCase(TestCase):
                 [(0.0, 7), (0.3, 4), (2.2, 16), (3.0, 4), (4.5, 45), (5.0, 45)],
         )
 
+    def test_clean_waveform_method_returns_columns(self):
+        helper = MinimumWaveformQueryHelper()
+
+        period_sec = 3.0
+        data = WaveformData.from_events([(2.0, 20), (0.5, 5)])
+
+        output_data = helper._clean_waveform(data, period_sec)
+
+        self.assertEqual(output_data.timestamps.tolist(), [0.0, 0.5, 2.0, 3.0])
+        self.assertEqual(output_data.values.tolist(), [0, 5, 20, 20])
+        self.assertEqual(len(output_data), 4)
+        self.assertEqual(output_data[1], (0.5, 5))
+        self.assertEqual(list(output_data), [(0.0, 0), (0.5, 5), (2.0, 20), (3.0, 20)])
+
     def test_get_event_series(self):
         helper = MinimumWaveformQueryHelper()
 
@@ -150,6 +167,14 @@ class WaveformFileWriterTestCase(TestCase):
                 [(11.5, 1), (12.0, 2), (13.0, 3), (14.0, 2), (14.5, 2)],
         )
         
+        # test a time range between two events
+        output_series = helper._get_event_series(data, pin_indexes=[1, 0],
+                start_time_sec=5.2, end_time_sec=5.8)
+        self.assertEqual(
+                output_series,
+                [(5.2, 1), (5.8, 1)],
+        )
+        
         # test exeeding time bounds
         output_series = helper._get_event_series(data, pin_indexes=3,
                 start_time_sec=-100, end_time_sec=100)
@@ -158,6 +183,16 @@ class WaveformFileWriterTestCase(TestCase):
                 [(0.0, 0), (8.0, 1), (15.0, 1)],
         )
 
+    def test_rearrange_bus_values(self):
+        helper = MinimumWaveformQueryHelper()
+
+        bus_values = numpy.arange(256, dtype=numpy.uint64)
+        for pin_indexes in [[3], [7, 6, 5, 4], [0, 2, 4, 6, 1], [1, 1, 0], [5, 4, 0, 7]]:
+            self.assertEqual(
+                    helper._rearrange_bus_values(pin_indexes, bus_values).tolist(),
+                    [helper._rearrange_bus(pin_indexes, v) for v in range(256)],
+            )
+
     def test_get_rising_and_falling_edge_events(self):
         helper = MinimumWaveformQueryHelper()
 
@@ -186,7 +221,61 @@ class WaveformFileWriterTestCase(TestCase):
                 output,
                 [],
         )
+
+        # an edge right on the start bound is included
+        output = helper._get_rising_edge_events(
+                data, pin_index=1, start_time_sec=6, end_time_sec=10.5)
+        self.assertEqual(
+                output,
+                [6.0, 10.0],
+        )
     
+    def test_edge_index(self):
+        helper = MinimumWaveformQueryHelper()
+
+        data = WaveformData.from_events([(float(i), i) for i in range(16)])
+        indexed_data = WaveformData(data.timestamps, data.values)
+        indexed_data.build_edge_index()
+
+        for pin_index in range(6):
+            for start_time_sec, end_time_sec in [(None, None), (2, 12), (6, 10.5), (3.5, 3.7)]:
+                self.assertEqual(
+                        helper._get_rising_edge_events(
+                                indexed_data, pin_index, start_time_sec, end_time_sec),
+                        helper._get_rising_edge_events(
+                                data, pin_index, start_time_sec, end_time_sec),
+                )
+                self.assertEqual(
+                        helper._get_falling_edge_events(
+                                indexed_data, pin_index, start_time_sec, end_time_sec),
+                        helper._get_falling_edge_events(
+                                data, pin_index, start_time_sec, end_time_sec),
+                )
+
+        self.assertEqual(helper._count_rising_edge_events(indexed_data, pin_index=0), 8)
+        self.assertEqual(
+                helper._count_falling_edge_events(indexed_data, pin_index=1, start_time_sec=5),
+                2,
+        )
+
+    def test_get_pulse_widths(self):
+        helper = MinimumWaveformQueryHelper()
+
+        data = [(float(i), i) for i in range(16)]
+
+        self.assertEqual(
+                helper._get_pulse_widths(data, pin_index=1),
+                [(2.0, 2.0), (6.0, 2.0), (10.0, 2.0)],
+        )
+        self.assertEqual(
+                helper._get_pulse_widths(data, pin_index=2, pulse_value=0, start_time_sec=1),
+                [(8.0, 4.0)],
+        )
+        self.assertEqual(
+                helper._get_pulse_widths(data, pin_index=1, start_time_sec=3, end_time_sec=11),
+                [(6.0, 2.0)],
+        )
+
     def test_get_rising_and_falling_edge_events(self):
         helper = MinimumWaveformQueryHelper()
 
@@ -229,3 +318,19 @@ class WaveformFileWriterTestCase(TestCase):
                 2,
         )
         
+
+    def test_get_bus_values(self):
+        helper = MinimumWaveformQueryHelper()
+
+        data = [(float(i), 30 - i) for i in range(16)]
+
+        query_times_sec = [-3.2, 0.0, 0.5, 15.1, 7.7, 15.0, float('nan')]
+        self.assertEqual(
+                helper._get_bus_values(data, [4, 3, 2, 1, 0], query_times_sec),
+                [None, 30, 30, None, 23, 15, None],
+        )
+
+        bus_values, in_range_mask = helper._get_bus_values_columns(
+                data, [1, 4], numpy.array([10.2, 20.0]))
+        self.assertEqual(bus_values.tolist(), [1, 0])
+        self.assertEqual(in_range_mask.tolist(), [True, False])
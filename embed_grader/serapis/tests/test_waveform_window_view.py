@@ -0,0 +1,156 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.urlresolvers import reverse
+from django.db.models.fields.files import FieldFile
+from django.test import TestCase
+
+from guardian.shortcuts import assign_perm
+
+from serapis.models import *
+from serapis.tests import grading_fixtures
+from serapis.utils import file_schema
+from serapis.utils import visualization_artifacts
+from serapis.utils.visualizers.fileio import waveform_cache
+from serapis.utils.visualizers.fileio.logic_saleae_waveform_file_reader import LogicSaleaeWaveformFileReader
+
+
+K_WAVEFORM_CONTENT = '\n'.join([
+    'Period: 20',
+    'Tick frequency: 5000',
+    'Display start',
+    'CTL,0',
+    'Display end',
+    '==',
+    '68, 0, 0',
+    '68, 30000, 1',
+]).encode('ascii')
+
+K_LOGIC_SALEAE_WAVEFORM_CONTENT = '\n'.join([
+    'Period: 1',
+    'Display start',
+    'CTL,0',
+    'Display end',
+    '==',
+    'Time[s], Data[Hex]',
+    '0.000000000000000, 0',
+    '0.600000000000000, 1',
+]).encode('ascii')
+
+
+class WaveformWindowViewTestCase(TestCase):
+
+    def setUp(self):
+        assignment, _ = grading_fixtures.create_assignment()
+        TaskGradingStatusFileSchema.objects.create(assignment_fk=assignment,
+                field='trace.stm32.waveform')
+        TaskGradingStatusFileSchema.objects.create(assignment_fk=assignment,
+                field='missing.stm32.waveform')
+        TaskGradingStatusFileSchema.objects.create(assignment_fk=assignment,
+                field='trace.logicsaleae.waveform')
+
+        _, (self.task,) = grading_fixtures.create_submission(assignment, 'alice')
+        assign_perm('view_assignment', User.objects.get(username='alice'), assignment.course_fk)
+        file_schema.create_empty_task_grading_status_schema_files(self.task)
+        output_files = file_schema.get_dict_schema_name_to_task_grading_status_schema_files(
+                self.task)
+        output_files['trace.stm32.waveform'].file.save('trace.txt',
+                ContentFile(K_WAVEFORM_CONTENT))
+        output_files['trace.logicsaleae.waveform'].file.save('logic.txt',
+                ContentFile(K_LOGIC_SALEAE_WAVEFORM_CONTENT))
+        self.task = grading_fixtures.set_task_state(self.task, TaskGradingStatus.STAT_FINISH,
+                execution_status=TaskGradingStatus.EXEC_OK, points=10.)
+
+        User.objects.create_user(username='mallory', password='password')
+
+    def _get_window(self, username, is_ajax=True, **params):
+        self.client.login(username=username, password='password')
+        query = {'field_name': 'trace.stm32.waveform', 'plot_idx': 0, 'start': 2000.,
+                'end': 10000.}
+        query.update(params)
+        extra = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'} if is_ajax else {}
+        return self.client.get(reverse('ajax-get-waveform-window', args=(self.task.id,)),
+                query, **extra)
+
+    def test_window(self):
+        response = self._get_window('alice')
+        self.assertEqual(response.status_code, 200)
+        # the clock rises at 6000 ms
+        ajax_json = response.json()
+        self.assertEqual(ajax_json['timestamps'][0], 2000.)
+        self.assertIn(6000., ajax_json['timestamps'])
+        self.assertAlmostEqual(ajax_json['timestamps'][-1], 10000., places=2)
+        self.assertEqual(ajax_json['values'][0], 0)
+        self.assertEqual(ajax_json['values'][-1], 1)
+
+    def test_logic_saleae_window_is_read_from_file(self):
+        with mock.patch.object(LogicSaleaeWaveformFileReader, 'from_file',
+                wraps=LogicSaleaeWaveformFileReader.from_file) as from_file:
+            response = self._get_window('alice', field_name='trace.logicsaleae.waveform',
+                    start=200000., end=800000.)
+        self.assertEqual(from_file.call_count, 1)
+        self.assertEqual(response.status_code, 200)
+        # the signal rises at 0.6 s, in microseconds
+        ajax_json = response.json()
+        self.assertEqual(ajax_json['timestamps'][0], 200000.)
+        self.assertIn(600000., ajax_json['timestamps'])
+        self.assertEqual(ajax_json['values'][0], 0)
+        self.assertEqual(ajax_json['values'][-1], 1)
+
+    def _get_window_without_reading(self, field_name):
+        """
+        Returns:
+          (response, whether the stored file is read)
+        """
+        read = mock.Mock(side_effect=AssertionError('The file should not be read'))
+        with mock.patch.object(FieldFile, 'read', new_callable=mock.PropertyMock,
+                return_value=read):
+            response = self._get_window('alice', field_name=field_name)
+        return (response, read.called)
+
+    def test_cached_window_does_not_read_file(self):
+        for field_name in ['trace.stm32.waveform', 'trace.logicsaleae.waveform']:
+            waveform_cache.get_waveform_cache().clear()
+            expected_response = self._get_window('alice', field_name=field_name)
+            self.assertEqual(expected_response.status_code, 200)
+
+            response, is_read = self._get_window_without_reading(field_name)
+            self.assertFalse(is_read, field_name)
+            self.assertEqual(response.json(), expected_response.json())
+
+    def test_stored_visualization_warms_window_cache(self):
+        waveform_cache.get_waveform_cache().clear()
+        visualization_artifacts.generate_visualizations(self.task)
+
+        response, is_read = self._get_window_without_reading('trace.stm32.waveform')
+        self.assertFalse(is_read)
+        self.assertEqual(response.status_code, 200)
+
+    def test_permission(self):
+        response = self._get_window('mallory')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.content, b'Not enough privilege')
+
+        response = self._get_window('alice', is_ajax=False)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.content, b'Not enough privilege')
+
+    def test_invalid_file(self):
+        response = self._get_window('alice', field_name='nothing.stm32.waveform')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.content, b'Output file cannot be found')
+
+        # the schema exists, but the task did not produce the file
+        response = self._get_window('alice', field_name='missing.stm32.waveform')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.content, b'Output file cannot be found')
+
+    def test_invalid_plot(self):
+        response = self._get_window('alice', plot_idx=1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.content, b'The file cannot be plotted')
+
+        response = self._get_window('alice', plot_idx='x')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.content, b'Invalid parameters')
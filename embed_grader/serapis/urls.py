@@ -66,6 +66,9 @@ urlpatterns = [
     url(r'^all-submission-logs-as-student/$', submissions.all_submission_logs_as_student, name='all-submission-logs-as-student'),
     url(r'^task-grading-detail/(?P<task_grading_id>[0-9]+)/$', submissions.task_grading_detail, name='task-grading-detail'),
     url(r'^regrade/(?P<assignment_id>[0-9]+)/$', submissions.regrade, name='regrade'),
+    url(r'^ajax-get-task-grading-visualization/(?P<task_grading_id>[0-9]+)/$', submissions.ajax_get_task_grading_visualization, name='ajax-get-task-grading-visualization'),
+    url(r'^ajax-get-output-file-text-page/(?P<task_grading_id>[0-9]+)/$', submissions.ajax_get_output_file_text_page, name='ajax-get-output-file-text-page'),
+    url(r'^ajax-get-waveform-window/(?P<task_grading_id>[0-9]+)/$', submissions.ajax_get_waveform_window, name='ajax-get-waveform-window'),
 
     ## Testbed and Hardware pages
     url(r'^testbed-type-list/$', testbeds.testbed_type_list, name='testbed-type-list'),
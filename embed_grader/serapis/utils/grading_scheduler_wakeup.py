@@ -0,0 +1,108 @@
+import select
+import threading
+
+from django.db import connection
+from django.db import transaction
+from django.db import DatabaseError
+
+
+K_CHANNEL_NAME = 'serapis_grading_scheduler'
+
+# Process-local fallback for databases without LISTEN/NOTIFY (e.g., SQLite in tests). It only
+# wakes up a scheduler living in the same process; other processes rely on the scheduler timeout.
+_local_wakeup_event = threading.Event()
+
+
+class GradingSchedulerWakeup():
+    """
+    `GradingSchedulerWakeup` is a helper class that lets the grading scheduler sleep until a task or
+    a testbed changes its state, instead of polling the database on a fixed cycle. Similar to
+    `GradingSchedulerHeartbeat`, it should be used in two scenarios: (1) The grading scheduler
+    instantiates an object and calls `wait()` to sleep until a notification arrives or the timeout
+    expires. (2) Any code that changes the grading state (e.g., a new task is created, or a testbed
+    becomes available) should only call the class method `notify()` without instantiating objects.
+
+    On PostgreSQL the notification is delivered through LISTEN/NOTIFY, so it works across the web
+    server processes and the scheduler process. On other databases, only a process-local event is
+    available.
+    """
+
+    def __init__(self):
+        self.listening_raw_connection = None
+
+    def wait(self, timeout_sec):
+        """
+        Block until a notification is received or timeout_sec seconds have passed.
+
+        Returns:
+          `True` if woken up by a notification, `False` if timed out.
+        """
+        if _local_wakeup_event.is_set():
+            _local_wakeup_event.clear()
+            return True
+
+        if not self._is_listen_notify_supported():
+            notified = _local_wakeup_event.wait(timeout_sec)
+            _local_wakeup_event.clear()
+            return notified
+
+        raw_connection = self._ensure_listening()
+        if not raw_connection.notifies:
+            readable, _, _ = select.select([raw_connection], [], [], timeout_sec)
+            if readable:
+                raw_connection.poll()
+
+        notified = len(raw_connection.notifies) > 0
+        del raw_connection.notifies[:]
+        _local_wakeup_event.clear()
+        return notified
+
+    @classmethod
+    def notify(cls):
+        """
+        Wake up the grading scheduler. If the caller is inside a transaction, the notification is
+        deferred until the transaction commits, so that the scheduler always sees the new state.
+        """
+        transaction.on_commit(cls._send_notification)
+
+    @classmethod
+    def can_wake_up_other_processes(cls):
+        """
+        Returns:
+          `True` if a notification reaches a scheduler in another process. Otherwise the scheduler
+          has to poll, because the web server processes cannot wake it up.
+        """
+        return cls._is_listen_notify_supported()
+
+    @classmethod
+    def _send_notification(cls):
+        _local_wakeup_event.set()
+        if not cls._is_listen_notify_supported():
+            return
+
+        # A lost notification only delays the scheduler until its next timeout, hence it should
+        # never break the caller
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('NOTIFY %s' % K_CHANNEL_NAME)
+        except DatabaseError:
+            print('Warning: cannot notify the grading scheduler')
+
+    @classmethod
+    def _is_listen_notify_supported(cls):
+        return connection.vendor == 'postgresql'
+
+    def _ensure_listening(self):
+        """
+        Issue LISTEN on the current database connection. If Django has reconnected since the last
+        call, the subscription is gone with the old connection and we have to listen again.
+
+        Returns:
+          the underlying psycopg2 connection
+        """
+        connection.ensure_connection()
+        if self.listening_raw_connection is not connection.connection:
+            with connection.cursor() as cursor:
+                cursor.execute('LISTEN %s' % K_CHANNEL_NAME)
+            self.listening_raw_connection = connection.connection
+        return self.listening_raw_connection
@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import select
+import hashlib
+import builtins
+import tempfile
+import traceback
+import subprocess
+import collections
+
+"""
+A warm grading script worker is a long-lived python process which executes grading scripts on
+request, so that the interpreter startup and the imports of heavy modules (e.g., numpy and the
+waveform readers) are paid only once per worker instead of once per task.
+
+The worker and its owner talk through the stdin/stdout pipes of the worker, one JSON object per
+line:
+
+  request:  {"script_path": "/path/to/grading_script.py", "args": ["field:/path/to/file", ...]}
+  response: {"stdout": "<everything the grading script printed, as latin-1>"}
+
+The grading script is executed as if it were run by `python3 <script_path> <args>`, hence its
+output follows the same {"score", "detail"} JSON contract. Compiled grading scripts are cached by
+the hash of their content, so a modified grading script is always recompiled.
+
+The worker keeps the pipes on private file descriptors. While a grading script runs, file
+descriptor 1 points to a capture file, so that whatever reaches the real stdout, including
+`os.write(1, ...)`, `sys.__stdout__` and child processes, is captured the same way as the stdout
+pipe of a new process. Between two grading scripts, descriptors 0 and 1 point to /dev/null. The
+working directory, the environment variables, `sys.path` and the newly imported modules are
+restored after each grading script, and the worker is recycled after a number of grading scripts
+to bound whatever else a grading script may leave behind.
+
+This module should not import Django, because the worker process does not set up Django.
+"""
+
+K_PRELOADED_MODULES = [
+    'numpy',
+    'serapis.utils.visualizers.fileio.waveform_query_base',
+    'serapis.utils.visualizers.fileio.stm32_waveform_file_reader',
+    'serapis.utils.visualizers.fileio.logic_saleae_waveform_file_reader',
+]
+
+K_MAX_NUM_CACHED_SCRIPTS = 64
+
+K_MAX_NUM_RUNS_PER_WORKER = 200
+
+
+class GradingScriptWorkerError(Exception):
+    """
+    The worker process died or broke the protocol while executing a grading script, e.g., the
+    grading script called `os._exit()`.
+    """
+    pass
+
+
+class GradingScriptWorker(object):
+    """
+    `GradingScriptWorker` owns one warm worker process. It is not thread-safe, each thread should
+    use its own worker. The worker process is spawned lazily and is respawned if it exits or is
+    killed because of a timeout.
+    """
+
+    def __init__(self, working_dir=None, max_num_runs=K_MAX_NUM_RUNS_PER_WORKER):
+        """
+        Params:
+          working_dir: The working directory of the worker process. It should be the directory
+              that contains the `serapis` package so that the worker can preload the modules.
+          max_num_runs: Number of grading scripts a worker process executes before it is replaced
+              by a new one
+        """
+        self.working_dir = working_dir
+        self.max_num_runs = max_num_runs
+        self.proc = None
+        self.num_runs = 0
+
+    def run(self, script_path, args, timeout_sec=None):
+        """
+        Execute a grading script in the worker process.
+
+        Params:
+          script_path: A string, the path of the grading script
+          args: A list of strings, the command line arguments passed to the grading script
+          timeout_sec: The wall-clock time limit of the grading script, or None for no limit
+        Returns:
+          The bytes that the grading script printed to stdout
+        Raises:
+          - GradingScriptWorkerError if the worker process dies while executing the grading
+            script
+          - subprocess.TimeoutExpired if the grading script does not finish in time. The worker
+            process is killed in this case.
+        """
+        if self.proc is None or self.proc.poll() is not None or self.num_runs >= self.max_num_runs:
+            self._spawn()
+        self.num_runs += 1
+
+        request = json.dumps({'script_path': script_path, 'args': args}) + '\n'
+        try:
+            self.proc.stdin.write(request.encode())
+            self.proc.stdin.flush()
+        except OSError:
+            self.close()
+            raise GradingScriptWorkerError('Grading script worker is not reachable')
+
+        readable, _, _ = select.select([self.proc.stdout], [], [], timeout_sec)
+        if not readable:
+            self.close()
+            raise subprocess.TimeoutExpired([script_path] + args, timeout_sec)
+
+        line = self.proc.stdout.readline()
+        if not line:
+            self.close()
+            raise GradingScriptWorkerError('Grading script worker exited unexpectedly')
+
+        try:
+            return json.loads(line.decode())['stdout'].encode('latin-1')
+        except (ValueError, KeyError, TypeError):
+            self.close()
+            raise GradingScriptWorkerError('Grading script worker sent an invalid response')
+
+    def close(self):
+        if self.proc is None:
+            return
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.wait()
+        self.proc.stdin.close()
+        self.proc.stdout.close()
+        self.proc = None
+        self.num_runs = 0
+
+    def _spawn(self):
+        self.close()
+        self.proc = subprocess.Popen(
+                [sys.executable, '-m', 'serapis.utils.grading_script_worker'],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                cwd=self.working_dir,
+        )
+
+
+########################################################################
+#   The following functions are executed inside the worker process    #
+########################################################################
+
+# sha1 of the grading script content -> code object
+_compiled_scripts = collections.OrderedDict()
+
+def _preload_modules():
+    for module_name in K_PRELOADED_MODULES:
+        try:
+            __import__(module_name)
+        except ImportError:
+            pass
+
+def _get_compiled_script(script_path):
+    with open(script_path, 'rb') as f:
+        source = f.read()
+    key = hashlib.sha1(source).hexdigest()
+
+    if key in _compiled_scripts:
+        _compiled_scripts.move_to_end(key)
+        return _compiled_scripts[key]
+
+    code = compile(source, script_path, 'exec')
+    _compiled_scripts[key] = code
+    if len(_compiled_scripts) > K_MAX_NUM_CACHED_SCRIPTS:
+        _compiled_scripts.popitem(last=False)
+    return code
+
+def _run_script(script_path, args, devnull_fd):
+    """
+    Returns:
+      The bytes that the grading script wrote to stdout
+    """
+    saved_cwd = os.getcwd()
+    saved_environ = dict(os.environ)
+    saved_argv, saved_path = sys.argv, list(sys.path)
+    saved_module_names = set(sys.modules)
+    sys.argv = [script_path] + args
+    sys.path[0] = os.path.dirname(os.path.abspath(script_path))
+    script_globals = {
+            '__name__': '__main__',
+            '__file__': script_path,
+            '__builtins__': builtins,
+    }
+    with tempfile.TemporaryFile() as capture_file:
+        os.dup2(capture_file.fileno(), 1)
+        try:
+            code = _get_compiled_script(script_path)
+            exec(code, script_globals)
+        except SystemExit:
+            pass
+        except:
+            # same as a crashing interpreter, the error goes to stderr and the owner sees whatever
+            # has been printed so far
+            traceback.print_exc()
+        finally:
+            sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+            if not sys.stdout.closed:
+                sys.stdout.flush()
+            os.dup2(devnull_fd, 1)
+            if sys.stdout.closed:
+                # closing sys.stdout also closes descriptor 1, which is reopened above
+                sys.stdout = sys.__stdout__ = open(1, 'w', closefd=False)
+
+            os.chdir(saved_cwd)
+            os.environ.clear()
+            os.environ.update(saved_environ)
+            sys.argv, sys.path[:] = saved_argv, saved_path
+            for module_name in set(sys.modules) - saved_module_names:
+                del sys.modules[module_name]
+
+        capture_file.seek(0)
+        return capture_file.read()
+
+def main():
+    # The pipes are moved to private file descriptors and reserved for the protocol. The standard
+    # file descriptors are left to grading scripts.
+    protocol_in = os.fdopen(os.dup(0), 'rb')
+    protocol_out = os.fdopen(os.dup(1), 'wb')
+    devnull_fd = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull_fd, 0)
+    os.dup2(devnull_fd, 1)
+
+    _preload_modules()
+
+    for line in protocol_in:
+        request = json.loads(line.decode())
+        stdout = _run_script(request['script_path'], request['args'], devnull_fd)
+        protocol_out.write((json.dumps({'stdout': stdout.decode('latin-1')}) + '\n').encode())
+        protocol_out.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+import sys
+import json
+import queue
+import subprocess
+import threading
+import traceback
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from serapis.models import *
+from serapis.utils import file_schema
+from serapis.utils import result_cache
+from serapis.utils import send_mail_helper
+from serapis.utils import submission_helper
+from serapis.utils import team_helper
+from serapis.utils import visualization_artifacts
+from serapis.utils.grading_scheduler_wakeup import GradingSchedulerWakeup
+from serapis.utils.grading_script_worker import GradingScriptWorker
+from serapis.utils.grading_script_worker import GradingScriptWorkerError
+
+
+class GradingResultError(Exception):
+    """
+    The grading script printed a JSON object which does not follow the {"score", "detail"}
+    contract. Different from an output which is not JSON at all, grading the same output again
+    would fail the same way.
+    """
+    pass
+
+
+def get_grading_script_command(grading_task):
+    """
+    Build the command line to execute the grading script of a task. All the input files, the
+    submission files, and the output files are passed as `<schema name>:<file path>` arguments.
+
+    Returns:
+      A list of strings
+    """
+    assignment_task = grading_task.assignment_task_fk
+    submission = grading_task.submission_fk
+    cmd = ['python3', assignment_task.grading_script.path]
+    schema_files = {}
+    schema_files.update(file_schema.
+            get_dict_schema_name_to_assignment_task_schema_files(assignment_task))
+    schema_files.update(file_schema.
+            get_dict_schema_name_to_submission_schema_files(submission))
+    schema_files.update(file_schema.
+            get_dict_schema_name_to_task_grading_status_schema_files(grading_task))
+    for field in schema_files:
+        cmd.append('%s:%s' % (field, schema_files[field].file.path))
+    return cmd
+
+def run_grading_script(grading_task, timeout_sec=None, warm_worker=None):
+    """
+    Execute the grading script of a task and interpret the result. The grading script should print
+    a JSON object with `score` (a real number between 0 and 1) and `detail` (a string).
+
+    Params:
+      grading_task: A TaskGradingStatus object
+      timeout_sec: The wall-clock time limit of the grading script, or None for no limit
+      warm_worker: A GradingScriptWorker to execute the grading script, or None to spawn a new
+          python process
+    Returns:
+      (normalized_score, detail)
+    Raises:
+      - ValueError if the output of the grading script is not a JSON object
+      - GradingResultError if the JSON object does not include a numeric score and a string
+        detail
+      - subprocess.TimeoutExpired if the grading script does not finish in time
+      - GradingScriptWorkerError if the warm worker dies while executing the grading script
+    """
+    cmd = get_grading_script_command(grading_task)
+    if warm_worker is not None:
+        stdout = warm_worker.run(cmd[1], cmd[2:], timeout_sec)
+    else:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+        try:
+            stdout, _ = proc.communicate(timeout=timeout_sec)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            raise
+
+    result_pack = json.loads(stdout.decode('ascii'))
+    try:
+        normalized_score = float(result_pack['score'])
+        detail = result_pack['detail']
+    except (KeyError, TypeError, ValueError):
+        raise GradingResultError('Expect a numeric score and a detail, got %s' % (
+                json.dumps(result_pack)[:200]))
+    if not isinstance(detail, str):
+        raise GradingResultError('Expect the detail to be a string, got %s' % (
+                json.dumps(detail)[:200]))
+
+    normalized_score = min(1., max(0., normalized_score))
+    return (normalized_score, detail)
+
+
+class OutputCheckerPool(object):
+    """
+    `OutputCheckerPool` runs grading scripts of the tasks in `STAT_OUTPUT_TO_BE_CHECKED` status with
+    a fixed number of worker threads, each of which waits for one grading script process at a
+    time. Hence at most `num_workers` grading scripts are executed concurrently, and a slow grading
+    script does not hold back the caller (usually the grading scheduler).
+
+    Grading scripts are executed in parallel, but the results are committed to the database one at
+    a time, because updating a task also updates the counters of the submission it belongs to.
+
+    In the warm worker mode, each worker thread keeps a long-lived `GradingScriptWorker` process
+    instead of spawning a new python process per task.
+    """
+
+    def __init__(self, num_workers, timeout_sec, print_func=print, use_warm_workers=False):
+        """
+        Params:
+          num_workers: Number of grading scripts that can be executed at the same time
+          timeout_sec: The wall-clock time limit of each grading script
+          print_func: A function that takes a string, for logging
+          use_warm_workers: True to execute grading scripts in long-lived worker processes
+        """
+        self.timeout_sec = timeout_sec
+        self.print_func = print_func
+        self.use_warm_workers = use_warm_workers
+
+        self.task_queue = queue.Queue()
+        self.queued_task_ids = set()  # tasks either in the queue or being checked
+        self.queued_task_ids_lock = threading.Lock()
+        self.commit_lock = threading.Lock()
+
+        self.workers = []
+        for i in range(num_workers):
+            worker = threading.Thread(target=self._work, name=('output-checker-%d' % i))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, task_id):
+        """
+        Enqueue a task to be checked. A task which is already in the queue or being checked will
+        not be enqueued again.
+
+        Returns:
+          `True` if the task is enqueued
+        """
+        with self.queued_task_ids_lock:
+            if task_id in self.queued_task_ids:
+                return False
+            self.queued_task_ids.add(task_id)
+        self.task_queue.put(task_id)
+        return True
+
+    def get_queue_depth(self):
+        """
+        Returns:
+          Number of tasks which are waiting for a worker, not including the ones being checked
+        """
+        return self.task_queue.qsize()
+
+    def get_num_unfinished_tasks(self):
+        """
+        Returns:
+          Number of tasks which are either waiting for a worker or being checked
+        """
+        with self.queued_task_ids_lock:
+            return len(self.queued_task_ids)
+
+    def wait_until_done(self):
+        """
+        Block until all the submitted tasks are checked.
+        """
+        self.task_queue.join()
+
+    def _work(self):
+        warm_worker = (GradingScriptWorker(working_dir=settings.BASE_DIR)
+                if self.use_warm_workers else None)
+        while True:
+            task_id = self.task_queue.get()
+            # each worker thread has its own database connection, which is idle for as long as the
+            # queue is empty, hence it is checked before, and released after, every task as if the
+            # task were a request
+            close_old_connections()
+            try:
+                self._check_output(task_id, warm_worker)
+            except:
+                exc_type, exc_value, exc_tb = sys.exc_info()
+                traceback.print_exception(exc_type, exc_value, exc_tb)
+            finally:
+                close_old_connections()
+                with self.queued_task_ids_lock:
+                    self.queued_task_ids.discard(task_id)
+                self.task_queue.task_done()
+
+    def _check_output(self, task_id, warm_worker):
+        try:
+            grading_task = TaskGradingStatus.objects.get(id=task_id)
+        except TaskGradingStatus.DoesNotExist:
+            return
+
+        if grading_task.grading_status != TaskGradingStatus.STAT_OUTPUT_TO_BE_CHECKED:
+            return
+
+        detail = None
+        status_update_time = None
+        if grading_task.execution_status == TaskGradingStatus.EXEC_SEG_FAULT:
+            grading_status, points = TaskGradingStatus.STAT_FINISH, 0.0
+        else:
+            try:
+                normalized_score, detail = run_grading_script(
+                        grading_task, self.timeout_sec, warm_worker)
+                grading_status = TaskGradingStatus.STAT_FINISH
+                points = grading_task.assignment_task_fk.points * normalized_score
+                status_update_time = timezone.now()
+            except subprocess.TimeoutExpired:
+                # a grading script which exceeds the time limit will probably do so again, hence
+                # we do not send the task back to the queue
+                self.print_func('Grading script of task=%d exceeds %f seconds' % (
+                        task_id, self.timeout_sec))
+                grading_status, points = TaskGradingStatus.STAT_INTERNAL_ERROR, 0.0
+                detail = 'Grading script exceeded the time limit'
+            except GradingResultError as e:
+                # the grading script is broken, hence we do not send the task back to the queue
+                # either
+                self.print_func('Grading script of task=%d does not follow the contract: %s' % (
+                        task_id, e))
+                grading_status, points = TaskGradingStatus.STAT_INTERNAL_ERROR, 0.0
+                detail = 'Grading script output is invalid: %s' % e
+            except GradingScriptWorkerError as e:
+                # the worker process is respawned for the next task, but this grading script
+                # will probably kill it again
+                self.print_func('Grading script of task=%d breaks the worker: %s' % (task_id, e))
+                grading_status, points = TaskGradingStatus.STAT_INTERNAL_ERROR, 0.0
+                detail = 'Grading script worker failed: %s' % e
+            except ValueError:
+                exc_type, exc_value, exc_tb = sys.exc_info()
+                traceback.print_exception(exc_type, exc_value, exc_tb)
+                if grading_task.is_rescoring:
+                    # the stored outputs are checked again, and the task should not be sent to the
+                    # testbeds because of a broken grading script
+                    grading_status, points = TaskGradingStatus.STAT_INTERNAL_ERROR, 0.0
+                    detail = 'Grading script output is not a JSON object: %s' % exc_value
+                else:
+                    grading_status, points = TaskGradingStatus.STAT_PENDING, 0.0
+
+        with self.commit_lock:
+            is_committed = self._commit(
+                    task_id, grading_status, points, detail, status_update_time)
+
+        # the files are hashed and rendered outside the commit lock, so that it does not hold back
+        # the other workers
+        if is_committed and grading_status == TaskGradingStatus.STAT_FINISH:
+            self._remember_result(task_id)
+            self._generate_visualizations(task_id)
+
+    def _remember_result(self, task_id):
+        try:
+            result_cache.remember_result(TaskGradingStatus.objects.get(id=task_id))
+        except:
+            # the result simply cannot be reused by identical submissions
+            self.print_func('Cannot remember the result of task=%d' % task_id)
+            exc_type, exc_value, exc_tb = sys.exc_info()
+            traceback.print_exception(exc_type, exc_value, exc_tb)
+
+    def _generate_visualizations(self, task_id):
+        try:
+            visualization_artifacts.generate_visualizations(
+                    TaskGradingStatus.objects.get(id=task_id))
+        except:
+            # the visualizations will be rendered when they are requested
+            self.print_func('Cannot store the visualizations of task=%d' % task_id)
+            exc_type, exc_value, exc_tb = sys.exc_info()
+            traceback.print_exception(exc_type, exc_value, exc_tb)
+
+    def _commit(self, task_id, grading_status, points, detail, status_update_time):
+        """
+        Returns:
+          `True` if the result is committed, `False` if it is dropped
+        """
+        with transaction.atomic():
+            # reload the task, as well as the submission, because they may have been changed while
+            # the grading script was running (e.g., the task was regraded). The rows are locked so
+            # that another process checking the same task (e.g., the rescore command next to the
+            # grading daemon) waits here, and then sees that the task is no longer waiting.
+            grading_task = (TaskGradingStatus.objects.select_for_update()
+                    .select_related('submission_fk').get(id=task_id))
+            if grading_task.grading_status != TaskGradingStatus.STAT_OUTPUT_TO_BE_CHECKED:
+                self.print_func('Task=%d is no longer waiting to be checked, drop the result'
+                        % task_id)
+                return False
+
+            if detail is not None:
+                grading_task.grading_detail.save('description.txt', ContentFile(detail))
+
+            kwargs = {'points': points}
+            if status_update_time is not None:
+                kwargs['status_update_time'] = status_update_time
+            submission_helper.update_task_grading_status(
+                    grading_task, grading_status=grading_status, **kwargs)
+
+            # the task is sent back to the queue to be executed again
+            if grading_status == TaskGradingStatus.STAT_PENDING:
+                GradingSchedulerWakeup.notify()
+
+            num_graded_tasks = len(TaskGradingStatus.objects.filter(
+                    Q(grading_status=TaskGradingStatus.STAT_FINISH)
+                    | Q(grading_status=TaskGradingStatus.STAT_INTERNAL_ERROR),
+                    submission_fk=grading_task.submission_fk))
+            num_assignment_tasks = len(TaskGradingStatus.objects.filter(
+                    submission_fk=grading_task.submission_fk))
+            if num_graded_tasks == num_assignment_tasks:
+                submission = grading_task.submission_fk
+                submission.status = Submission.STAT_GRADED
+                submission.save()
+
+                # send email to the student
+                #subject = 'Your submission has been graded (ID:%d)' % submission.id
+                #team = submission.team_fk
+                #recipient_email_list = [tm.user_fk.email
+                #        for tm in team_helper.get_team_members(team)]
+                #context = {
+                #        'user': submission.student_fk,
+                #        'submission': submission,
+                #        'assignment': submission.assignment_fk,
+                #}
+                #send_mail_helper.send_by_template(
+                #        subject=subject,
+                #        recipient_email_list=recipient_email_list,
+                #        template_path='serapis/email/grading_done_email.html',
+                #        context_dict=context,
+                #)
+
+        self.print_func(
+                'Graded task=%d, status=%s, pts=%f, sub=%s, hw_task=%s, hw=%s' % (
+                        grading_task.id, grading_task.get_grading_status_display(),
+                        grading_task.points, grading_task.submission_fk,
+                        grading_task.assignment_task_fk,
+                        grading_task.submission_fk.assignment_fk))
+        self.print_func('num_graded_tasks=%d, num_assignment_tasks=%d' % (
+                num_graded_tasks, num_assignment_tasks))
+        return True
@@ -0,0 +1,151 @@
+import hashlib
+
+from django.db import transaction
+from django.utils import timezone
+
+from serapis.models import *
+from serapis.utils import file_schema
+
+
+"""
+The result cache avoids executing identical submissions on the testbeds again. A finished task
+remembers a cache key, which is a hash over everything that determines the grading result: the
+submission files, the input files of the assignment task, the grading script, the execution
+duration, the points and the testbed type. When a new task has the same key as a finished one, the
+output files, the feedback and the score are reused and the task never goes to the testbeds.
+
+The cache is only used when `Assignment.enable_result_cache` is set, since it assumes that a
+submission always produces the same output.
+"""
+
+K_HASH_CHUNK_SIZE = 1 << 20
+
+
+def _hash_file_field(file_field):
+    hasher = hashlib.sha256()
+    with open(file_field.path, 'rb') as f:
+        for chunk in iter(lambda: f.read(K_HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def _hash_schema_files(dict_schema_files):
+    """
+    Returns:
+      A list of (schema name, file hash) sorted by schema name
+    """
+    return sorted([(schema_name, _hash_file_field(dict_schema_files[schema_name].file)
+                if dict_schema_files[schema_name] and dict_schema_files[schema_name].file else '')
+            for schema_name in dict_schema_files])
+
+def is_result_cache_enabled(assignment_task):
+    return assignment_task.assignment_fk.enable_result_cache
+
+def hash_submission_files(submission):
+    """
+    Hash the submission files, which are the same for all the tasks of a submission. The result can
+    be passed to the functions below to avoid hashing the files once per task.
+
+    Returns:
+      A list of (schema name, file hash) sorted by schema name
+    """
+    return _hash_schema_files(
+            file_schema.get_dict_schema_name_to_submission_schema_files(submission))
+
+def compute_result_cache_key(submission, assignment_task, submission_files_hash=None):
+    """
+    Params:
+      submission_files_hash: The return value of `hash_submission_files(submission)`, or None to
+          hash the submission files here
+    Returns:
+      A string of 64 hex digits
+    """
+    if submission_files_hash is None:
+        submission_files_hash = hash_submission_files(submission)
+    assignment = assignment_task.assignment_fk
+    components = [
+            ('testbed_type', assignment.testbed_type_fk_id),
+            ('execution_duration', assignment_task.execution_duration),
+            ('points', assignment_task.points),
+            ('grading_script', _hash_file_field(assignment_task.grading_script)),
+            ('assignment_task_files', _hash_schema_files(file_schema
+                    .get_dict_schema_name_to_assignment_task_schema_files(assignment_task))),
+            ('submission_files', submission_files_hash),
+    ]
+    return hashlib.sha256(repr(components).encode()).hexdigest()
+
+def remember_result(grading_task):
+    """
+    Store the cache key of a task which just finished, so that later identical tasks can reuse its
+    result. The key is computed at this moment because the grading script or the input files may
+    have been changed since the task was created.
+    """
+    if not is_result_cache_enabled(grading_task.assignment_task_fk):
+        return
+    grading_task.result_cache_key = compute_result_cache_key(
+            grading_task.submission_fk, grading_task.assignment_task_fk)
+    grading_task.save(update_fields=['result_cache_key'])
+
+def find_cached_task(submission, assignment_task, submission_files_hash=None):
+    """
+    Params:
+      submission_files_hash: See `compute_result_cache_key()`
+    Returns:
+      (cache_key, cached_task), where cached_task is the latest finished task with the same cache
+          key, or None if there is none. Both are None if the cache is disabled.
+    """
+    if not is_result_cache_enabled(assignment_task):
+        return (None, None)
+
+    cache_key = compute_result_cache_key(submission, assignment_task, submission_files_hash)
+    cached_task = (TaskGradingStatus.objects
+            .filter(result_cache_key=cache_key, grading_status=TaskGradingStatus.STAT_FINISH)
+            .order_by('-status_update_time').first())
+    return (cache_key, cached_task)
+
+def create_task_grading_status_from_cache(submission, assignment_task,
+        submission_files_hash=None):
+    """
+    Create a task which is already finished with the result of a finished task that has the same
+    cache key, if there is one. The cache is looked up before the task is created, and the task
+    is created as finished, hence it is never visible to the grading scheduler as pending.
+
+    Params:
+      submission_files_hash: See `compute_result_cache_key()`
+    Returns:
+      The created TaskGradingStatus, or None if there is no cached result, in which case the
+          caller creates a pending task as usual
+    """
+    cache_key, cached_task = find_cached_task(submission, assignment_task, submission_files_hash)
+    if cached_task is None:
+        return None
+
+    # output files are shared with the cached task. It is safe because output files are never
+    # overwritten, a re-executed task always stores its outputs in new files.
+    cached_output_files = file_schema.get_dict_schema_name_to_task_grading_status_schema_files(
+            cached_task, enforce_check=False)
+    schema_name_2_files = {}
+    for schema_name in cached_output_files:
+        schema_file = cached_output_files[schema_name]
+        if schema_file and schema_file.file:
+            schema_name_2_files[schema_name] = schema_file.file.name
+
+    with transaction.atomic():
+        grading_task = TaskGradingStatus.objects.create(
+                submission_fk=submission,
+                assignment_task_fk=assignment_task,
+                grading_status=TaskGradingStatus.STAT_FINISH,
+                execution_status=cached_task.execution_status,
+                status_update_time=timezone.now(),
+                points=cached_task.points,
+                grading_detail=cached_task.grading_detail.name or None,
+                result_cache_key=cache_key,
+        )
+        file_schema.create_empty_task_grading_status_schema_files(grading_task)
+        file_schema.save_dict_schema_name_to_task_grading_status_files(
+                grading_task, schema_name_2_files, enforce_check=False)
+
+        submission.num_total_tasks += 1
+        submission.num_graded_tasks += 1
+        submission.save()
+
+    return grading_task
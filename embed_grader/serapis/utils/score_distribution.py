@@ -20,8 +20,7 @@ def get_class_statistics(assignment, include_hidden):
     for team in team_list:
         latest_submission = grading.get_last_fully_graded_submission(team, assignment)
         if latest_submission:
-            _, sum_score, _ = Submission.retrieve_task_grading_status_and_score_sum(
-                    latest_submission, include_hidden)
+            sum_score, _ = latest_submission.retrieve_score_sum(include_hidden)
             last_submission_score_list.append(sum_score)
 
     num_total_teams = len(team_list)
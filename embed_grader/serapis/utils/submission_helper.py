@@ -4,7 +4,9 @@ from django.utils import timezone
 
 from serapis.models import *
 
+from serapis.utils import file_schema
 from serapis.utils import team_helper
+from serapis.utils.grading_scheduler_wakeup import GradingSchedulerWakeup
 
 
 def can_submission_file_be_accessed_by_user(submission, user):
@@ -31,6 +33,8 @@ def create_task_grading_status(submission, assignment_task):
         submission.num_total_tasks += 1
         submission.save()
 
+        GradingSchedulerWakeup.notify()
+
     return grading_task
 
 def remove_task_grading_status(task_grading_status):
@@ -73,6 +77,57 @@ def update_task_grading_status(task_grading_status, grading_status, **kwargs):
     if 'grading_detail' in kwargs:
         task_grading_status.grading_detail = kwargs['grading_detail']
 
+    # only the status set by a re-score is a re-score, any later update clears the flag
+    task_grading_status.is_rescoring = kwargs.get('is_rescoring', False)
+
     with transaction.atomic():
         submission.save()
         task_grading_status.save()
+
+def can_task_grading_status_be_rescored(task_grading_status):
+    """
+    A task can be re-scored without going through the testbeds again if it has been executed and
+    all of its output files are still stored.
+    """
+    if task_grading_status.grading_status not in [
+            TaskGradingStatus.STAT_OUTPUT_TO_BE_CHECKED, TaskGradingStatus.STAT_FINISH,
+            TaskGradingStatus.STAT_INTERNAL_ERROR]:
+        return False
+
+    if task_grading_status.execution_status == TaskGradingStatus.EXEC_SEG_FAULT:
+        return True
+    if task_grading_status.execution_status != TaskGradingStatus.EXEC_OK:
+        return False
+
+    schema_files = file_schema.get_dict_schema_name_to_task_grading_status_schema_files(
+            task_grading_status, enforce_check=False)
+    return all([schema_files[name] and schema_files[name].file for name in schema_files])
+
+def rescore_task_grading_status(task_grading_status, notify_scheduler=True):
+    """
+    Send a task back to the output checking stage, so that its stored output files are graded
+    again by the current grading script.
+
+    Params:
+      notify_scheduler: True to wake up the grading scheduler to check the task. A caller which
+          checks the task by itself (e.g., the rescore command) passes False.
+    Returns:
+      `True` if the task is sent back, `False` if the task cannot be re-scored
+    """
+    with transaction.atomic():
+        # reload the task and the submission under a lock, since the caller may hold stale copies
+        # (e.g., several tasks of the same submission, each with its own submission object)
+        task_grading_status = (TaskGradingStatus.objects.select_for_update()
+                .select_related('submission_fk').get(id=task_grading_status.id))
+        if not can_task_grading_status_be_rescored(task_grading_status):
+            return False
+
+        update_task_grading_status(
+                task_grading_status,
+                grading_status=TaskGradingStatus.STAT_OUTPUT_TO_BE_CHECKED,
+                points=0.,
+                is_rescoring=True,
+        )
+        if notify_scheduler:
+            GradingSchedulerWakeup.notify()
+    return True
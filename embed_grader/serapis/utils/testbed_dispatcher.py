@@ -0,0 +1,156 @@
+import sys
+import queue
+import requests
+import threading
+import traceback
+
+from django.db import close_old_connections
+
+from serapis.models import *
+from serapis.utils import file_schema
+from serapis.utils import testbed_helper
+
+
+class TestbedDispatcherPool(object):
+    """
+    `TestbedDispatcherPool` uploads grading tasks to the remote testbeds with a fixed number of
+    worker threads. The caller (usually the grading scheduler) attaches a task to a testbed first,
+    and then submits the pair to this pool, which sends the files to the testbed in background.
+
+    Each testbed has its own `requests.Session` so that the HTTP connection to a testbed is kept
+    alive and reused across tasks. A session is checked out by a worker while it is in use, hence
+    it is never shared by two threads at the same time.
+    """
+
+    def __init__(self, num_workers, connect_timeout_sec, read_timeout_sec, print_func=print):
+        """
+        Params:
+          num_workers: Number of tasks that can be uploaded at the same time
+          connect_timeout_sec: Time limit to establish a connection with a testbed
+          read_timeout_sec: Time limit to wait for a testbed to respond
+          print_func: A function that takes a string, for logging
+        """
+        self.timeout = (connect_timeout_sec, read_timeout_sec)
+        self.print_func = print_func
+
+        self.job_queue = queue.Queue()
+
+        # ip_address -> requests.Session, only contains the sessions which are not in use
+        self.idle_sessions = {}
+        self.idle_sessions_lock = threading.Lock()
+
+        self.workers = []
+        for i in range(num_workers):
+            worker = threading.Thread(target=self._work, name=('dispatcher-%d' % i))
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, testbed, task):
+        """
+        Enqueue a task to be uploaded to a testbed. The task should have been attached to the
+        testbed by `testbed_helper.grade_task()`.
+        """
+        self.job_queue.put((testbed, task))
+
+    def get_queue_depth(self):
+        """
+        Returns:
+          Number of tasks which are waiting for a worker, not including the ones being uploaded
+        """
+        return self.job_queue.qsize()
+
+    def discard_session(self, ip_address):
+        """
+        Close the connection to a testbed, e.g., when the testbed is removed.
+        """
+        with self.idle_sessions_lock:
+            session = self.idle_sessions.pop(ip_address, None)
+        if session is not None:
+            session.close()
+
+    def _checkout_session(self, ip_address):
+        with self.idle_sessions_lock:
+            session = self.idle_sessions.pop(ip_address, None)
+        return session if session is not None else requests.Session()
+
+    def _checkin_session(self, ip_address, session):
+        with self.idle_sessions_lock:
+            if ip_address in self.idle_sessions:
+                # another session to the same testbed was created while this one was in use
+                session.close()
+            else:
+                self.idle_sessions[ip_address] = session
+
+    def _work(self):
+        while True:
+            testbed, task = self.job_queue.get()
+            # same as the output checker workers, the database connection of this thread is idle
+            # while the queue is empty, hence it is checked before, and released after, every job
+            close_old_connections()
+            try:
+                self._grade(testbed, task)
+            except:
+                exc_type, exc_value, exc_tb = sys.exc_info()
+                traceback.print_exception(exc_type, exc_value, exc_tb)
+            finally:
+                close_old_connections()
+                self.job_queue.task_done()
+
+    def _schema_files_to_post_files(self, dict_schema_files, opened_files):
+        post_files = {}
+        for schema_name in dict_schema_files:
+            field_name = 'file_' + schema_name
+            f = open(dict_schema_files[schema_name].file.path, 'rb')
+            opened_files.append(f)
+            post_files[field_name] = ('filename', f, 'text/plain')
+        return post_files
+
+    def _grade(self, testbed, task):
+        TaskGradingStatusFile.objects.filter(
+                task_grading_status_fk=task).update(file=None)
+
+        self.print_func('Send job for grading: task %d, sub=%s, hw_task=%s, hw=%s, course=%s' % (
+            task.id,
+            task.submission_fk,
+            task.assignment_task_fk,
+            task.submission_fk.assignment_fk,
+            task.submission_fk.assignment_fk.course_fk.course_code))
+
+        opened_files = []
+        session = self._checkout_session(testbed.ip_address)
+        try:
+            submission = task.submission_fk
+            files = self._schema_files_to_post_files(file_schema
+                    .get_dict_schema_name_to_submission_schema_files(submission), opened_files)
+
+            assignment_task = task.assignment_task_fk
+            files.update(self._schema_files_to_post_files(file_schema
+                    .get_dict_schema_name_to_assignment_task_schema_files(assignment_task),
+                    opened_files))
+
+            data = {
+                    'execution_time': task.assignment_task_fk.execution_duration,
+                    'secret_code': testbed.secret_code,
+            }
+
+            url = 'http://' + testbed.ip_address + '/tb/grade_assignment/'
+
+            r = session.post(url, data=data, files=files, timeout=self.timeout)
+            if r.status_code != 200:  # testbed is not available
+                testbed_helper.abort_task(testbed, set_testbed_status=Testbed.STATUS_BUSY)
+                self.print_func('Testbed id=%d abort task %d' % (testbed.id, task.id))
+
+            self._checkin_session(testbed.ip_address, session)
+
+        except:
+            # the connection may be broken, do not reuse it
+            session.close()
+            testbed_helper.abort_task(testbed, set_testbed_status=Testbed.STATUS_OFFLINE)
+            self.print_func('Testbed id=%d goes offline since something goes wrong:'
+                    % testbed.id)
+            exc_type, exc_value, exc_tb = sys.exc_info()
+            traceback.print_exception(exc_type, exc_value, exc_tb)
+        finally:
+            for f in opened_files:
+                f.close()
@@ -1,8 +1,10 @@
+from django.db import connection
 from django.db import transaction
 
 from serapis.models import *
 
 from serapis.utils import submission_helper
+from serapis.utils.grading_scheduler_wakeup import GradingSchedulerWakeup
 
 
 def abort_task(testbed, set_testbed_status=Testbed.STATUS_BUSY,
@@ -18,7 +20,7 @@ def abort_task(testbed, set_testbed_status=Testbed.STATUS_BUSY,
 
     Paremeter:
       - set_testbed_status: The status going to be set for this testbed
-      - check_task_present: If this flag is set `True`, this function will examine if the testbed
+      - check_task_presence: If this flag is set `True`, this function will examine if the testbed
             is currently grading a task, otherwise, an exception will be raised.
       - check_task_status_executing: If this flag is set `True`, the status of the task which is
             being graded by this testbed should be executing, when the task is present.  Otherwise,
@@ -28,7 +30,7 @@ def abort_task(testbed, set_testbed_status=Testbed.STATUS_BUSY,
     # check if the task is present
     task = testbed.task_being_graded
     task_debug_id = task.id if task else None
-    if check_task_present and task is None:
+    if check_task_presence and task is None:
         raise Exception('No task to abort')
 
     # check if the task status is executing
@@ -46,6 +48,9 @@ def abort_task(testbed, set_testbed_status=Testbed.STATUS_BUSY,
         testbed.secret_code = ''
         testbed.save()
 
+        # the aborted task goes back to the queue
+        GradingSchedulerWakeup.notify()
+
     with open('/tmp/embed_grader_scheduler.log', 'a') as fo:
         import pytz
         time_str = timezone.now().astimezone(pytz.timezone('US/Pacific')).strftime("%H:%M:%S")
@@ -58,6 +63,105 @@ def abort_task(testbed, set_testbed_status=Testbed.STATUS_BUSY,
                 % (time_str, TaskGradingStatus.objects.get(id=task_debug_id).get_grading_status_display()))
             fo.write(final_msg + '\n')
 
+def abort_tasks_of_testbeds(testbed_id_list, set_testbed_status):
+    """
+    `abort_tasks_of_testbeds()` is a set-based version of `abort_task()` for sweeping many
+    testbeds at once, e.g., the testbeds which stop reporting. It uses one UPDATE statement for all
+    the tasks and one for all the testbeds, instead of several queries per testbed.
+
+    Different from `abort_task()`, no check is made. Testbeds without a task are simply set to the
+    given status, and only the tasks being executed are reset to pending. Since neither executing
+    nor pending is a finished status, the counters of the submissions remain unchanged.
+
+    Paremeter:
+      - testbed_id_list: A list of ids of the testbeds to be aborted
+      - set_testbed_status: The status going to be set for these testbeds
+    Return:
+      A list of ids of the tasks which are detached from the testbeds, including the ones which are
+      no longer executing and hence keep their status
+    """
+    with transaction.atomic():
+        task_id_list = list(Testbed.objects.filter(
+                id__in=testbed_id_list, task_being_graded__isnull=False,
+        ).values_list('task_being_graded', flat=True))
+        TaskGradingStatus.objects.filter(
+                id__in=task_id_list, grading_status=TaskGradingStatus.STAT_EXECUTING,
+        ).update(grading_status=TaskGradingStatus.STAT_PENDING)
+        Testbed.objects.filter(id__in=testbed_id_list).update(
+                task_being_graded=None, status=set_testbed_status, secret_code='')
+
+        # the aborted tasks go back to the queue
+        if len(task_id_list) > 0:
+            GradingSchedulerWakeup.notify()
+
+    return task_id_list
+
+def reset_orphan_tasks():
+    """
+    Reset the tasks which show executing but no testbed is grading them back to pending. The
+    orphan tasks are found by an anti-join between tasks and testbeds.
+
+    Return:
+      A list of ids of the orphan tasks
+    """
+    with transaction.atomic():
+        orphan_task_id_list = list(TaskGradingStatus.objects.filter(
+                grading_status=TaskGradingStatus.STAT_EXECUTING, testbed__isnull=True,
+        ).values_list('id', flat=True))
+        TaskGradingStatus.objects.filter(
+                id__in=orphan_task_id_list, grading_status=TaskGradingStatus.STAT_EXECUTING,
+        ).update(grading_status=TaskGradingStatus.STAT_PENDING)
+
+        if len(orphan_task_id_list) > 0:
+            GradingSchedulerWakeup.notify()
+
+    return orphan_task_id_list
+
+def _lock_rows_for_update(queryset):
+    """
+    Lock the selected rows until the end of the transaction, skipping the rows which are locked by
+    others if the database supports it (e.g., PostgreSQL).
+    """
+    features = connection.features
+    if getattr(features, 'has_select_for_update_skip_locked', False):
+        return queryset.select_for_update(skip_locked=True)
+    if features.has_select_for_update:
+        return queryset.select_for_update()
+    return queryset
+
+def assign_pending_tasks(grace_period_sec):
+    """
+    `assign_pending_tasks()` pairs up the available testbeds with the pending tasks. For each
+    testbed type, as many pending tasks as there are available testbeds of that type are fetched,
+    choosing the tasks whose belonged submission has the smallest execution scope, and all of them
+    are assigned in one transaction. Locked rows are skipped so that the same task cannot be picked
+    up twice.
+
+    Paremeter:
+      - grace_period_sec: The time a testbed is given beyond the execution duration of a task
+    Return:
+      A list of (testbed, task) pairs which are assigned and committed, i.e., ready to be uploaded
+    """
+    testbed_type_2_testbeds = {}
+    for testbed in Testbed.objects.filter(status=Testbed.STATUS_AVAILABLE).order_by('id'):
+        testbed_type_2_testbeds.setdefault(testbed.testbed_type_fk_id, []).append(testbed)
+
+    all_testbed_task_pairs = []
+    for testbed_type_id, testbed_list in testbed_type_2_testbeds.items():
+        with transaction.atomic():
+            task_list = _lock_rows_for_update(TaskGradingStatus.objects
+                    .filter(grading_status=TaskGradingStatus.STAT_PENDING,
+                        assignment_task_fk__assignment_fk__testbed_type_fk=testbed_type_id)
+                    .order_by('submission_fk__task_scope', 'submission_fk', 'id'))
+            testbed_task_pairs = list(zip(testbed_list, task_list[:len(testbed_list)]))
+
+            for testbed, chosen_task in testbed_task_pairs:
+                duration = chosen_task.assignment_task_fk.execution_duration + grace_period_sec
+                grade_task(testbed, chosen_task, duration, force_detach_currently_graded_task=True)
+        all_testbed_task_pairs.extend(testbed_task_pairs)
+
+    return all_testbed_task_pairs
+
 def grade_task(testbed, chosen_task, duration, force_detach_currently_graded_task=False,
         check_testbed_status_is_available=True, check_task_status_is_pending=True):
     """
@@ -78,7 +182,8 @@ def grade_task(testbed, chosen_task, duration, force_detach_currently_graded_tas
                     testbed.id, testbed.task_being_graded.id if testbed.task_being_graded else -1, chosen_task.id)
             fo.write(final_msg + '\n')
         if testbed.task_being_graded:
-            abort_task(testbed, set_status=testbed.status, check_task_status_executing=False)
+            abort_task(testbed, set_testbed_status=testbed.status,
+                    check_task_status_executing=False)
     if testbed.task_being_graded:
         raise Exception('This testbed is still grading one task')
     if check_testbed_status_is_available:
@@ -131,3 +236,6 @@ def finish_grading(testbed, task_execution_status):
         testbed.status = Testbed.STATUS_AVAILABLE
         testbed.secret_code = ''
         testbed.save()
+
+        # both the output is ready to be checked and the testbed is free for the next task
+        GradingSchedulerWakeup.notify()
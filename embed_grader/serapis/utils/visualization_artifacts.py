@@ -0,0 +1,150 @@
+import sys
+import traceback
+
+from django.core.files.base import ContentFile
+from django.core.urlresolvers import reverse
+from django.db import IntegrityError
+from django.utils import timezone
+from django.utils.html import escape
+from django.utils.http import urlencode
+
+from serapis.models import *
+from serapis.utils import file_schema
+from serapis.utils.visualizer_manager import VisualizerManager
+from serapis.utils.visualizer_manager import K_VISUALIZER_VERSION
+
+
+"""
+Visualizing a waveform file means parsing and downsampling it, which is too slow to be done by the
+web workers when a whole class checks the grading results right after a deadline. Instead, the
+output checker renders the visualization of each output file once the task finishes, and stores
+the html fragment (which embeds the downsampled plots) as well as the parse error, if any. The task
+grading detail page serves the stored fragments.
+
+A stored visualization is rendered again when it is requested but outdated, i.e., the visualizer
+version (K_VISUALIZER_VERSION) is bumped, or the task has been regraded since. Hence tasks that
+finished before this module existed, or that reuse a cached result, are rendered on their first
+visit.
+
+Files whose visualizer only reads the parts to be shown (see
+VisualizerManager.render_file_html_from_file()), i.e., plain text files, are not stored, because
+rendering them is already cheap.
+"""
+
+
+def get_waveform_window_url(task_grading_status, field_name):
+    """
+    Returns:
+      The url of the view that serves VisualizerManager.get_plot_window() for an output file
+    """
+    return '%s?%s' % (
+            reverse('ajax-get-waveform-window', args=(task_grading_status.id,)),
+            urlencode({'field_name': field_name}))
+
+def get_text_page_url(task_grading_status, field_name):
+    """
+    Returns:
+      The url of the view that serves VisualizerManager.get_text_page() for an output file
+    """
+    return '%s?%s' % (
+            reverse('ajax-get-output-file-text-page', args=(task_grading_status.id,)),
+            urlencode({'field_name': field_name}))
+
+def generate_visualizations(task_grading_status):
+    """
+    Render and store the visualizations of all the output files of a finished task. The visualizer
+    id of a file is its position among the output files, same as the task grading detail page.
+    """
+    output_files = file_schema.get_dict_schema_name_to_task_grading_status_schema_files(
+            task_grading_status, enforce_check=False)
+    for visualizer_id, field_name in enumerate(output_files):
+        schema_file = output_files[field_name]
+        if (schema_file and schema_file.file
+                and not VisualizerManager.can_render_from_file(field_name)):
+            generate_visualization(task_grading_status, field_name, schema_file, visualizer_id)
+
+def generate_visualization(task_grading_status, field_name, schema_file, visualizer_id):
+    """
+    Render the visualization of an output file and store it, replacing the previous one.
+
+    Params:
+      task_grading_status: A TaskGradingStatus object
+      field_name: The schema name of the output file
+      schema_file: A TaskGradingStatusFile object
+      visualizer_id: An integer, see VisualizerBase
+    Returns:
+      The html of the visualization, a string
+    """
+    # a visualizer which fails on a malformed file should not fail the whole task, the error is
+    # shown in place of the visualization instead
+    file = schema_file.file
+    file.open('rb')
+    try:
+        html, parse_error = VisualizerManager.render_waveform_file_html(field_name, file,
+                visualizer_id, window_url=get_waveform_window_url(task_grading_status, field_name),
+                path=file.path)
+        parse_error = parse_error or ''
+    except:
+        exc_type, exc_value, exc_tb = sys.exc_info()
+        traceback.print_exception(exc_type, exc_value, exc_tb)
+        parse_error = 'Visualizer error: %s' % exc_value
+        html = '<p style="white-space:pre; font-size:13px; font-family:monospace">%s</p>' % (
+                escape('(%s)' % parse_error))
+    finally:
+        file.close()
+
+    try:
+        visualization = TaskGradingStatusFileVisualization.objects.get(
+                task_grading_status_file_fk=schema_file)
+        old_html_name = visualization.html.name
+    except TaskGradingStatusFileVisualization.DoesNotExist:
+        visualization = TaskGradingStatusFileVisualization(task_grading_status_file_fk=schema_file)
+        old_html_name = None
+
+    # The new file is stored under a new name, and the previous one is only removed once the row
+    # refers to the new file. Hence the row never refers to a missing file, even if saving fails.
+    visualization.visualizer_version = K_VISUALIZER_VERSION
+    visualization.visualizer_id = visualizer_id
+    visualization.source_file_name = file.name
+    visualization.parse_error = parse_error
+    visualization.generation_time = timezone.now()
+    visualization.html.save('visualization.html', ContentFile(html.encode('utf-8')), save=False)
+    is_saved = False
+    try:
+        visualization.save()
+        is_saved = True
+    except IntegrityError:
+        # another process stored the same visualization at the same time
+        pass
+    finally:
+        if not is_saved:
+            visualization.html.delete(save=False)
+
+    if is_saved and old_html_name:
+        visualization.html.storage.delete(old_html_name)
+    return html
+
+def get_stored_visualization_html(schema_file, visualizer_id):
+    """
+    Returns:
+      The html of the stored visualization of an output file, or None if it is missing or outdated
+    """
+    try:
+        visualization = TaskGradingStatusFileVisualization.objects.get(
+                task_grading_status_file_fk=schema_file)
+    except TaskGradingStatusFileVisualization.DoesNotExist:
+        return None
+
+    if (visualization.visualizer_version != K_VISUALIZER_VERSION
+            or visualization.visualizer_id != visualizer_id
+            or visualization.source_file_name != schema_file.file.name):
+        return None
+
+    try:
+        visualization.html.open('rb')
+        try:
+            return visualization.html.read().decode('utf-8')
+        finally:
+            visualization.html.close()
+    except IOError:
+        return None
@@ -2,6 +2,11 @@ from django.template.loader import get_template
 from django.template import Context
 
 
+# Bump it whenever a visualizer renders differently, so that the stored visualizations (see
+# serapis/utils/visualization_artifacts.py) are rendered again
+K_VISUALIZER_VERSION = 1
+
+
 class VisualizerManager(object):
 
     def __init__(self):
@@ -9,15 +14,40 @@ class VisualizerManager(object):
         self.css_files = []
         self.visualizations = []
 
-    def add_file(self, field_name, raw_content, url):
+    def add_file(self, field_name, raw_content, url, window_url=None):
+        """
+        window_url is the url of a view which serves get_plot_window() for this file. Waveform
+        visualizers use it to fetch the details when zooming in.
+        """
         visualizer = self._get_visualizer(field_name, raw_content,
-                visualizer_id=len(self.visualizations))
+                visualizer_id=len(self.visualizations), window_url=window_url)
         self._update_list(self.js_files, visualizer.get_js_files() or [])
         self._update_list(self.css_files, visualizer.get_css_files() or [])
         self.visualizations.append({
             'field_name': field_name,
             'html': visualizer.get_html(),
             'url': url,
+            'visualization_url': None,
+        })
+
+    def add_lazy_file(self, field_name, url, visualization_url):
+        """
+        Add a file without reading it. The page fetches the html of the visualization from
+        visualization_url after it is loaded, and the view behind visualization_url renders it by
+        render_file_html() or render_file_html_from_file(). The visualizer id of the file is appended to
+        visualization_url as the `visualizer_id` GET parameter.
+        """
+        visualizer_id = len(self.visualizations)
+        visualizer_class = self._get_visualizer_class(field_name)
+        self._update_list(self.js_files, visualizer_class.get_js_files() or [])
+        self._update_list(self.css_files, visualizer_class.get_css_files() or [])
+        separator = '&' if '?' in visualization_url else '?'
+        self.visualizations.append({
+            'field_name': field_name,
+            'html': None,
+            'url': url,
+            'visualization_url': '%s%svisualizer_id=%d' % (
+                    visualization_url, separator, visualizer_id),
         })
 
     def render_js(self):
@@ -40,23 +70,159 @@ class VisualizerManager(object):
 
     def get_visualizations(self):
         """
-        Return a list of dictionaries, which always include 'field_name', 'html', and 'url'
+        Return a list of dictionaries, which always include 'field_name', 'html', 'url' and
+        'visualization_url'. Either 'html' or 'visualization_url' is None, depending on whether the
+        file is added by add_file() or add_lazy_file().
         """
         return self.visualizations
 
+    @staticmethod
+    def render_file_html(field_name, raw_content, visualizer_id, window_url=None):
+        """
+        Return the html of the visualization of a single file, which is the same as 'html' of
+        get_visualizations() if the file were added by add_file()
+        """
+        visualizer_class = VisualizerManager._get_visualizer_class(field_name)
+        return visualizer_class(raw_content, visualizer_id, window_url=window_url).get_html()
+
+    @staticmethod
+    def can_render_from_file(field_name):
+        """
+        Return True if render_file_html_from_file() can render the visualization of the file
+        without reading the whole file
+        """
+        return hasattr(VisualizerManager._get_visualizer_class(field_name), 'from_file')
+
+    @staticmethod
+    def render_file_html_from_file(field_name, f, visualizer_id, window_url=None):
+        """
+        Same as render_file_html(), but only reads the parts of f (a seekable file opened in binary
+        mode) which are shown.
+
+        Return a string, or None if the visualizer of the file needs the whole content
+        """
+        if not VisualizerManager.can_render_from_file(field_name):
+            return None
+        visualizer_class = VisualizerManager._get_visualizer_class(field_name)
+        return visualizer_class.from_file(f, visualizer_id, window_url=window_url).get_html()
+
+    @staticmethod
+    def can_read_waveform_from_file(field_name):
+        """
+        Return True if the file is a waveform whose visualizer reads it from a file object, see
+        render_waveform_file_html() and get_plot_window_from_file()
+        """
+        return hasattr(VisualizerManager._get_visualizer_class(field_name), 'from_waveform_file')
+
+    @staticmethod
+    def render_waveform_file_html(field_name, f, visualizer_id, window_url=None, path=None):
+        """
+        Same as render_file_html() and get_parse_error() at once, but f (a seekable file opened in
+        binary mode) is parsed only once. Logic Saleae waveforms are parsed chunk by chunk. If path
+        (the path of a stored file) is given, the waveform cache is looked up by the stored file
+        before reading f.
+
+        Return (html, parse error or None)
+        """
+        if VisualizerManager.can_read_waveform_from_file(field_name):
+            visualizer_class = VisualizerManager._get_visualizer_class(field_name)
+            visualizer = visualizer_class.from_waveform_file(
+                    f, visualizer_id, window_url=window_url, path=path)
+            return (visualizer.get_html(), visualizer.parse_error)
+
+        raw_content = f.read()
+        return (VisualizerManager.render_file_html(field_name, raw_content, visualizer_id,
+                        window_url=window_url),
+                VisualizerManager.get_parse_error(field_name, raw_content))
+
+    @staticmethod
+    def get_text_page(field_name, f, offset, length, end=None):
+        """
+        Read a page of a plain text file, see
+        serapis/utils/visualizers/plain_text_visualizer.py:read_text_page()
+
+        Return a dictionary with `start`, `end`, `file_size` and `content`, or None if the file is
+        not visualized as plain text
+        """
+        from serapis.utils.visualizers import plain_text_visualizer
+        visualizer_class = VisualizerManager._get_visualizer_class(field_name)
+        if visualizer_class is not plain_text_visualizer.PlainTextVisualizer:
+            return None
+        return plain_text_visualizer.read_text_page(f, offset, length, end)
+
+    @staticmethod
+    def get_parse_error(field_name, raw_content):
+        """
+        Return the description of the error while parsing a waveform file, or None if the file is
+        parsed successfully or is not a waveform
+        """
+        if field_name.endswith('.stm32.waveform'):
+            from serapis.utils.visualizers.fileio.stm32_waveform_file_reader import STM32WaveformFileReader
+            reader = STM32WaveformFileReader(raw_content)
+        elif field_name.endswith('.logicsaleae.waveform'):
+            from serapis.utils.visualizers.fileio.logic_saleae_waveform_file_reader import LogicSaleaeWaveformFileReader
+            reader = LogicSaleaeWaveformFileReader(raw_content)
+        else:
+            return None
+        if reader.is_successfully_parsed():
+            return None
+        return reader.get_error_description()
+
+    @staticmethod
+    def get_plot_window(field_name, raw_content, plot_idx, start_time, end_time, num_pixels,
+            encoding):
+        """
+        Compute one plot of a waveform file within a time window. The unit of time is the same as
+        the one shown on the plot. encoding is either 'json' or 'base64', see
+        serapis/utils/visualizers/typed_array_encoding.py.
+
+        Return a dictionary with `encoding`, `timestamps` and `values`, or None if the file is not
+        a waveform or cannot be parsed
+        """
+        params = (raw_content, plot_idx, start_time, end_time, num_pixels, encoding)
+        if field_name.endswith('.stm32.waveform'):
+            from serapis.utils.visualizers import stm32_waveform_visualizer
+            return stm32_waveform_visualizer.get_plot_window(*params)
+        elif field_name.endswith('.logicsaleae.waveform'):
+            from serapis.utils.visualizers import logic_saleae_waveform_visualizer
+            return logic_saleae_waveform_visualizer.get_plot_window(*params)
+        else:
+            return None
+
+    @staticmethod
+    def get_plot_window_from_file(field_name, f, plot_idx, start_time, end_time, num_pixels,
+            encoding, path=None):
+        """
+        Same as get_plot_window(), but reads the waveform from f (a seekable file opened in binary
+        mode). See render_waveform_file_html() for path.
+        """
+        params = (f, plot_idx, start_time, end_time, num_pixels, encoding, path)
+        if field_name.endswith('.stm32.waveform'):
+            from serapis.utils.visualizers import stm32_waveform_visualizer
+            return stm32_waveform_visualizer.get_plot_window_from_file(*params)
+        elif field_name.endswith('.logicsaleae.waveform'):
+            from serapis.utils.visualizers import logic_saleae_waveform_visualizer
+            return logic_saleae_waveform_visualizer.get_plot_window_from_file(*params)
+        else:
+            return None
+
     def _update_list(self, target_list, supplement_list):
         for o in supplement_list:
             if o not in target_list:
                 target_list.append(o)
 
-    def _get_visualizer(self, field_name, raw_content, visualizer_id):
-        params = (raw_content, visualizer_id)
+    def _get_visualizer(self, field_name, raw_content, visualizer_id, window_url):
+        visualizer_class = self._get_visualizer_class(field_name)
+        return visualizer_class(raw_content, visualizer_id, window_url=window_url)
+
+    @staticmethod
+    def _get_visualizer_class(field_name):
         if field_name.endswith('.stm32.waveform'):
             from serapis.utils.visualizers.stm32_waveform_visualizer import STM32WaveformVisualizer
-            return STM32WaveformVisualizer(*params)
+            return STM32WaveformVisualizer
         elif field_name.endswith('.logicsaleae.waveform'):
             from serapis.utils.visualizers.logic_saleae_waveform_visualizer import LogicSaleaeWaveformVisualizer
-            return LogicSaleaeWaveformVisualizer(*params)
+            return LogicSaleaeWaveformVisualizer
         else:
             from serapis.utils.visualizers.plain_text_visualizer import PlainTextVisualizer
-            return PlainTextVisualizer(*params)
+            return PlainTextVisualizer
@@ -0,0 +1,203 @@
+import os
+import json
+import mmap
+import struct
+import numpy
+
+from serapis.utils.visualizers.fileio.waveform_query_base import WaveformQueryBase
+from serapis.utils.visualizers.fileio.waveform_query_base import WaveformData
+
+"""
+The binary waveform format stores a cleaned waveform (see WaveformQueryBase._clean_waveform()) in
+columns, so that it can be opened without parsing. The layout of a file is:
+
+  - magic:          8 bytes, b'WAVEBIN1'
+  - header length:  4 bytes, little-endian unsigned integer
+  - header:         a JSON object in ASCII, e.g.,
+                        {"period_sec": 20.0, "tick_frequency": 5000.0, "num_events": 3,
+                         "display_params": [{"name": "CTL", "pins": [0]},
+                                            {"name": "VAL", "pins": [2, 1]}]}
+                    tick_frequency is null if the waveform is not captured in ticks.
+  - padding:        null bytes, so that the following columns are aligned to 8 bytes
+  - timestamps:     num_events little-endian float64, the timestamps in second
+  - bus values:     num_events little-endian uint64
+
+The display params have the same meaning as the ones in the text formats, please see
+stm32_waveform_file_reader.py. The file can be produced by BinaryWaveformFileWriter, or be
+converted from the text formats by the functions in binary_waveform_file_writer.py.
+"""
+
+K_MAGIC = b'WAVEBIN1'
+K_HEADER_LENGTH_FORMAT = '<I'
+K_COLUMN_ALIGNMENT = 8
+K_TIMESTAMP_DTYPE = numpy.dtype('<f8')
+K_BUS_VALUE_DTYPE = numpy.dtype('<u8')
+
+
+def get_column_offset(header_length):
+    """
+    Returns:
+      The offset of the timestamp column, given the length of the JSON header
+    """
+    header_end = len(K_MAGIC) + struct.calcsize(K_HEADER_LENGTH_FORMAT) + header_length
+    return (header_end + K_COLUMN_ALIGNMENT - 1) // K_COLUMN_ALIGNMENT * K_COLUMN_ALIGNMENT
+
+
+class BinaryWaveformFileReader(WaveformQueryBase):
+    ERROR_CODE_EMPTY_FILE = 1
+    ERROR_CODE_FORMAT = 3
+
+    def __init__(self, raw_content, build_edge_index=False):
+        """
+        Params:
+          raw_content: A bytes-like object, e.g., bytes or mmap. The waveform columns are views of
+              raw_content rather than copies.
+          build_edge_index: If True, index the edges of all the pins once the file is loaded (see
+              WaveformData.with_edge_index()), which speeds up repeated edge queries.
+        """
+        self._initialize_instance_variables()
+        self._parse_raw_content(raw_content)
+        if build_edge_index and self.error_code is None:
+            self.data = self.data.with_edge_index()
+
+    @classmethod
+    def from_file(cls, file_path, build_edge_index=False):
+        """
+        Memory-map the file instead of reading it. Only the header is touched when opening the
+        file, and the pages of the columns are loaded by the OS when they are queried. Building the
+        edge index reads the whole columns though.
+        """
+        if os.path.getsize(file_path) == 0:
+            return cls(b'')
+        with open(file_path, 'rb') as f:
+            content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(content, build_edge_index)
+
+    def _initialize_instance_variables(self):
+        self.period_sec = None
+        self.tick_frequency = None
+
+        # display_params is an array, each element is a dictionary with `name` (a string) and
+        # `pins` (a list of integers)
+        self.display_params = None
+
+        # data is a WaveformData, which contains two columns, the start timestamps in second and
+        # the bus values
+        self.data = None
+
+        self.error_code = None
+
+    def _parse_raw_content(self, raw_content):
+        if len(raw_content) == 0:
+            self.error_code = BinaryWaveformFileReader.ERROR_CODE_EMPTY_FILE
+            return
+
+        if not self._parse_content(raw_content):
+            self.error_code = BinaryWaveformFileReader.ERROR_CODE_FORMAT
+            return
+
+        self.error_code = None
+
+    def _parse_content(self, raw_content):
+        try:
+            if raw_content[:len(K_MAGIC)] != K_MAGIC:
+                return False
+
+            header_length_idx = len(K_MAGIC)
+            header_idx = header_length_idx + struct.calcsize(K_HEADER_LENGTH_FORMAT)
+            header_length = struct.unpack_from(
+                    K_HEADER_LENGTH_FORMAT, raw_content, header_length_idx)[0]
+            header = json.loads(bytes(raw_content[header_idx:header_idx+header_length])
+                    .decode('ascii'))
+
+            self.period_sec = float(header['period_sec'])
+            if header['tick_frequency'] is not None:
+                self.tick_frequency = float(header['tick_frequency'])
+            self.display_params = [{
+                'name': str(param['name']),
+                'pins': [int(x) for x in param['pins']],
+            } for param in header['display_params']]
+
+            num_events = int(header['num_events'])
+            if num_events <= 0:
+                return False
+
+            timestamp_idx = get_column_offset(header_length)
+            bus_value_idx = timestamp_idx + num_events * K_TIMESTAMP_DTYPE.itemsize
+            content_length = bus_value_idx + num_events * K_BUS_VALUE_DTYPE.itemsize
+            if len(raw_content) != content_length:
+                return False
+
+            self.data = WaveformData(
+                    numpy.frombuffer(raw_content, dtype=K_TIMESTAMP_DTYPE, count=num_events,
+                            offset=timestamp_idx),
+                    numpy.frombuffer(raw_content, dtype=K_BUS_VALUE_DTYPE, count=num_events,
+                            offset=bus_value_idx),
+            )
+        except:
+            return False
+
+        return True
+
+    def is_successfully_parsed(self):
+        return self.error_code is None
+
+    def get_error_code(self):
+        return self.error_code
+
+    def get_error_description(self):
+        if self.error_code is None:
+            raise Exception("No error during parsing")
+
+        if self.error_code == BinaryWaveformFileReader.ERROR_CODE_EMPTY_FILE:
+            return "Empty file"
+        elif self.error_code == BinaryWaveformFileReader.ERROR_CODE_FORMAT:
+            return "Parsing error: file format is not correct"
+        else:
+            raise Exception("Unknown error code")
+
+    def get_period_sec(self):
+        if self.error_code is not None:
+            raise Exception("There is an error while parsing content")
+        return self.period_sec
+
+    def get_period_ms(self):
+        if self.error_code is not None:
+            raise Exception("There is an error while parsing content")
+        return self.period_sec * 1000.
+
+    def get_tick_frequency(self):
+        """
+        Returns:
+          The tick frequency, or None if the waveform is not captured in ticks
+        """
+        if self.error_code is not None:
+            raise Exception("There is an error while parsing content")
+        return self.tick_frequency
+
+    def get_num_display_plots(self):
+        if self.error_code is not None:
+            raise Exception("There is an error while parsing content")
+        return len(self.display_params)
+
+    def get_event_series(self, series_idx, start_time_sec=None, end_time_sec=None):
+        """
+        When start_time_sec and/or end_time_sec is None, it is configured as default value:
+        start_time_sec will be 0.0, end_time_sec will be the period length.
+
+        Returns:
+          (name, time_series)
+            - name: plot name, a string
+            - time_series: a list of (time_sec, bus_value). Align with both start_time_sec and
+                  end_time_sec. Will filter out duplicate transitions.
+        """
+
+        if self.error_code is not None:
+            raise Exception("There is an error while parsing content")
+
+        display_param = self.display_params[series_idx]
+        series_name = display_param['name']
+        series_pins = display_param['pins']
+        result_sec = self._get_event_series(self.data, series_pins, start_time_sec, end_time_sec)
+
+        return (series_name, result_sec)
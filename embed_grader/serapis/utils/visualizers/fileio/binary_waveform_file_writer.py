@@ -0,0 +1,120 @@
+import json
+import struct
+
+from serapis.utils.visualizers.fileio.waveform_query_base import WaveformQueryBase
+from serapis.utils.visualizers.fileio import binary_waveform_file_reader as binary_format
+from serapis.utils.visualizers.fileio.stm32_waveform_file_reader import STM32WaveformFileReader
+from serapis.utils.visualizers.fileio.logic_saleae_waveform_file_reader import LogicSaleaeWaveformFileReader
+
+
+"""
+Please see binary_waveform_file_reader.py for the specification of the file.
+"""
+
+class BinaryWaveformFileWriter(WaveformQueryBase):
+    """
+    The waveform is cleaned (see WaveformQueryBase._clean_waveform()) before it is written, hence
+    the reader can use the columns directly.
+    """
+
+    def __init__(self, file_path):
+        # initialize instance variables
+        self.file_path = file_path
+
+        self.period_sec = None
+        self.tick_frequency = None
+
+        # display_params is a list of dictionaries with `name` (a string) and `pins` (a list of
+        # integers)
+        self.display_params = []
+
+        # events added by add_event(), a list of (timestamp in second, bus value)
+        self.events = []
+
+        # the waveform set by set_waveform(), a WaveformData
+        self.waveform = None
+
+    def set_period_sec(self, period_sec):
+        self.period_sec = period_sec
+
+    def set_period_ms(self, period_ms):
+        self.period_sec = period_ms / 1000.
+
+    def set_tick_frequency(self, frequency):
+        self.tick_frequency = frequency
+
+    def add_display_param(self, plot_name, plot_pins):
+        # convert a signle integer to a list
+        if type(plot_pins) is int:
+            plot_pins = [plot_pins]
+
+        self.display_params.append({'name': plot_name, 'pins': list(plot_pins)})
+
+    def add_event(self, time_sec, bus_value):
+        self.events.append((time_sec, bus_value))
+
+    def set_waveform(self, waveform):
+        """
+        Set all the events at once, which is much faster than add_event() for a long waveform.
+        Events added by add_event() are discarded.
+
+        Params:
+          waveform: A WaveformData, or a list of (timestamp in second, bus value)
+        """
+        self.events = []
+        self.waveform = self._as_waveform_data(waveform)
+
+    def marshal(self):
+        if self.period_sec is None:
+            raise Exception('"Period" is not set')
+        if len(self.display_params) == 0:
+            raise Exception('"Display params" is empty')
+
+        waveform = self.waveform if self.waveform is not None else self.events
+        waveform = self._clean_waveform(waveform, self.period_sec)
+
+        header = json.dumps({
+            'period_sec': float(self.period_sec),
+            'tick_frequency': (None if self.tick_frequency is None
+                    else float(self.tick_frequency)),
+            'display_params': self.display_params,
+            'num_events': len(waveform),
+        }).encode('ascii')
+        column_offset = binary_format.get_column_offset(len(header))
+
+        with open(self.file_path, 'wb') as fo:
+            fo.write(binary_format.K_MAGIC)
+            fo.write(struct.pack(binary_format.K_HEADER_LENGTH_FORMAT, len(header)))
+            fo.write(header)
+            fo.write(b'\0' * (column_offset - fo.tell()))
+            fo.write(waveform.timestamps.astype(binary_format.K_TIMESTAMP_DTYPE).tobytes())
+            fo.write(waveform.values.astype(binary_format.K_BUS_VALUE_DTYPE).tobytes())
+
+
+def convert_stm32_waveform_file(input_path, output_path):
+    """
+    Convert an STM32 waveform file (text) into the binary format.
+    """
+    with open(input_path, 'rb') as f:
+        reader = STM32WaveformFileReader(f.read())
+    _convert(reader, output_path)
+
+def convert_logic_saleae_waveform_file(input_path, output_path):
+    """
+    Convert a Logic Saleae waveform file (text) into the binary format.
+    """
+    with open(input_path, 'rb') as f:
+        reader = LogicSaleaeWaveformFileReader(f.read())
+    _convert(reader, output_path)
+
+def _convert(reader, output_path):
+    if not reader.is_successfully_parsed():
+        raise Exception(reader.get_error_description())
+
+    writer = BinaryWaveformFileWriter(output_path)
+    writer.set_period_sec(reader.get_period_sec())
+    writer.set_tick_frequency(getattr(reader, 'tick_frequency', None))
+    for param in reader.display_params:
+        writer.add_display_param(param['name'], param['pins'])
+    writer.set_waveform(reader.data)
+    writer.marshal()
@@ -1,7 +1,10 @@
 import json
 import re
+import numpy
 
 from serapis.utils.visualizers.fileio.waveform_query_base import WaveformQueryBase
+from serapis.utils.visualizers.fileio.waveform_query_base import WaveformData
+from serapis.utils.visualizers.fileio import waveform_cache
 
 """
 An example of the file content of Logic Saleae waveform looks like the following:
@@ -50,14 +53,73 @@ Or visually, it looks like the following:
 
 """
 
+# number of bytes read at once when parsing a file object
+K_STREAM_CHUNK_SIZE = 1 << 22
+
+# byte -> hexadecimal digit value, for parsing the Data[Hex] column
+K_HEX_PADDING = 16
+K_HEX_INVALID_DIGIT = 17
+K_HEX_DIGIT_TABLE = numpy.full(256, K_HEX_INVALID_DIGIT, dtype=numpy.uint8)
+K_HEX_DIGIT_TABLE[numpy.frombuffer(b'\0 \t\r\x0b\x0c', dtype=numpy.uint8)] = K_HEX_PADDING
+K_HEX_DIGIT_TABLE[numpy.frombuffer(b'0123456789abcdef', dtype=numpy.uint8)] = numpy.arange(16)
+K_HEX_DIGIT_TABLE[numpy.frombuffer(b'ABCDEF', dtype=numpy.uint8)] = numpy.arange(10, 16)
+
+
 class LogicSaleaeWaveformFileReader(WaveformQueryBase):
     ERROR_CODE_EMPTY_FILE = 1
     ERROR_CODE_NON_ASCII = 2
     ERROR_CODE_FORMAT = 3
 
-    def __init__(self, raw_content):
+    def __init__(self, raw_content, build_edge_index=False):
+        """
+        Params:
+          raw_content: The content of the file in bytes
+          build_edge_index: If True, index the edges of all the pins once the file is loaded (see
+              WaveformData.with_edge_index()), which speeds up repeated edge queries.
+        """
         self._initialize_instance_variables()
         self._parse_raw_content(raw_content)
+        if build_edge_index and self.error_code is None:
+            self.data = self.data.with_edge_index()
+
+    @classmethod
+    def from_file(cls, f, load_waveform=True, chunk_size=K_STREAM_CHUNK_SIZE,
+            build_edge_index=False, cache_key=None):
+        """
+        Parse a file chunk by chunk instead of reading the whole raw content into memory. Only the
+        parsed columns are kept, which take much less memory than the text.
+
+        Params:
+          f: A file object opened in binary mode
+          load_waveform: If True, the waveform is loaded as the constructor does. Otherwise only
+              the metadata is parsed, and the waveform should be consumed by
+              iter_waveform_chunks(), which never holds the whole waveform in memory.
+          chunk_size: Number of bytes read at once
+          build_edge_index: See __init__(). Ignored if the waveform is not loaded.
+          cache_key: The key of the file in the waveform cache (e.g., computed by
+              WaveformCache.compute_file_key()), or None to bypass the cache. The file is not read
+              at all if the waveform is cached. Ignored if the waveform is not loaded.
+        """
+        reader = cls.__new__(cls)
+        reader._initialize_instance_variables()
+        reader.stream = f
+        reader.stream_chunk_size = chunk_size
+        if not load_waveform:
+            cache_key = None
+
+        if cache_key is not None and waveform_cache.load_reader(reader, cache_key):
+            reader.cache_key = cache_key
+        else:
+            reader._parse_stream_metadata()
+            if reader.error_code is None and load_waveform:
+                reader._load_stream_waveform()
+            if reader.error_code is None and cache_key is not None:
+                reader.cache_key = cache_key
+                waveform_cache.save_reader(reader, cache_key)
+
+        if build_edge_index and load_waveform and reader.error_code is None:
+            reader.data = reader.data.with_edge_index()
+        return reader
 
     def _initialize_instance_variables(self):
         self.period_sec = None
@@ -66,67 +128,97 @@ class LogicSaleaeWaveformFileReader(WaveformQueryBase):
         # `pins` (a list of integers)
         self.display_params = None
 
-        # data contains a list of tuples. Each tuple contains two items, a float representing
-        # start timestamp in ms, and an integer for a bus value
+        # data is a WaveformData, which contains two columns, the start timestamps in second and
+        # the bus values
         self.data = None
         
         self.error_code = None
 
+        # the key of the waveform in the waveform cache once it is parsed, see waveform_cache.py
+        self.cache_key = None
+
+        # the file object and the chunk size of a reader created by from_file()
+        self.stream = None
+        self.stream_chunk_size = None
+
     def _parse_raw_content(self, raw_content):
         if len(raw_content) == 0:
             self.error_code = LogicSaleaeWaveformFileReader.ERROR_CODE_EMPTY_FILE
             return
+
+        cache_key = waveform_cache.WaveformCache.compute_key('logicsaleae', raw_content)
+        if waveform_cache.load_reader(self, cache_key):
+            self.error_code = None
+            self.cache_key = cache_key
+            return
         
-        try:
-            content = raw_content.decode('ascii')
-        except:
+        if not self._is_ascii(raw_content):
             self.error_code = LogicSaleaeWaveformFileReader.ERROR_CODE_NON_ASCII
             return
 
-        if not self._parse_content(content):
+        # The fast path only accepts well-formed files. Anything unusual goes through the line-by-
+        # line parser, which decides whether the file is acceptable.
+        if (not self._parse_raw_content_fast(raw_content)
+                and not self._parse_content(raw_content.decode('ascii'))):
             self.error_code = LogicSaleaeWaveformFileReader.ERROR_CODE_FORMAT
             return
 
         self.error_code = None
+        self.cache_key = cache_key
+        waveform_cache.save_reader(self, cache_key)
 
-    def _parse_content(self, content):
-        try:
-            lines = content.strip().split('\n')
-            num_total_lines = len(lines)
-            line_idx = 0
+    def _parse_metadata_lines(self, lines):
+        """
+        Parse the metadata section, including the "==" separator line.
 
-            # E.g., Period: 1
-            matches = re.search(r'^Period: *(\d+(\.\d*)?)', lines[line_idx])
-            if not matches:
-                return False
-            self.period_sec = float(matches.group(1))
+        Returns:
+          The index of the first line of the waveform section (i.e., the column header line), or
+          None if the format is not correct
+        """
+        num_total_lines = len(lines)
+        line_idx = 0
+
+        # E.g., Period: 1
+        matches = re.search(r'^Period: *(\d+(\.\d*)?)', lines[line_idx])
+        if not matches:
+            return None
+        self.period_sec = float(matches.group(1))
+        line_idx += 1
+
+        # E.g., Display start
+        #       CTL,0
+        #       VAL,3,1
+        #       Display end
+        if not lines[line_idx].startswith('Display start'):
+            return None
+        line_idx += 1
+
+        self.display_params = []  # a list of {name, pins}
+        while line_idx < num_total_lines and not lines[line_idx].startswith('Display end'):
+            terms = lines[line_idx].split(',')
+            if len(terms) <= 1:
+                return None  # should have at least a name and a pin index
+            self.display_params.append({
+                'name': terms[0],
+                'pins': [int(x) for x in terms[1:]],
+            })
             line_idx += 1
 
-            # E.g., Display start
-            #       CTL,0
-            #       VAL,3,1
-            #       Display end
-            if not lines[line_idx].startswith('Display start'):
-                return False
-            line_idx += 1
+        line_idx += 1
 
-            self.display_params = []  # a list of {name, pins}
-            while line_idx < num_total_lines and not lines[line_idx].startswith('Display end'):
-                terms = lines[line_idx].split(',')
-                if len(terms) <= 1:
-                    return False  # should have at least a name and a pin index
-                self.display_params.append({
-                    'name': terms[0],
-                    'pins': [int(x) for x in terms[1:]],
-                })
-                line_idx += 1
+        # E.g., ==
+        if not lines[line_idx].startswith('=='):
+            return None
+        line_idx += 1
 
-            line_idx += 1
+        return line_idx
 
-            # E.g., ==
-            if not lines[line_idx].startswith('=='):
+    def _parse_content(self, content):
+        try:
+            lines = content.strip().split('\n')
+            line_idx = self._parse_metadata_lines(lines)
+            if line_idx is None:
                 return False
-            line_idx += 1
 
             # E.g., Time[s], Data[Hex]
             #       0.000000000000000, 0
@@ -145,6 +237,246 @@ class LogicSaleaeWaveformFileReader(WaveformQueryBase):
 
         return True
 
+    def _parse_raw_content_fast(self, raw_content):
+        """
+        Parse the waveform section as a whole with numpy instead of line by line. It expects
+        exactly a decimal timestamp and a plain hexadecimal value (no "0x" prefix, at most 16
+        digits) in every line.
+
+        Returns:
+          `True` if succeeded, `False` if the content should be parsed by _parse_content() instead
+        """
+        try:
+            content = raw_content.strip()
+            separator_idx = content.find(b'\n==')
+            if separator_idx < 0:
+                return False
+            column_header_idx = content.find(b'\n', separator_idx + 1)
+            if column_header_idx < 0:
+                return False
+
+            lines = content[:column_header_idx].decode('ascii').split('\n')
+            if self._parse_metadata_lines(lines) != len(lines):
+                return False
+
+            # skip the column header line, e.g., Time[s], Data[Hex]
+            waveform_section_idx = content.find(b'\n', column_header_idx + 1)
+            if waveform_section_idx < 0:
+                waveform_section_idx = len(content)
+
+            columns = self._parse_waveform_section_fast(content[waveform_section_idx+1:])
+            if columns is None:
+                return False
+
+            data = self._clean_waveform(WaveformData(*columns), self.period_sec)
+        except:
+            return False
+
+        self.data = data
+        return True
+
+    def _parse_waveform_section_fast(self, waveform_section):
+        """
+        Returns:
+          (timestamps, bus_values), two numpy arrays, or None if the waveform section should be
+          parsed line by line instead
+        """
+        # null bytes are reserved for padding the hexadecimal terms
+        if b'\0' in waveform_section:
+            return None
+        columns = self._split_waveform_section(waveform_section, 2)
+        if columns is None:
+            return None
+
+        timestamps = columns[:, 0].astype(numpy.float64)
+        bus_values = self._parse_hex_terms(columns[:, 1])
+        if bus_values is None:
+            return None
+        return (timestamps, bus_values)
+
+    def _parse_hex_terms(self, terms):
+        """
+        Convert hexadecimal byte strings into integers, all digits at once. Whitespace is allowed
+        around the digits, as int(term, 16) does.
+
+        Params:
+          terms: A numpy array of bytes
+        Returns:
+          A numpy array of uint64, or None if any of the terms is not a plain hexadecimal number
+        """
+        num_terms, num_chars = len(terms), terms.dtype.itemsize
+        if num_terms == 0:
+            return numpy.zeros(0, dtype=numpy.uint64)
+
+        # shorter terms are padded with null bytes at the end
+        chars = numpy.ascontiguousarray(terms).view(numpy.uint8).reshape(num_terms, num_chars)
+        digits = K_HEX_DIGIT_TABLE[chars]
+        if (digits == K_HEX_INVALID_DIGIT).any():
+            return None
+
+        # every term has 1 to 16 digits, without any whitespace between them
+        is_digit = digits < 16
+        num_digits = is_digit.sum(axis=1)
+        if (num_digits == 0).any() or (num_digits > 16).any():
+            return None
+        is_whitespace = (~is_digit) & (chars != 0)
+        if is_whitespace.any():
+            after_first_digit = numpy.logical_or.accumulate(is_digit, axis=1)
+            before_last_digit = numpy.logical_or.accumulate(is_digit[:, ::-1], axis=1)[:, ::-1]
+            if (after_first_digit & before_last_digit & is_whitespace).any():
+                return None
+
+        bus_values = numpy.zeros(num_terms, dtype=numpy.uint64)
+        for i in range(num_chars):
+            shifted = (bus_values << numpy.uint64(4)) | digits[:, i].astype(numpy.uint64)
+            bus_values = numpy.where(is_digit[:, i], shifted, bus_values)
+        return bus_values
+
+    def _parse_stream_metadata(self):
+        # read the metadata line by line until the "==" line after "Display end"
+        header = b''
+        display_ended = False
+        while True:
+            line = self.stream.readline()
+            if len(line) == 0:
+                break
+            header += line
+            if display_ended and line.startswith(b'=='):
+                break
+            if line.startswith(b'Display end'):
+                display_ended = True
+
+        if len(header) == 0:
+            self.error_code = LogicSaleaeWaveformFileReader.ERROR_CODE_EMPTY_FILE
+            return
+
+        # skip the column header line, e.g., Time[s], Data[Hex]
+        column_header = self.stream.readline()
+
+        if not self._is_ascii(header) or not self._is_ascii(column_header):
+            self.error_code = LogicSaleaeWaveformFileReader.ERROR_CODE_NON_ASCII
+            return
+
+        try:
+            header = header.strip()
+            lines = header.decode('ascii').split('\n')
+            if not lines[-1].startswith('==') or self._parse_metadata_lines(lines) != len(lines):
+                raise ValueError('Metadata section is not correct')
+        except:
+            self._set_stream_format_error()
+            return
+
+        self.error_code = None
+
+    def _load_stream_waveform(self):
+        try:
+            column_chunks = list(self._iter_stream_raw_columns())
+            timestamps = numpy.concatenate(
+                    [numpy.zeros(0, dtype=numpy.float64)] + [c[0] for c in column_chunks])
+            bus_values = numpy.concatenate(
+                    [numpy.zeros(0, dtype=numpy.uint64)] + [c[1] for c in column_chunks])
+            del column_chunks
+            self.data = self._clean_waveform(WaveformData(timestamps, bus_values), self.period_sec)
+        except UnicodeError:
+            self.error_code = LogicSaleaeWaveformFileReader.ERROR_CODE_NON_ASCII
+        except:
+            self._set_stream_format_error()
+
+    def _set_stream_format_error(self):
+        # non-ascii characters anywhere in the file take precedence, as in _parse_raw_content()
+        while True:
+            chunk = self.stream.read(self.stream_chunk_size)
+            if len(chunk) == 0:
+                break
+            if not self._is_ascii(chunk):
+                self.error_code = LogicSaleaeWaveformFileReader.ERROR_CODE_NON_ASCII
+                return
+        self.error_code = LogicSaleaeWaveformFileReader.ERROR_CODE_FORMAT
+
+    def _iter_stream_raw_columns(self):
+        """
+        Parse the rest of the stream as the waveform section, one chunk of complete lines at a
+        time.
+
+        Yields:
+          (timestamps, bus_values), two numpy arrays, not cleaned
+        Raises:
+          UnicodeError if the content includes non-ascii characters, or other exceptions if the
+          format is not correct
+        """
+        pending = b''
+        reached_end = False
+        while not reached_end:
+            chunk = self.stream.read(self.stream_chunk_size)
+            if not self._is_ascii(chunk):
+                raise UnicodeError('The file includes non-ascii characters')
+            reached_end = len(chunk) == 0
+
+            content = pending + chunk
+            if reached_end:
+                # same as stripping the whole file
+                body, pending = content.rstrip(), b''
+            else:
+                line_end_idx = content.rfind(b'\n')
+                if line_end_idx < 0:
+                    pending = content
+                    continue
+                body, pending = content[:line_end_idx], content[line_end_idx+1:]
+
+                # blank lines at the end of a chunk are only allowed if they are also at the end
+                # of the file, hence we defer them to the next chunk
+                content_end_idx = len(body.rstrip())
+                if content_end_idx == 0:
+                    body, pending = b'', body + b'\n' + pending
+                else:
+                    blank_line_idx = body.find(b'\n', content_end_idx)
+                    if blank_line_idx >= 0:
+                        body, pending = (body[:blank_line_idx],
+                                body[blank_line_idx+1:] + b'\n' + pending)
+
+            if len(body) > 0:
+                yield self._parse_waveform_section(body)
+
+    def _parse_waveform_section(self, waveform_section):
+        """
+        Returns:
+          (timestamps, bus_values), two numpy arrays
+        """
+        columns = self._parse_waveform_section_fast(waveform_section)
+        if columns is not None:
+            return columns
+
+        # same as _parse_content()
+        line_terms = [l.strip().split(',') for l in waveform_section.decode('ascii').split('\n')]
+        events = [(float(l[0]), int(l[1], 16)) for l in line_terms]
+        data = WaveformData.from_events(events)
+        return (data.timestamps, data.values)
+
+    def iter_waveform_chunks(self):
+        """
+        Parse and clean the waveform chunk by chunk. It is only available for the readers created
+        by from_file() with load_waveform=False, and the file can only be iterated once. Unlike
+        _clean_waveform(), the events should be in time order, as Logic Saleae exports them.
+
+        Yields:
+          WaveformData, the cleaned waveform in consecutive pieces
+        """
+        if self.error_code is not None:
+            raise Exception("There is an error while parsing content")
+        if self.stream is None:
+            raise Exception("The reader is not created from a file object")
+
+        try:
+            for chunk in self._clean_waveform_chunks(
+                    self._iter_stream_raw_columns(), self.period_sec):
+                yield chunk
+        except UnicodeError:
+            self.error_code = LogicSaleaeWaveformFileReader.ERROR_CODE_NON_ASCII
+            raise Exception("There is an error while parsing content")
+        except Exception:
+            self.error_code = LogicSaleaeWaveformFileReader.ERROR_CODE_FORMAT
+            raise Exception("There is an error while parsing content")
+
     def is_successfully_parsed(self):
         return self.error_code is None
 
@@ -195,3 +527,23 @@ class LogicSaleaeWaveformFileReader(WaveformQueryBase):
         result_sec = self._get_event_series(self.data, series_pins, start_time_sec, end_time_sec)
         
         return (series_name, result_sec)
+
+    def get_event_series_columns(self, series_idx, start_time_sec=None, end_time_sec=None):
+        """
+        Same as get_event_series(), but the time series is returned as columns, which is much
+        faster for a long waveform.
+
+        Returns:
+          (name, timestamps, bus_values)
+            - name: plot name, a string
+            - timestamps: a numpy array of timestamps in second
+            - bus_values: a numpy array of bus values
+        """
+
+        if self.error_code is not None:
+            raise Exception("There is an error while parsing content")
+
+        display_param = self.display_params[series_idx]
+        timestamps, bus_values = self._get_event_series_columns(
+                self.data, display_param['pins'], start_time_sec, end_time_sec)
+        return (display_param['name'], timestamps, bus_values)
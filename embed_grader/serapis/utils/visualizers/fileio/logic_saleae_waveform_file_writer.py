@@ -1,5 +1,6 @@
 import json
 import re
+import shutil
 
 
 """
@@ -20,6 +21,9 @@ An example of the file content of Logic Saleae waveform looks like the following
 Please see logic_saleae_waveform_file_reader.py for the specification of the file.
 """
 
+K_COPY_BUFFER_SIZE = 1 << 20
+
+
 class LogicSaleaeWaveformFileWriter(object):
 
     def __init__(self, file_path):
@@ -56,15 +60,14 @@ class LogicSaleaeWaveformFileWriter(object):
         if self.raw_data_path is None:
             raise Exception('"Raw data path" is not set')
 
-        with open(self.raw_data_path, 'rb') as f:
-            raw_waveform_data = f.read().decode()
-
-        with open(self.file_path, 'w') as fo:
+        # the raw data can be very large, hence it is copied chunk by chunk
+        with open(self.raw_data_path, 'rb') as f, open(self.file_path, 'wb') as fo:
             fo.write("\n".join(
                 ["Period: %f" % self.period_sec] +
                 ["Display start"] +
                 self.display_params +
                 ["Display end"] +
                 ["=="] +
-                [raw_waveform_data]
-            ))
+                [""]
+            ).encode())
+            shutil.copyfileobj(f, fo, K_COPY_BUFFER_SIZE)
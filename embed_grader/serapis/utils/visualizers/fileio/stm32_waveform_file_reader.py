@@ -1,7 +1,10 @@
 import json
 import re
+import numpy
 
 from serapis.utils.visualizers.fileio.waveform_query_base import WaveformQueryBase
+from serapis.utils.visualizers.fileio.waveform_query_base import WaveformData
+from serapis.utils.visualizers.fileio import waveform_cache
 
 """
 An example of the file content of STM32 waveform looks like the following:
@@ -53,9 +56,35 @@ class STM32WaveformFileReader(WaveformQueryBase):
     ERROR_CODE_NON_ASCII = 2
     ERROR_CODE_FORMAT = 3
 
-    def __init__(self, raw_content):
+    def __init__(self, raw_content, build_edge_index=False, cache_key=None):
+        """
+        Params:
+          raw_content: The content of the file in bytes
+          build_edge_index: If True, index the edges of all the pins once the file is loaded (see
+              WaveformData.with_edge_index()), which speeds up repeated edge queries.
+          cache_key: The key of the file in the waveform cache (e.g., computed by
+              WaveformCache.compute_stored_file_key()), or None to key it by the hash of
+              raw_content
+        """
         self._initialize_instance_variables()
-        self._parse_raw_content(raw_content)
+        self._parse_raw_content(raw_content, cache_key)
+        if build_edge_index and self.error_code is None:
+            self.data = self.data.with_edge_index()
+
+    @classmethod
+    def from_cache(cls, cache_key, build_edge_index=False):
+        """
+        Returns:
+          A reader of the waveform cached under cache_key, or None if it is not cached
+        """
+        reader = cls.__new__(cls)
+        reader._initialize_instance_variables()
+        if not waveform_cache.load_reader(reader, cache_key):
+            return None
+        reader.cache_key = cache_key
+        if build_edge_index:
+            reader.data = reader.data.with_edge_index()
+        return reader
 
     def _initialize_instance_variables(self):
         self.period_sec = None
@@ -65,76 +94,102 @@ class STM32WaveformFileReader(WaveformQueryBase):
         # `pins` (a list of integers)
         self.display_params = None
 
-        # data contains a list of tuples. Each tuple contains two items, a float representing
-        # start timestamp in ms, and an integer for a bus value
+        # data is a WaveformData, which contains two columns, the start timestamps in second and
+        # the bus values
         self.data = None
         
         self.error_code = None
 
-    def _parse_raw_content(self, raw_content):
+        # the key of the waveform in the waveform cache once it is parsed, see waveform_cache.py
+        self.cache_key = None
+
+    def _parse_raw_content(self, raw_content, cache_key=None):
         if len(raw_content) == 0:
             self.error_code = STM32WaveformFileReader.ERROR_CODE_EMPTY_FILE
             return
+
+        if cache_key is None:
+            cache_key = waveform_cache.WaveformCache.compute_key('stm32', raw_content)
+        if waveform_cache.load_reader(self, cache_key):
+            self.error_code = None
+            self.cache_key = cache_key
+            return
         
-        try:
-            content = raw_content.decode('ascii')
-        except:
+        if not self._is_ascii(raw_content):
             self.error_code = STM32WaveformFileReader.ERROR_CODE_NON_ASCII
             return
 
-        if not self._parse_content(content):
+        # The fast path only accepts well-formed files. Anything unusual goes through the line-by-
+        # line parser, which decides whether the file is acceptable.
+        if (not self._parse_raw_content_fast(raw_content)
+                and not self._parse_content(raw_content.decode('ascii'))):
             self.error_code = STM32WaveformFileReader.ERROR_CODE_FORMAT
             return
 
         self.error_code = None
+        self.cache_key = cache_key
+        waveform_cache.save_reader(self, cache_key)
 
-    def _parse_content(self, content):
-        try:
-            lines = content.strip().split('\n')
-            num_total_lines = len(lines)
-            line_idx = 0
-
-            # E.g., Period: 20
-            matches = re.search(r'^Period: *(\d+(\.\d*)?)', lines[line_idx])
-            if not matches:
-                return False
-            self.period_sec = float(matches.group(1))
-            line_idx += 1
+    def _parse_metadata_lines(self, lines):
+        """
+        Parse the metadata section, including the "==" separator line.
 
-            # E.g., Tick frequency: 5000
-            matches = re.search(r'^Tick frequency: *(\d+(\.\d*)?)', lines[line_idx])
-            if not matches:
-                return False
-            self.tick_frequency = float(matches.group(1))
+        Returns:
+          The index of the first line of the waveform section, or None if the format is not correct
+        """
+        num_total_lines = len(lines)
+        line_idx = 0
+
+        # E.g., Period: 20
+        matches = re.search(r'^Period: *(\d+(\.\d*)?)', lines[line_idx])
+        if not matches:
+            return None
+        self.period_sec = float(matches.group(1))
+        line_idx += 1
+
+        # E.g., Tick frequency: 5000
+        matches = re.search(r'^Tick frequency: *(\d+(\.\d*)?)', lines[line_idx])
+        if not matches:
+            return None
+        self.tick_frequency = float(matches.group(1))
+        line_idx += 1
+
+        # E.g., Display start
+        #       CTL,0
+        #       VAL,2,1
+        #       Display end
+        if not lines[line_idx].startswith('Display start'):
+            return None
+        line_idx += 1
+
+        self.display_params = []  # a list of {name, pins}
+        while line_idx < num_total_lines and not lines[line_idx].startswith('Display end'):
+            terms = lines[line_idx].split(',')
+            if len(terms) <= 1:
+                return None  # should have at least a name and a pin index
+            self.display_params.append({
+                'name': terms[0],
+                'pins': [int(x) for x in terms[1:]],
+            })
             line_idx += 1
 
-            tick_sec = 1. / self.tick_frequency
-
-            # E.g., Display start
-            #       CTL,0
-            #       VAL,2,1
-            #       Display end
-            if not lines[line_idx].startswith('Display start'):
-                return False
-            line_idx += 1
+        line_idx += 1
 
-            self.display_params = []  # a list of {name, pins}
-            while line_idx < num_total_lines and not lines[line_idx].startswith('Display end'):
-                terms = lines[line_idx].split(',')
-                if len(terms) <= 1:
-                    return False  # should have at least a name and a pin index
-                self.display_params.append({
-                    'name': terms[0],
-                    'pins': [int(x) for x in terms[1:]],
-                })
-                line_idx += 1
+        # E.g., ==
+        if not lines[line_idx].startswith('=='):
+            return None
+        line_idx += 1
 
-            line_idx += 1
+        return line_idx
 
-            # E.g., ==
-            if not lines[line_idx].startswith('=='):
+    def _parse_content(self, content):
+        try:
+            lines = content.strip().split('\n')
+            line_idx = self._parse_metadata_lines(lines)
+            if line_idx is None:
                 return False
-            line_idx += 1
+
+            tick_sec = 1. / self.tick_frequency
 
             # E.g., 68, 0, 0
             #       68, 30000, 3
@@ -151,6 +206,45 @@ class STM32WaveformFileReader(WaveformQueryBase):
 
         return True
 
+    def _parse_raw_content_fast(self, raw_content):
+        """
+        Parse the waveform section as a whole with numpy instead of line by line. It expects
+        exactly 3 integer columns in every line, and bus values that fit in int64.
+
+        Returns:
+          `True` if succeeded, `False` if the content should be parsed by _parse_content() instead
+        """
+        try:
+            content = raw_content.strip()
+            separator_idx = content.find(b'\n==')
+            if separator_idx < 0:
+                return False
+            waveform_section_idx = content.find(b'\n', separator_idx + 1)
+            if waveform_section_idx < 0:
+                waveform_section_idx = len(content)
+
+            lines = content[:waveform_section_idx].decode('ascii').split('\n')
+            if self._parse_metadata_lines(lines) != len(lines):
+                return False
+
+            tick_sec = 1. / self.tick_frequency
+
+            columns = self._split_waveform_section(content[waveform_section_idx+1:], 3)
+            if columns is None:
+                return False
+            event_types = columns[:, 0].astype(numpy.int64)
+            ticks = columns[:, 1].astype(numpy.float64)
+            bus_values = columns[:, 2].astype(numpy.int64)
+
+            event_mask = event_types == 68
+            data = WaveformData(ticks[event_mask] * tick_sec, bus_values[event_mask])
+            data = self._clean_waveform(data, self.period_sec)
+        except:
+            return False
+
+        self.data = data
+        return True
+
     def is_successfully_parsed(self):
         return self.error_code is None
 
@@ -225,3 +319,26 @@ class STM32WaveformFileReader(WaveformQueryBase):
         result_ms = [(t * 1000., v) for t, v in result_sec]
         
         return (series_name, result_ms)
+
+    def get_event_series_columns(self, series_idx, start_time_ms=None, end_time_ms=None):
+        """
+        Same as get_event_series(), but the time series is returned as columns, which is much
+        faster for a long waveform.
+
+        Returns:
+          (name, timestamps, bus_values)
+            - name: plot name, a string
+            - timestamps: a numpy array of timestamps in ms
+            - bus_values: a numpy array of bus values
+        """
+
+        if self.error_code is not None:
+            raise Exception("There is an error while parsing content")
+
+        start_time_sec = None if start_time_ms is None else start_time_ms / 1000.
+        end_time_sec = None if end_time_ms is None else end_time_ms / 1000.
+
+        display_param = self.display_params[series_idx]
+        timestamps_sec, bus_values = self._get_event_series_columns(
+                self.data, display_param['pins'], start_time_sec, end_time_sec)
+        return (display_param['name'], timestamps_sec * 1000., bus_values)
@@ -0,0 +1,304 @@
+import os
+import copy
+import hashlib
+import threading
+import collections
+
+from serapis.utils.visualizers.fileio.binary_waveform_file_reader import BinaryWaveformFileReader
+
+"""
+WaveformCache keeps parsed waveforms so that the same file is not parsed again by every page
+visit, every visualizer and every grading script run in a warm worker. A waveform is keyed by the
+type of the reader and the SHA-256 of the raw content, hence a modified file never hits a stale
+entry. A stored output file can also be keyed by its path, size and modification time (see
+WaveformCache.compute_stored_file_key()), so that the cache is looked up before the file is read.
+
+There are two tiers:
+  - memory: an LRU cache per process, limited by the total size of the waveform columns
+  - disk (optional, disabled by default): one binary waveform file (see
+    binary_waveform_file_reader.py) per entry, which is shared by all the processes and survives
+    restarts. Binary waveform files are memory-mapped, hence loading them is almost free. Entries
+    are never removed from the disk tier.
+
+The memory tier also keeps what the visualizers derive from a parsed waveform (e.g., the
+downsampling pyramid of each plot) along with the waveform, see load_derived() and save_derived().
+The derived objects are evicted together with the waveform, and are not written to the disk tier.
+
+The readers consult the cache by themselves. Django settings WAVEFORM_CACHE_MAX_BYTES and
+WAVEFORM_CACHE_DIR configure the cache. Outside django (e.g., in a grading script), only the memory
+tier with the default size is used.
+
+A cached waveform is shared by all the readers of the same file, hence its columns are read-only
+and the readers never modify it. A reader which indexes the edges does so on its own wrapper of the
+columns (see WaveformData.with_edge_index()).
+"""
+
+# Bump it when the readers change how a file is interpreted, so that old entries are ignored
+K_CACHE_VERSION = 1
+
+# Every process has its own memory tier (each web worker, the grading daemon, and each warm grading
+# script worker), hence the total memory is this size times the number of processes
+K_DEFAULT_MAX_NUM_BYTES = 64 << 20
+
+K_DISK_FILE_SUFFIX = '.wavebin'
+
+K_HASH_CHUNK_SIZE = 1 << 20
+
+_waveform_cache = None
+_waveform_cache_lock = threading.Lock()
+
+
+class CachedWaveform(object):
+    """
+    The parsed content of a waveform file, i.e., the attributes a reader sets while parsing.
+    """
+
+    def __init__(self, period_sec, tick_frequency, display_params, data):
+        self.period_sec = period_sec
+        self.tick_frequency = tick_frequency
+        self.display_params = display_params
+        self.data = data
+
+        # name -> (object, size in bytes), see WaveformCache.put_derived()
+        self.derived = {}
+
+    def get_num_bytes(self):
+        num_bytes = self.data.timestamps.nbytes + self.data.values.nbytes
+        for _, derived_num_bytes in self.derived.values():
+            num_bytes += derived_num_bytes
+        return num_bytes
+
+
+class WaveformCache(object):
+
+    def __init__(self, max_num_bytes=K_DEFAULT_MAX_NUM_BYTES, disk_dir=None):
+        """
+        Params:
+          max_num_bytes: The memory tier evicts the least recently used waveforms once the total
+              size of the cached columns exceeds it
+          disk_dir: The directory of the disk tier, or None to disable the disk tier
+        """
+        self.max_num_bytes = max_num_bytes
+        self.disk_dir = disk_dir
+
+        # key -> CachedWaveform, from the least recently used to the most recently used
+        self.entries = collections.OrderedDict()
+        self.num_bytes = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def compute_key(reader_name, raw_content):
+        content_hash = hashlib.sha256(raw_content).hexdigest()
+        return '%s-v%d-%s' % (reader_name, K_CACHE_VERSION, content_hash)
+
+    @staticmethod
+    def compute_file_key(reader_name, f):
+        """
+        Same as compute_key(), but hashes a file object opened in binary mode chunk by chunk, and
+        rewinds it afterwards.
+        """
+        hasher = hashlib.sha256()
+        for chunk in iter(lambda: f.read(K_HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+        f.seek(0)
+        return '%s-v%d-%s' % (reader_name, K_CACHE_VERSION, hasher.hexdigest())
+
+    @staticmethod
+    def compute_stored_file_key(reader_name, path):
+        """
+        Key a stored file by its path, size and modification time instead of its content, so that
+        a cached waveform is found without reading the file. It relies on the output files never
+        being modified in place, a re-executed task stores its outputs in new files.
+        """
+        stat = os.stat(path)
+        file_id = '%s:%d:%d' % (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        file_hash = hashlib.sha256(file_id.encode('utf-8')).hexdigest()
+        return '%s-v%d-file-%s' % (reader_name, K_CACHE_VERSION, file_hash)
+
+    def get(self, key):
+        """
+        Returns:
+          A CachedWaveform, or None if the waveform is not cached
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        cached_waveform = self._load_from_disk(key)
+        if cached_waveform is not None:
+            self._put_in_memory(key, cached_waveform)
+        return cached_waveform
+
+    def put(self, key, cached_waveform):
+        # cached columns are shared by all the readers of the same file
+        cached_waveform.data.timestamps.setflags(write=False)
+        cached_waveform.data.values.setflags(write=False)
+
+        self._put_in_memory(key, cached_waveform)
+        self._save_to_disk(key, cached_waveform)
+
+    def get_derived(self, key, name):
+        """
+        Returns:
+          The object derived from the waveform of key under name, or None if either the waveform
+          is not in the memory tier or the object is not stored
+        """
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            derived = self.entries[key].derived.get(name)
+            return derived[0] if derived else None
+
+    def put_derived(self, key, name, obj, num_bytes):
+        """
+        Store an object derived from the waveform of key, which counts towards the size of the
+        memory tier. Nothing is stored if the waveform is not in the memory tier.
+        """
+        with self.lock:
+            if key not in self.entries:
+                return
+            cached_waveform = self.entries[key]
+            if cached_waveform.get_num_bytes() + num_bytes > self.max_num_bytes:
+                return
+            if name in cached_waveform.derived:
+                self.num_bytes -= cached_waveform.derived[name][1]
+            cached_waveform.derived[name] = (obj, num_bytes)
+            self.num_bytes += num_bytes
+            self.entries.move_to_end(key)
+            self._evict()
+
+    def clear(self):
+        """
+        Empty the memory tier. The disk tier is left untouched.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.num_bytes = 0
+
+    def _put_in_memory(self, key, cached_waveform):
+        num_bytes = cached_waveform.get_num_bytes()
+        if num_bytes > self.max_num_bytes:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.num_bytes -= self.entries.pop(key).get_num_bytes()
+            self.entries[key] = cached_waveform
+            self.num_bytes += num_bytes
+            self._evict()
+
+    def _evict(self):
+        # the caller holds self.lock
+        while self.num_bytes > self.max_num_bytes:
+            _, evicted_waveform = self.entries.popitem(last=False)
+            self.num_bytes -= evicted_waveform.get_num_bytes()
+
+    def _get_disk_path(self, key):
+        return os.path.join(self.disk_dir, key + K_DISK_FILE_SUFFIX)
+
+    def _load_from_disk(self, key):
+        if self.disk_dir is None:
+            return None
+
+        path = self._get_disk_path(key)
+        if not os.path.isfile(path):
+            return None
+
+        reader = BinaryWaveformFileReader.from_file(path)
+        if not reader.is_successfully_parsed():
+            return None
+        return CachedWaveform(reader.period_sec, reader.tick_frequency, reader.display_params,
+                reader.data)
+
+    def _save_to_disk(self, key, cached_waveform):
+        if self.disk_dir is None:
+            return
+
+        # imported here because the writer depends on the text readers, which depend on this module
+        from serapis.utils.visualizers.fileio import binary_waveform_file_writer
+
+        # The disk tier is only an optimization, a failure to write it should not fail the reader.
+        # The file is written under a temporary name and then renamed, so that other processes
+        # never see a partial file.
+        path = self._get_disk_path(key)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            writer = binary_waveform_file_writer.BinaryWaveformFileWriter(tmp_path)
+            writer.set_period_sec(cached_waveform.period_sec)
+            writer.set_tick_frequency(cached_waveform.tick_frequency)
+            for param in cached_waveform.display_params:
+                writer.add_display_param(param['name'], param['pins'])
+            writer.set_waveform(cached_waveform.data)
+            writer.marshal()
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def get_waveform_cache():
+    """
+    Returns:
+      The WaveformCache shared by all the readers in this process
+    """
+    global _waveform_cache
+    with _waveform_cache_lock:
+        if _waveform_cache is None:
+            _waveform_cache = WaveformCache(*_get_cache_settings())
+        return _waveform_cache
+
+def load_reader(reader, key):
+    """
+    Set the parsed attributes of a reader from the cache.
+
+    Returns:
+      True if the waveform is cached
+    """
+    cached_waveform = get_waveform_cache().get(key)
+    if cached_waveform is None:
+        return False
+
+    reader.period_sec = cached_waveform.period_sec
+    if hasattr(reader, 'tick_frequency'):
+        reader.tick_frequency = cached_waveform.tick_frequency
+    reader.display_params = copy.deepcopy(cached_waveform.display_params)
+    reader.data = cached_waveform.data
+    return True
+
+def save_reader(reader, key):
+    """
+    Put the parsed attributes of a reader into the cache.
+    """
+    get_waveform_cache().put(key, CachedWaveform(reader.period_sec,
+            getattr(reader, 'tick_frequency', None), copy.deepcopy(reader.display_params),
+            reader.data))
+
+def load_derived(reader, name):
+    """
+    Returns:
+      The object derived from the waveform of a reader under name, or None if it is not cached
+    """
+    cache_key = getattr(reader, 'cache_key', None)
+    if cache_key is None:
+        return None
+    return get_waveform_cache().get_derived(cache_key, name)
+
+def save_derived(reader, name, obj, num_bytes):
+    """
+    Keep an object derived from the waveform of a reader, as long as the waveform is cached.
+    """
+    cache_key = getattr(reader, 'cache_key', None)
+    if cache_key is not None:
+        get_waveform_cache().put_derived(cache_key, name, obj, num_bytes)
+
+def _get_cache_settings():
+    # the readers are also used by grading scripts, which may run without django
+    try:
+        from django.conf import settings
+        return (getattr(settings, 'WAVEFORM_CACHE_MAX_BYTES', K_DEFAULT_MAX_NUM_BYTES),
+                getattr(settings, 'WAVEFORM_CACHE_DIR', None))
+    except Exception:
+        return (K_DEFAULT_MAX_NUM_BYTES, None)
@@ -1,13 +1,144 @@
 import json
 import re
-import bisect
 import numpy
 
 """
 WaveformQueryBase is an abstract class which provides waveform event cleaning methods and handy
 query methods, such as retrieving all rising edges.
+
+Waveforms are stored in columns by WaveformData, i.e., one numpy array for timestamps and another
+for bus values, so that cleaning and queries are done by vectorized operations rather than python
+loops over events.
 """
 
+# Bus values are rearranged through a lookup table when the pins are scattered (i.e., they form
+# many runs of consecutive pins) but all of them are low enough to keep the table small.
+K_BUS_LOOKUP_TABLE_MAX_PIN_INDEX = 12
+K_BUS_LOOKUP_TABLE_MIN_NUM_PIN_RUNS = 3
+K_MAX_NUM_BUS_LOOKUP_TABLES = 64
+
+# wraps a python integer into the range of uint64, i.e., two's complement for negative values
+K_UINT64_MASK = (1 << 64) - 1
+
+# tuple of pin indexes -> numpy array of uint64
+_bus_lookup_tables = {}
+
+_empty_timestamps = numpy.zeros(0, dtype=numpy.float64)
+
+
+class WaveformData(object):
+    """
+    A waveform stored as two contiguous columns: `timestamps` (float64, in second) and `values`
+    (uint64, the bus values). To stay compatible with the code written against the old list
+    representation, it also behaves as a read-only list of (timestamp, bus_value) tuples.
+    """
+
+    def __init__(self, timestamps, values):
+        """
+        Negative bus values are stored in 64-bit two's complement, hence every pin reads the same
+        bit as it does from the python integer.
+        """
+        self.timestamps = numpy.ascontiguousarray(timestamps, dtype=numpy.float64)
+        values = numpy.asarray(values)
+        if values.dtype.kind == 'i':
+            values = values.astype(numpy.uint64)
+        self.values = numpy.ascontiguousarray(values, dtype=numpy.uint64)
+
+        # a PinEdgeIndex built by build_edge_index(), or None if edges are computed per query
+        self.edge_index = None
+
+    @classmethod
+    def from_events(cls, events):
+        """
+        Params:
+          events: A list of (timestamp, bus_value) tuples
+        """
+        events = list(events)
+        return cls(
+                numpy.fromiter((e[0] for e in events), dtype=numpy.float64, count=len(events)),
+                numpy.fromiter((e[1] & K_UINT64_MASK for e in events), dtype=numpy.uint64,
+                        count=len(events)),
+        )
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __iter__(self):
+        return zip(self.timestamps.tolist(), self.values.tolist())
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return WaveformData(self.timestamps[idx], self.values[idx])
+        return (self.timestamps[idx].item(), self.values[idx].item())
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return 'WaveformData(%s)' % list(self)
+
+    def build_edge_index(self):
+        """
+        Index the edges of all the pins, so that the edge queries of WaveformQueryBase become
+        binary searches. It is worth it when the same waveform is queried many times. The waveform
+        should be cleaned and should not be modified afterwards.
+        """
+        self.edge_index = PinEdgeIndex(self)
+
+    def with_edge_index(self):
+        """
+        Same as build_edge_index(), but the index is built on a new WaveformData which shares the
+        columns with this one, and this one is left untouched. Use it on a waveform which may be
+        shared, e.g., by the waveform cache.
+        """
+        data = WaveformData(self.timestamps, self.values)
+        data.build_edge_index()
+        return data
+
+
+class PinEdgeIndex(object):
+    """
+    The timestamps of the rising edges and the falling edges of each pin, each of which is a sorted
+    numpy array. A pin which never changes, including any pin above the highest bit of the bus
+    values, has no edges.
+    """
+
+    def __init__(self, data):
+        """
+        Params:
+          data: A cleaned WaveformData
+        """
+        self.rising_timestamps = {}
+        self.falling_timestamps = {}
+
+        # only the events which change the bus value can be edges
+        changed_bits = data.values[1:] ^ data.values[:-1]
+        transition_idxs = numpy.flatnonzero(changed_bits)
+        transition_timestamps = data.timestamps[1:][transition_idxs]
+        changed_bits = changed_bits[transition_idxs]
+        new_values = data.values[1:][transition_idxs]
+
+        all_changed_bits = int(numpy.bitwise_or.reduce(changed_bits)) if len(changed_bits) else 0
+        num_pins = all_changed_bits.bit_length()
+        for pin_index in range(num_pins):
+            pin_mask = numpy.uint64(1 << pin_index)
+            pin_changed = (changed_bits & pin_mask) != 0
+            pin_high = (new_values & pin_mask) != 0
+            self.rising_timestamps[pin_index] = transition_timestamps[pin_changed & pin_high]
+            self.falling_timestamps[pin_index] = transition_timestamps[pin_changed & ~pin_high]
+
+    def get_edge_timestamps(self, pin_index, is_rising):
+        """
+        Returns:
+          A sorted numpy array of the timestamps of the rising (or falling) edges
+        """
+        edge_timestamps = self.rising_timestamps if is_rising else self.falling_timestamps
+        return edge_timestamps.get(pin_index, _empty_timestamps)
+
+
 class WaveformQueryBase(object):
 
     def __init__(self):
@@ -37,43 +168,148 @@ class WaveformQueryBase(object):
           - same value till the end.
 
         Params:
-          data: A list of tuples. Each tuple contains two elements, a real number indicating the
-              timestamp in second, and an integer representing bus value.
+          data: A WaveformData, or a list of tuples. Each tuple contains two elements, a real
+              number indicating the timestamp in second, and an integer representing bus value.
           period_sec: A real number indicating the length of the time range. The time range always
               starts at 0.
 
         Return:
-          A list of tuples. Same format as data.
+          A WaveformData.
         """
 
-        # clone the data passed in
-        new_data = list(data)
+        data = self._as_waveform_data(data)
+        timestamps, values = data.timestamps, data.values
 
         # We cannot continue if there is no sample points in data - we assume the device outputs
         # 0 all the time.
-        if len(new_data) == 0:
-            new_data = [(0.0, 0), (period_sec, 0)]
+        if len(timestamps) == 0:
+            timestamps = numpy.array([0.0, period_sec], dtype=numpy.float64)
+            values = numpy.zeros(2, dtype=numpy.uint64)
 
         # If there is an event right before time 0, then it is the waveform value at time 0.
-        early_events = [e for e in new_data if e[0] < 0.]
-        if len(early_events) > 0:
-            target_event = max(early_events)  # the event right before time 0
-            new_data.append((0.0, target_event[1]))
-
-        # make events in an ascending order, and filter out anything not withing the range
-        new_data.sort()
-        new_data = list(filter(lambda x: 0. <= x[0] and x[0] <= period_sec, new_data))
-            
+        early_mask = timestamps < 0.
+        if early_mask.any():
+            early_timestamps, early_values = timestamps[early_mask], values[early_mask]
+            last_early_time = early_timestamps.max()
+            value_at_zero = early_values[early_timestamps == last_early_time].max()
+            timestamps = numpy.append(timestamps, 0.0)
+            values = numpy.append(values, value_at_zero)
+
+        # make events in an ascending order (by time, then by value), and filter out anything not
+        # withing the range
+        order = numpy.lexsort((values, timestamps))
+        timestamps, values = timestamps[order], values[order]
+        in_range_mask = (0. <= timestamps) & (timestamps <= period_sec)
+        timestamps, values = timestamps[in_range_mask], values[in_range_mask]
+
         # If the first event value starts later than time 0, fill in bus value 0 till the first
         # event
-        if new_data[0][0] != 0.:
-            new_data[0:0] = [(0.0, 0)]
+        if timestamps[0] != 0.:
+            timestamps = numpy.insert(timestamps, 0, 0.0)
+            values = numpy.insert(values, 0, 0)
+
+        # Add a dummy end pin value event (with the event value of the last event)
+        if timestamps[-1] < period_sec:
+            timestamps = numpy.append(timestamps, period_sec)
+            values = numpy.append(values, values[-1])
+
+        return WaveformData(timestamps, values)
+
+    def _clean_waveform_chunks(self, chunks, period_sec):
+        """
+        The streaming version of _clean_waveform(). The chunks are cleaned one by one so that the
+        whole waveform is never held in memory. Events are sorted within a chunk, but the chunks
+        should be in time order, i.e., no event is earlier than the last event of the previous
+        chunk.
+
+        Params:
+          chunks: An iterable of (timestamps, bus_values), two numpy arrays per chunk
+          period_sec: A real number indicating the length of the time range. The time range always
+              starts at 0.
+        Yields:
+          WaveformData. Concatenating them gives the same result as _clean_waveform().
+        Raises:
+          ValueError if the chunks are not in time order
+        """
+
+        value_at_zero = None  # the value of the last event before time 0
+        last_yielded_event = None
+        has_events = False
+
+        for timestamps, values in self._iter_sorted_chunks(chunks):
+            has_events = True
+
+            # crop the events which are beyond the time range
+            start_idx = numpy.searchsorted(timestamps, 0., side='left')
+            end_idx = numpy.searchsorted(timestamps, period_sec, side='right')
+            if start_idx > 0:
+                value_at_zero = values[start_idx - 1]
+            timestamps, values = timestamps[start_idx:end_idx], values[start_idx:end_idx]
+            if len(timestamps) == 0:
+                continue
+
+            # the beginning of the waveform, see _clean_waveform() for the boundary handling
+            if last_yielded_event is None:
+                if value_at_zero is not None:
+                    timestamps = numpy.insert(timestamps, 0, 0.0)
+                    values = numpy.insert(values, 0, value_at_zero)
+                    order = numpy.lexsort((values, timestamps))
+                    timestamps, values = timestamps[order], values[order]
+                if timestamps[0] != 0.:
+                    timestamps = numpy.insert(timestamps, 0, 0.0)
+                    values = numpy.insert(values, 0, 0)
+
+            last_yielded_event = (timestamps[-1], values[-1])
+            yield WaveformData(timestamps, values)
+
+        # no event within the time range
+        if last_yielded_event is None:
+            if value_at_zero is not None:
+                last_yielded_event = (0.0, value_at_zero)
+            elif not has_events:
+                yield WaveformData([0.0, period_sec], [0, 0])
+                return
+            else:
+                raise ValueError('No event within the time range')
+            yield WaveformData([last_yielded_event[0]], [last_yielded_event[1]])
 
         # Add a dummy end pin value event (with the event value of the last event)
-        if new_data[-1][0] < period_sec:
-            new_data.append((period_sec, new_data[-1][1]))
+        if last_yielded_event[0] < period_sec:
+            yield WaveformData([period_sec], [last_yielded_event[1]])
 
-        return new_data
+    def _iter_sorted_chunks(self, chunks):
+        """
+        Sort the events of each chunk by time and then by value, as _clean_waveform() does. The
+        events sharing the last timestamp of a chunk are held back and sorted together with the
+        next chunk, so that the concatenation is sorted as a whole.
+
+        Yields:
+          (timestamps, bus_values), two non-empty numpy arrays
+        Raises:
+          ValueError if the chunks are not in time order
+        """
+        held_timestamps = numpy.zeros(0, dtype=numpy.float64)
+        held_values = numpy.zeros(0, dtype=numpy.uint64)
+        for timestamps, values in chunks:
+            if len(timestamps) == 0:
+                continue
+            timestamps = numpy.asarray(timestamps, dtype=numpy.float64)
+            values = numpy.asarray(values, dtype=numpy.uint64)
+            if len(held_timestamps) > 0 and timestamps.min() < held_timestamps[0]:
+                raise ValueError('Events are not in time order')
+
+            timestamps = numpy.concatenate((held_timestamps, timestamps))
+            values = numpy.concatenate((held_values, values))
+            order = numpy.lexsort((values, timestamps))
+            timestamps, values = timestamps[order], values[order]
+
+            held_idx = numpy.searchsorted(timestamps, timestamps[-1], side='left')
+            held_timestamps, held_values = timestamps[held_idx:], values[held_idx:]
+            if held_idx > 0:
+                yield (timestamps[:held_idx], values[:held_idx])
+
+        if len(held_timestamps) > 0:
+            yield (held_timestamps, held_values)
 
     def _get_event_series(self, data, pin_indexes, start_time_sec=None, end_time_sec=None):
         """
@@ -84,8 +320,8 @@ class WaveformQueryBase(object):
         timestamp of the last event (theorically to be period length.)
 
         Params:
-          data: A list of tuples representing the waveform. This method assumes that data is
-              cleaned by _cleaned_waveform().
+          data: A WaveformData (or a list of tuples) representing the waveform. This method
+              assumes that data is cleaned by _cleaned_waveform().
           pin_indexes: Can be an integer or a list of integers. Representing how a new bus is
               arranged, the first element is the most significant value.
           start_time_sec: A Float number
@@ -95,40 +331,9 @@ class WaveformQueryBase(object):
               and end_time_sec. Will filter out duplicate transitions.
         """
 
-        # convert pin_indexes to a list if it is an integer
-        if type(pin_indexes) is int:
-            pin_indexes = [pin_indexes]
-
-        start_time_sec, end_time_sec = self._refine_time_bounds(data, start_time_sec, end_time_sec)
-
-        # get bus value based on pin configurations
-        series_data = [(t, self._rearrange_bus(pin_indexes, bus_value)) for t, bus_value in data]
-
-        # get transitions within the range
-        middle_idx_events = list(filter(
-            lambda x: start_time_sec <= x[1][0] and x[1][0] <= end_time_sec,
-            enumerate(series_data),
-        ))
-        candidate_events = [e for _, e in middle_idx_events]
-
-        # handle start boundary
-        sidx = middle_idx_events[0][0]
-        if sidx > 0 and candidate_events[0][0] > start_time_sec:
-            candidate_events[0:0] = [(start_time_sec, series_data[sidx - 1][1])]
-
-        # filter out repeating transitions
-        ret_events = []
-        ret_events.append(candidate_events[0])
-        for cur_event in candidate_events[1:]:
-            t, bus_value = cur_event
-            if bus_value != ret_events[-1][1]:
-                ret_events.append(cur_event)
-
-        # handle end boundary
-        if ret_events[-1][0] < end_time_sec:
-            ret_events.append((end_time_sec, ret_events[-1][1]))
-        
-        return ret_events
+        timestamps, values = self._get_event_series_columns(
+                data, pin_indexes, start_time_sec, end_time_sec)
+        return list(zip(timestamps.tolist(), values.tolist()))
 
     def _get_rising_edge_events(self, data, pin_index, start_time_sec=None, end_time_sec=None):
         """
@@ -137,8 +342,8 @@ class WaveformQueryBase(object):
         start_time_sec and end_time_sec.
 
         Params:
-          data: A list of tuples representing the waveform. This method assumes that data is
-              cleaned by _cleaned_waveform().
+          data: A WaveformData (or a list of tuples) representing the waveform. This method
+              assumes that data is cleaned by _cleaned_waveform().
           pin_index: An integer.
           start_time_sec: A Float number
           end_time_sec: A Float number
@@ -146,18 +351,7 @@ class WaveformQueryBase(object):
           A list of real numbers representing the timestamps of all the rising edges.
         """
 
-        start_time_sec, end_time_sec = self._refine_time_bounds(data, start_time_sec, end_time_sec)
-        event_series = self._get_event_series(data, pin_index)
-        
-        # detailed_events is a list of (timestamp, prev_value, cur_value)
-        detailed_events = zip(
-                [t for t, _ in event_series[1:]],
-                [v for _, v in event_series[:-1]],
-                [v for _, v in event_series[1:]],
-        )
-
-        return [t for t, prev, cur in detailed_events
-                if start_time_sec <= t and t <= end_time_sec and prev == 0 and cur == 1]
+        return self._get_edge_events(data, pin_index, 0, 1, start_time_sec, end_time_sec)
 
     def _get_falling_edge_events(self, data, pin_index, start_time_sec=None, end_time_sec=None):
         """
@@ -166,8 +360,8 @@ class WaveformQueryBase(object):
         start_time_sec and end_time_sec.
 
         Params:
-          data: A list of tuples representing the waveform. This method assumes that data is
-              cleaned by _cleaned_waveform().
+          data: A WaveformData (or a list of tuples) representing the waveform. This method
+              assumes that data is cleaned by _cleaned_waveform().
           pin_index: An integer.
           start_time_sec: A Float number
           end_time_sec: A Float number
@@ -175,26 +369,60 @@ class WaveformQueryBase(object):
           A list of real numbers representing the timestamps of all the rising edges.
         """
 
-        start_time_sec, end_time_sec = self._refine_time_bounds(data, start_time_sec, end_time_sec)
-        event_series = self._get_event_series(data, pin_index)
-        
-        # detailed_events is a list of (timestamp, prev_value, cur_value)
-        detailed_events = zip(
-                [t for t, _ in event_series[1:]],
-                [v for _, v in event_series[:-1]],
-                [v for _, v in event_series[1:]],
-        )
+        return self._get_edge_events(data, pin_index, 1, 0, start_time_sec, end_time_sec)
+
+    def _count_rising_edge_events(self, data, pin_index, start_time_sec=None, end_time_sec=None):
+        """
+        Same as len(_get_rising_edge_events()), but does not build the list.
+        """
+
+        return len(self._get_edge_timestamps(data, pin_index, 0, 1, start_time_sec, end_time_sec))
+
+    def _count_falling_edge_events(self, data, pin_index, start_time_sec=None, end_time_sec=None):
+        """
+        Same as len(_get_falling_edge_events()), but does not build the list.
+        """
+
+        return len(self._get_edge_timestamps(data, pin_index, 1, 0, start_time_sec, end_time_sec))
+
+    def _get_pulse_widths(self, data, pin_index, pulse_value=1, start_time_sec=None,
+            end_time_sec=None):
+        """
+        Get the pulses of a certain pin which are entirely within the specified time range, i.e.,
+        both the edge that starts a pulse and the edge that ends it are within the range. We use
+        the same definition in _get_event_series() for start_time_sec and end_time_sec.
 
-        return [t for t, prev, cur in detailed_events
-                if start_time_sec <= t and t <= end_time_sec and prev == 1 and cur == 0]
+        Params:
+          data: A WaveformData (or a list of tuples) representing the waveform. This method
+              assumes that data is cleaned by _cleaned_waveform().
+          pin_index: An integer.
+          pulse_value: 1 for high pulses (from a rising edge to a falling edge), 0 for low pulses
+          start_time_sec: A Float number
+          end_time_sec: A Float number
+        Returns:
+          A list of (start_time, width) in second, ordered by start_time
+        """
+
+        data = self._as_waveform_data(data)
+        start_edges = self._get_edge_timestamps(
+                data, pin_index, 1 - pulse_value, pulse_value, start_time_sec, end_time_sec)
+        end_edges = self._get_edge_timestamps(
+                data, pin_index, pulse_value, 1 - pulse_value, start_time_sec, end_time_sec)
+
+        # a pulse ends at the first opposite edge after it starts
+        end_idxs = numpy.searchsorted(end_edges, start_edges, side='right')
+        complete_mask = end_idxs < len(end_edges)
+        start_edges = start_edges[complete_mask]
+        widths = end_edges[end_idxs[complete_mask]] - start_edges
+        return list(zip(start_edges.tolist(), widths.tolist()))
     
     def _get_bus_value(self, data, pin_indexes, query_time_sec):
         """
         Get the bus value of the waveform at a certain time point.
 
         Params:
-          data: A list of tuples representing the waveform. This method assumes that data is
-              cleaned by _cleaned_waveform().
+          data: A WaveformData (or a list of tuples) representing the waveform. This method
+              assumes that data is cleaned by _cleaned_waveform().
           pin_indexes: Can be an integer or a list of integers. Representing how a new bus is
               arranged, the first element is the most significant value.
           query_time_sec: A Float number. The time point to be queried.
@@ -202,19 +430,191 @@ class WaveformQueryBase(object):
           An integer indicating the bus value, or None if the time is beyond the bound
         """
 
-        if query_time_sec < data[0][0] or query_time_sec > data[-1][0]:
-            return None
+        return self._get_bus_values(data, pin_indexes, [query_time_sec])[0]
+
+    def _get_bus_values(self, data, pin_indexes, query_times_sec):
+        """
+        Same as _get_bus_value(), but queries many time points at once, e.g., sampling a bus at
+        every tick.
+
+        Params:
+          data: A WaveformData (or a list of tuples) representing the waveform. This method
+              assumes that data is cleaned by _cleaned_waveform().
+          pin_indexes: Can be an integer or a list of integers. Representing how a new bus is
+              arranged, the first element is the most significant value.
+          query_times_sec: A list (or a numpy array) of Float numbers, not necessarily sorted.
+        Returns:
+          A list of integers, each of which is the bus value at the corresponding time point, or
+              None if the time is beyond the bound
+        """
+
+        bus_values, in_range_mask = self._get_bus_values_columns(
+                data, pin_indexes, query_times_sec)
+        return [v if in_range else None
+                for v, in_range in zip(bus_values.tolist(), in_range_mask.tolist())]
+
+    def _get_bus_values_columns(self, data, pin_indexes, query_times_sec):
+        """
+        Same as _get_bus_values(), but returns numpy arrays.
+
+        Returns:
+          (bus_values, in_range_mask), where bus_values is a numpy array of uint64 and
+              in_range_mask is a numpy array of bool. The bus value of a time point beyond the
+              bound is 0, and its in_range_mask is False.
+        """
+
+        data = self._as_waveform_data(data)
+        timestamps = data.timestamps
+        query_times_sec = numpy.asarray(query_times_sec, dtype=numpy.float64)
 
         # convert pin_indexes to a list if it is an integer
         if type(pin_indexes) is int:
             pin_indexes = [pin_indexes]
 
-        idx = bisect.bisect_right(data, (query_time_sec, 1 << 32))
-        return self._rearrange_bus(pin_indexes, data[idx-1][1])
+        # NaN is never in range, since all the comparisons are False
+        in_range_mask = (timestamps[0] <= query_times_sec) & (query_times_sec <= timestamps[-1])
+
+        # the event at or right before each time point. Time points beyond the bound are clipped
+        # to an arbitrary event and masked out afterwards.
+        idxs = numpy.searchsorted(timestamps, query_times_sec, side='right') - 1
+        numpy.clip(idxs, 0, len(timestamps) - 1, out=idxs)
+        bus_values = self._rearrange_bus_values(pin_indexes, data.values[idxs])
+        bus_values[~in_range_mask] = 0
+        return (bus_values, in_range_mask)
+
+    def _is_ascii(self, raw_content):
+        """
+        Returns:
+          `True` if raw_content, a bytes object, has no byte above 0x7f
+        """
+        buf = numpy.frombuffer(raw_content, dtype=numpy.uint8)
+        return len(buf) == 0 or buf.max() < 0x80
+
+    def _split_waveform_section(self, waveform_section, num_columns):
+        """
+        Split a comma-separated waveform section into fields without looking at each line in
+        python. Fields keep their surrounding whitespace.
+
+        Params:
+          waveform_section: A bytes object, the lines of events
+          num_columns: Number of fields expected in every line
+        Returns:
+          A 2D numpy array of bytes, one row per line, or None if any line does not have exactly
+          num_columns fields
+        """
+        if len(waveform_section) == 0:
+            return numpy.zeros((0, num_columns), dtype=bytes)
+
+        buf = numpy.frombuffer(waveform_section, dtype=numpy.uint8)
+        newline_positions = numpy.flatnonzero(buf == ord('\n'))
+        comma_positions = numpy.flatnonzero(buf == ord(','))
+        num_commas_before_newlines = numpy.searchsorted(comma_positions, newline_positions)
+        num_commas_per_line = numpy.diff(numpy.concatenate(
+                ([0], num_commas_before_newlines, [len(comma_positions)])))
+        if (num_commas_per_line != num_columns - 1).any():
+            return None
+
+        fields = waveform_section.replace(b'\n', b',').split(b',')
+        return numpy.array(fields, dtype=bytes).reshape(len(newline_positions) + 1, num_columns)
 
     ########################################################################
     #   Private helper functions. Should never be called from subclasses   #
     ########################################################################
+
+    def _as_waveform_data(self, data):
+        if isinstance(data, WaveformData):
+            return data
+        return WaveformData.from_events(data)
+
+    def _get_event_series_columns(self, data, pin_indexes, start_time_sec=None,
+            end_time_sec=None):
+        """
+        Same as _get_event_series(), but returns the series as columns.
+
+        Returns:
+          (timestamps, bus_values), two numpy arrays
+        """
+
+        data = self._as_waveform_data(data)
+
+        # convert pin_indexes to a list if it is an integer
+        if type(pin_indexes) is int:
+            pin_indexes = [pin_indexes]
+
+        start_time_sec, end_time_sec = self._refine_time_bounds(data, start_time_sec, end_time_sec)
+        # a range which ends before the waveform starts is empty, rather than reversed
+        end_time_sec = max(start_time_sec, end_time_sec)
+
+        # Locate the events within the range by binary search. Only these events, plus the one
+        # right before the range which gives the value at start_time_sec, are touched.
+        start_idx = numpy.searchsorted(data.timestamps, start_time_sec, side='left')
+        end_idx = max(start_idx, numpy.searchsorted(data.timestamps, end_time_sec, side='right'))
+        candidate_timestamps = data.timestamps[start_idx:end_idx]
+
+        # get bus value based on pin configurations
+        if start_idx < end_idx and candidate_timestamps[0] == start_time_sec:
+            candidate_values = self._rearrange_bus_values(
+                    pin_indexes, data.values[start_idx:end_idx])
+        else:
+            # handle start boundary. The value is inherited from the event before the range.
+            candidate_values = self._rearrange_bus_values(
+                    pin_indexes, data.values[start_idx-1:end_idx])
+            candidate_timestamps = numpy.insert(candidate_timestamps, 0, start_time_sec)
+
+        # filter out repeating transitions
+        keep_mask = numpy.empty(len(candidate_values), dtype=bool)
+        keep_mask[0] = True
+        numpy.not_equal(candidate_values[1:], candidate_values[:-1], out=keep_mask[1:])
+        ret_timestamps = candidate_timestamps[keep_mask]
+        ret_values = candidate_values[keep_mask]
+
+        # handle end boundary
+        if ret_timestamps[-1] < end_time_sec:
+            ret_timestamps = numpy.append(ret_timestamps, end_time_sec)
+            ret_values = numpy.append(ret_values, ret_values[-1])
+
+        return (ret_timestamps, ret_values)
+
+    def _get_edge_events(self, data, pin_index, prev_value, cur_value, start_time_sec,
+            end_time_sec):
+        """
+        Returns:
+          A list of timestamps where the pin changes from prev_value to cur_value
+        """
+
+        return self._get_edge_timestamps(
+                data, pin_index, prev_value, cur_value, start_time_sec, end_time_sec).tolist()
+
+    def _get_edge_timestamps(self, data, pin_index, prev_value, cur_value, start_time_sec,
+            end_time_sec):
+        """
+        Same as _get_edge_events(), but returns a numpy array. It is a slice of the edge index if
+        the waveform has one.
+        """
+
+        data = self._as_waveform_data(data)
+        start_time_sec, end_time_sec = self._refine_time_bounds(data, start_time_sec, end_time_sec)
+        if start_time_sec > end_time_sec:
+            return _empty_timestamps
+
+        if data.edge_index is not None:
+            edge_timestamps = data.edge_index.get_edge_timestamps(pin_index, cur_value == 1)
+            start_idx = numpy.searchsorted(edge_timestamps, start_time_sec, side='left')
+            end_idx = numpy.searchsorted(edge_timestamps, end_time_sec, side='right')
+            return edge_timestamps[start_idx:end_idx]
+
+        # An edge at start_time_sec is only visible if the series starts from the event before
+        start_idx = numpy.searchsorted(data.timestamps, start_time_sec, side='left')
+        series_start_time_sec = data.timestamps[start_idx-1] if start_idx > 0 else start_time_sec
+        timestamps, values = self._get_event_series_columns(
+                data, pin_index, series_start_time_sec, end_time_sec)
+
+        transition_timestamps = timestamps[1:]
+        edge_mask = ((start_time_sec <= transition_timestamps)
+                & (transition_timestamps <= end_time_sec)
+                & (values[:-1] == prev_value)
+                & (values[1:] == cur_value))
+        return transition_timestamps[edge_mask]
     
     def _rearrange_bus(self, pin_indexes, original_bus_value):
         """
@@ -232,6 +632,64 @@ class WaveformQueryBase(object):
             ret |= ((original_bus_value & (1 << i)) >> i)
         return ret
 
+    def _rearrange_bus_values(self, pin_indexes, original_bus_values):
+        """
+        Same as _rearrange_bus(), but works on a numpy array of bus values at once. Consecutive
+        pins (e.g., [7, 6, 5, 4]) are extracted together by one shift and one mask, and a bus made
+        of many scattered low pins is translated through a cached lookup table.
+
+        Params:
+          pin_indexes: a list presenting pins to be considered
+          original_bus_values: a numpy array of uint64
+        Returns:
+          A numpy array of uint64
+        """
+        pin_runs = self._get_pin_runs(pin_indexes)
+        if (len(pin_runs) >= K_BUS_LOOKUP_TABLE_MIN_NUM_PIN_RUNS
+                and max(pin_indexes) <= K_BUS_LOOKUP_TABLE_MAX_PIN_INDEX):
+            lookup_table = self._get_bus_lookup_table(pin_indexes, pin_runs)
+            index_mask = numpy.uint64(len(lookup_table) - 1)
+            return lookup_table[(original_bus_values & index_mask).astype(numpy.intp)]
+        return self._rearrange_bus_values_by_pin_runs(pin_runs, original_bus_values)
+
+    def _rearrange_bus_values_by_pin_runs(self, pin_runs, original_bus_values):
+        ret = numpy.zeros(len(original_bus_values), dtype=numpy.uint64)
+        for lowest_pin, width, output_shift in pin_runs:
+            run_values = original_bus_values >> numpy.uint64(lowest_pin)
+            if width < 64:
+                run_values = run_values & numpy.uint64((1 << width) - 1)
+            ret |= run_values << numpy.uint64(output_shift)
+        return ret
+
+    def _get_pin_runs(self, pin_indexes):
+        """
+        Split pin_indexes into runs of consecutive pins in descending order, each of which can be
+        moved to its place in the new bus as a whole.
+
+        Returns:
+          A list of (lowest_pin, width, output_shift). The run occupies the bits of the new bus
+          starting from output_shift.
+        """
+        num_pins = len(pin_indexes)
+        pin_runs = []
+        run_start = 0
+        for k in range(1, num_pins + 1):
+            if k == num_pins or pin_indexes[k] != pin_indexes[k-1] - 1:
+                width = k - run_start
+                pin_runs.append((pin_indexes[k-1], width, num_pins - k))
+                run_start = k
+        return pin_runs
+
+    def _get_bus_lookup_table(self, pin_indexes, pin_runs):
+        key = tuple(pin_indexes)
+        if key not in _bus_lookup_tables:
+            if len(_bus_lookup_tables) >= K_MAX_NUM_BUS_LOOKUP_TABLES:
+                _bus_lookup_tables.clear()
+            all_bus_values = numpy.arange(1 << (max(pin_indexes) + 1), dtype=numpy.uint64)
+            _bus_lookup_tables[key] = self._rearrange_bus_values_by_pin_runs(
+                    pin_runs, all_bus_values)
+        return _bus_lookup_tables[key]
+
     def _refine_time_bounds(self, data, start_time_sec, end_time_sec):
         """
         If start_time_sec is None or earlier than the first event, set it to the beginning
@@ -241,14 +699,18 @@ class WaveformQueryBase(object):
           (new_start_time_sec, new_end_time_sec)
         """
 
+        data = self._as_waveform_data(data)
+        first_time_sec = data.timestamps[0].item()
+        last_time_sec = data.timestamps[-1].item()
+
         # replace the default value
         if start_time_sec is None:
-            start_time_sec = data[0][0]
+            start_time_sec = first_time_sec
         if end_time_sec is None:
-            end_time_sec = data[-1][0]
+            end_time_sec = last_time_sec
 
         # correct the time bounds if they are not correctly set
-        start_time_sec = max(data[0][0], start_time_sec)
-        end_time_sec = min(data[-1][0], end_time_sec)
+        start_time_sec = max(first_time_sec, start_time_sec)
+        end_time_sec = min(last_time_sec, end_time_sec)
         
         return (start_time_sec, end_time_sec)
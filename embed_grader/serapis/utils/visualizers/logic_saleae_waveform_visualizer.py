@@ -4,13 +4,47 @@ import re
 from embed_grader import settings
 
 from serapis.utils.visualizers.visualizer_base import VisualizerBase
+from serapis.utils.visualizers.waveform_pyramid import get_plot_event_series
+from serapis.utils.visualizers.waveform_pyramid import K_DEFAULT_NUM_PIXELS
+from serapis.utils.visualizers.step_series import get_step_series
+from serapis.utils.visualizers import typed_array_encoding
+from serapis.utils.visualizers.fileio import waveform_cache
 from serapis.utils.visualizers.fileio.logic_saleae_waveform_file_reader import LogicSaleaeWaveformFileReader
 
 
 class LogicSaleaeWaveformVisualizer(VisualizerBase):
 
-    def __init__(self, raw_content, visualizer_id):
-        reader = LogicSaleaeWaveformFileReader(raw_content)
+    def __init__(self, raw_content, visualizer_id, window_url=None):
+        """
+        window_url is the url that serves get_plot_window(), which lets the plots fetch the
+        details when zooming in. If it is None, the plots only show the downsampled overview.
+        """
+        self._set_template_context(LogicSaleaeWaveformFileReader(raw_content), visualizer_id,
+                window_url, read_content=lambda: raw_content)
+
+    @classmethod
+    def from_waveform_file(cls, f, visualizer_id, window_url=None, path=None):
+        """
+        Same as the constructor, but parses f (a file opened in binary mode) chunk by chunk
+        instead of reading the whole raw content into memory. If path (the path of a stored file)
+        is given, the waveform cache is looked up by the stored file before reading f.
+        """
+        def read_content():
+            f.seek(0)
+            return f.read()
+
+        visualizer = cls.__new__(cls)
+        visualizer._set_template_context(_read_waveform_file(f, path), visualizer_id, window_url,
+                read_content)
+        return visualizer
+
+    def _set_template_context(self, reader, visualizer_id, window_url, read_content):
+        """
+        read_content is a function which returns the raw content, it is only called to show a file
+        with a format error.
+        """
+        self.parse_error = (None if reader.is_successfully_parsed()
+                else reader.get_error_description())
         error_code = reader.get_error_code()
 
         if error_code == LogicSaleaeWaveformFileReader.ERROR_CODE_EMPTY_FILE:
@@ -29,7 +63,7 @@ class LogicSaleaeWaveformVisualizer(VisualizerBase):
                 '',
                 '************************************************************************',
                 '',
-                content,
+                read_content().decode('ascii'),
             ])
             self.template_context = {
                     'con_visualize': False,
@@ -37,7 +71,7 @@ class LogicSaleaeWaveformVisualizer(VisualizerBase):
             }
         else:
             num_plots = reader.get_num_display_plots()
-            plot_series_json = [self._compute_plot_json(reader, i, visualizer_id)
+            plot_series_json = [self._compute_plot_json(reader, i, visualizer_id, window_url)
                     for i in range(num_plots)]
             self.template_context = {
                     'can_visualize': True,
@@ -45,17 +79,20 @@ class LogicSaleaeWaveformVisualizer(VisualizerBase):
                     'visualizer_id': 'vis%d' % visualizer_id,
             }
 
-    def get_js_files(self):
+    @classmethod
+    def get_js_files(cls):
         return [
                 "https://www.amcharts.com/lib/3/amcharts.js",
                 "https://www.amcharts.com/lib/3/serial.js",
                 "https://www.amcharts.com/lib/3/xy.js",
                 "https://www.amcharts.com/lib/3/plugins/export/export.min.js",
                 "https://www.amcharts.com/lib/3/themes/light.js",
+                settings.STATIC_URL + "serapis/js/visualizers/waveform_typed_array.js",
                 settings.STATIC_URL + "serapis/js/visualizers/logic_saleae_waveform_visualizer_helper.js",
         ]
     
-    def get_css_files(self):
+    @classmethod
+    def get_css_files(cls):
         return [
                 "https://www.amcharts.com/lib/3/plugins/export/export.css",
         ]
@@ -66,29 +103,74 @@ class LogicSaleaeWaveformVisualizer(VisualizerBase):
     def get_template_context(self):
         return self.template_context
 
-    def _compute_plot_json(self, reader, plot_idx, visualizer_id):
-        plot_name, plot_events = reader.get_event_series(plot_idx)
-        
-        # plot_events is a list of (timestamp_sec, bus_value). Here we convert timestamps into
-        # microseconds because it's easier to visualize (I hope...)
-        plot_events = [(t * 1e6, v) for t, v in plot_events]
-
-        transition_width = 0.001
-
-        series_timestamps = []
-        series_values = []
-
-        for i in range(len(plot_events) - 1):
-            series_timestamps.append(plot_events[i][0])
-            series_values.append(plot_events[i][1])
-            series_timestamps.append(plot_events[i+1][0] - transition_width)
-            series_values.append(plot_events[i][1])
+    def _compute_plot_json(self, reader, plot_idx, visualizer_id, window_url):
+        plot_name, series_timestamps, series_values = _compute_plot_series(
+                reader, plot_idx, K_DEFAULT_NUM_PIXELS)
         
         div_id = 'waveform%d-%d' % (visualizer_id, plot_idx)
 
-        return json.dumps({
-            'timestamps': series_timestamps,
-            'values': series_values,
+        plot_json = typed_array_encoding.encode_plot_series(series_timestamps, series_values)
+        plot_json.update({
             'label': plot_name,
             'id': div_id,
+            'plot_idx': plot_idx,
+            'window_url': window_url,
         })
+        return json.dumps(plot_json)
+
+
+def get_plot_window(raw_content, plot_idx, start_time_us, end_time_us, num_pixels,
+        encoding=typed_array_encoding.K_ENCODING_JSON):
+    """
+    Compute a plot within a time window, for the chart to show the details when zooming in.
+
+    Returns:
+      A dictionary with `encoding`, `timestamps` (in microsecond) and `values` (see
+      typed_array_encoding.encode_plot_series()), or None if the file cannot be parsed or plot_idx
+      is out of range
+    """
+    return _get_plot_window(LogicSaleaeWaveformFileReader(raw_content), plot_idx, start_time_us,
+            end_time_us, num_pixels, encoding)
+
+def get_plot_window_from_file(f, plot_idx, start_time_us, end_time_us, num_pixels,
+        encoding=typed_array_encoding.K_ENCODING_JSON, path=None):
+    """
+    Same as get_plot_window(), but parses f (a file opened in binary mode) chunk by chunk instead
+    of reading the whole raw content into memory. See
+    LogicSaleaeWaveformVisualizer.from_waveform_file() for path.
+    """
+    return _get_plot_window(_read_waveform_file(f, path), plot_idx, start_time_us, end_time_us,
+            num_pixels, encoding)
+
+def _read_waveform_file(f, path=None):
+    if path is not None:
+        cache_key = waveform_cache.WaveformCache.compute_stored_file_key('logicsaleae', path)
+    else:
+        # hashing the file is cheaper than parsing it again when the waveform is cached
+        cache_key = waveform_cache.WaveformCache.compute_file_key('logicsaleae', f)
+    return LogicSaleaeWaveformFileReader.from_file(f, cache_key=cache_key)
+
+def _get_plot_window(reader, plot_idx, start_time_us, end_time_us, num_pixels, encoding):
+    if not reader.is_successfully_parsed():
+        return None
+    if plot_idx < 0 or plot_idx >= reader.get_num_display_plots():
+        return None
+
+    _, series_timestamps, series_values = _compute_plot_series(
+            reader, plot_idx, num_pixels, start_time_us, end_time_us)
+    return typed_array_encoding.encode_plot_series(series_timestamps, series_values, encoding)
+
+def _compute_plot_series(reader, plot_idx, num_pixels, start_time_us=None, end_time_us=None):
+    """
+    Returns:
+      (plot_name, series_timestamps, series_values), two numpy arrays. Each event becomes two
+      points, such that the chart draws a vertical transition.
+    """
+    # timestamps are in seconds. Here we convert timestamps into microseconds because it's easier
+    # to visualize (I hope...). Only ship as many transitions as the chart can show.
+    plot_name, timestamps, values = get_plot_event_series(
+            reader, plot_idx, num_pixels, start_time_us, end_time_us, time_scale=1e6)
+
+    transition_width = 0.001
+    series_timestamps, series_values = get_step_series(timestamps, values, transition_width)
+    return (plot_name, series_timestamps, series_values)
@@ -1,22 +1,54 @@
+import io
+
+from embed_grader import settings
+
 from serapis.utils.visualizers.visualizer_base import VisualizerBase
 
 
+"""
+An output log can be enormous when a program runs away, hence PlainTextVisualizer never embeds the
+whole file into the page. It only shows the first and the last K_PAGE_SIZE bytes, and the page
+fetches the bytes in between on demand from the url given as window_url, which serves
+read_text_page(). The whole file is still available by the download link.
+
+Pages are aligned to line boundaries, except for a line which is longer than a page.
+"""
+
+# The number of bytes shown at the beginning and at the end of a file
+K_PAGE_SIZE = 64 << 10
+
+# The maximum number of bytes that read_text_page() reads at once
+K_MAX_PAGE_SIZE = 1 << 20
+
+
 class PlainTextVisualizer(VisualizerBase):
-    
-    def __init__(self, raw_content, visualizer_id):
-        if len(raw_content) == 0:
-            content = '(Empty file)'
-        else:
-            try:
-                content = raw_content.decode('ascii')
-            except:
-                content = '(The file includes non-ascii characters)'
-        self.template_context = {'content': content}
-
-    def get_js_files(self):
-        return None
-    
-    def get_css_files(self):
+
+    def __init__(self, raw_content, visualizer_id, window_url=None):
+        """
+        window_url is the url that serves read_text_page() for this file. If it is None, the part
+        of a large file that is not shown cannot be loaded by the page.
+        """
+        self.template_context = _get_template_context(
+                io.BytesIO(raw_content), visualizer_id, window_url)
+
+    @classmethod
+    def from_file(cls, f, visualizer_id, window_url=None):
+        """
+        Same as the constructor, but only reads the pages to be shown from f, a seekable file
+        opened in binary mode
+        """
+        visualizer = cls.__new__(cls)
+        visualizer.template_context = _get_template_context(f, visualizer_id, window_url)
+        return visualizer
+
+    @classmethod
+    def get_js_files(cls):
+        return [
+                settings.STATIC_URL + "serapis/js/visualizers/plain_text_visualizer_helper.js",
+        ]
+
+    @classmethod
+    def get_css_files(cls):
         return None
 
     def get_template_path(self):
@@ -24,3 +56,84 @@ class PlainTextVisualizer(VisualizerBase):
 
     def get_template_context(self):
         return self.template_context
+
+
+def read_text_page(f, offset, length=K_PAGE_SIZE, end=None):
+    """
+    Read a page of a text file. Unless the page reaches `end`, it is cut at the last line break, so
+    that the next page starts at a new line.
+
+    Params:
+      f: A seekable file opened in binary mode
+      offset: The byte offset where the page starts
+      length: The maximum number of bytes of the page, capped by K_MAX_PAGE_SIZE
+      end: The byte offset where the page has to stop, or None for the end of the file
+    Returns:
+      A dictionary with `start` and `end` (the byte offsets of the page), `file_size`, and `content`
+          (a string, in which non-ascii bytes are replaced)
+    """
+    file_size = _get_file_size(f)
+    end = file_size if end is None else min(end, file_size)
+    start = min(max(offset, 0), end)
+    page_end = min(start + min(max(length, 1), K_MAX_PAGE_SIZE), end)
+
+    f.seek(start)
+    raw_page = f.read(page_end - start)
+    if page_end < end:
+        line_end = raw_page.rfind(b'\n') + 1
+        if line_end > 0:
+            raw_page = raw_page[:line_end]
+            page_end = start + line_end
+
+    return {
+        'start': start,
+        'end': page_end,
+        'file_size': file_size,
+        'content': raw_page.decode('ascii', errors='replace'),
+    }
+
+def _read_text_tail(f, start, length):
+    """
+    Read the last `length` bytes of a file, but no earlier than `start`. The page begins at a new
+    line unless it starts at `start`, or the last line is longer than the page.
+    """
+    file_size = _get_file_size(f)
+    tail_start = max(start, file_size - length)
+
+    f.seek(tail_start)
+    raw_page = f.read(file_size - tail_start)
+    if tail_start > start:
+        f.seek(tail_start - 1)
+        if f.read(1) != b'\n':
+            line_start = raw_page.find(b'\n') + 1
+            if 0 < line_start < len(raw_page):
+                raw_page = raw_page[line_start:]
+                tail_start += line_start
+
+    return {
+        'start': tail_start,
+        'end': file_size,
+        'file_size': file_size,
+        'content': raw_page.decode('ascii', errors='replace'),
+    }
+
+def _get_file_size(f):
+    return f.seek(0, io.SEEK_END)
+
+def _get_template_context(f, visualizer_id, window_url):
+    head = read_text_page(f, 0, K_PAGE_SIZE)
+    if head['file_size'] == 0:
+        head['content'] = '(Empty file)'
+
+    # the tail is only shown separately if it does not overlap the head
+    tail = None
+    if head['end'] < head['file_size']:
+        tail = _read_text_tail(f, head['end'], K_PAGE_SIZE)
+
+    return {
+        'visualizer_id': 'vis%d' % visualizer_id,
+        'window_url': window_url,
+        'head': head,
+        'tail': tail,
+        'num_hidden_bytes': (tail['start'] - head['end']) if tail else 0,
+    }
@@ -0,0 +1,29 @@
+import numpy
+
+"""
+The waveform charts draw straight lines between points, hence an event series is converted into a
+step series before being plotted: each event holds its value until shortly before the next event,
+so that the chart draws a (nearly) vertical transition.
+"""
+
+
+def get_step_series(timestamps, values, transition_width):
+    """
+    Params:
+      timestamps: A list (or a numpy array) of real numbers in ascending order
+      values: A list (or a numpy array) of bus values, same length as timestamps
+      transition_width: A real number, how long before the next event the value is held, in the
+          same unit as timestamps
+    Returns:
+      (series_timestamps, series_values), two numpy arrays. Each event except the last one becomes
+          two points, (t[i], v[i]) and (t[i+1] - transition_width, v[i]).
+    """
+    timestamps = numpy.asarray(timestamps, dtype=numpy.float64)
+    values = numpy.asarray(values, dtype=numpy.uint64)
+    num_steps = max(len(timestamps) - 1, 0)
+
+    series_timestamps = numpy.empty(num_steps * 2, dtype=numpy.float64)
+    series_timestamps[0::2] = timestamps[:num_steps]
+    numpy.subtract(timestamps[1:], transition_width, out=series_timestamps[1::2])
+    series_values = numpy.repeat(values[:num_steps], 2)
+    return (series_timestamps, series_values)
@@ -0,0 +1,56 @@
+import base64
+import numpy
+
+"""
+Plots are shipped to the browser as base64 strings of little-endian typed arrays rather than JSON
+lists of numbers. They are several times smaller, and they are produced from numpy arrays and
+parsed by the browser without touching each number. waveform_typed_array.js (in the static files)
+decodes them into JavaScript typed arrays.
+"""
+
+K_ENCODING_JSON = 'json'
+K_ENCODING_BASE64 = 'base64'
+
+K_FLOAT64_DTYPE = numpy.dtype('<f8')
+K_UINT32_DTYPE = numpy.dtype('<u4')
+K_MAX_UINT32 = (1 << 32) - 1
+
+
+def encode_typed_array(array):
+    """
+    Params:
+      array: A numpy array of real numbers or unsigned integers. Unsigned integers are encoded as
+          Uint32Array if they fit, otherwise they are encoded as Float64Array like real numbers.
+    Returns:
+      A dictionary with `type` ('Float64Array' or 'Uint32Array') and `data` (a base64 string)
+    """
+    if array.dtype.kind == 'u' and (len(array) == 0 or array.max() <= K_MAX_UINT32):
+        array_type, dtype = 'Uint32Array', K_UINT32_DTYPE
+    else:
+        array_type, dtype = 'Float64Array', K_FLOAT64_DTYPE
+    return {
+        'type': array_type,
+        'data': base64.b64encode(array.astype(dtype).tobytes()).decode('ascii'),
+    }
+
+def encode_plot_series(timestamps, values, encoding=K_ENCODING_BASE64):
+    """
+    Params:
+      timestamps: A list (or a numpy array) of real numbers
+      values: A list (or a numpy array) of bus values
+      encoding: K_ENCODING_BASE64 for typed arrays, or K_ENCODING_JSON for plain lists
+    Returns:
+      A dictionary with `encoding`, `timestamps` and `values`
+    """
+    if encoding == K_ENCODING_JSON:
+        return {
+            'encoding': K_ENCODING_JSON,
+            'timestamps': numpy.asarray(timestamps, dtype=numpy.float64).tolist(),
+            'values': numpy.asarray(values, dtype=numpy.uint64).tolist(),
+        }
+
+    return {
+        'encoding': K_ENCODING_BASE64,
+        'timestamps': encode_typed_array(numpy.asarray(timestamps, dtype=numpy.float64)),
+        'values': encode_typed_array(numpy.asarray(values, dtype=numpy.uint64)),
+    }
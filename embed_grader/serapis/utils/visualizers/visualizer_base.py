@@ -4,24 +4,28 @@ from django.template import Context
 
 class VisualizerBase(object):
     
-    def __init__(self, raw_content, visualizer_id):
+    def __init__(self, raw_content, visualizer_id, window_url=None):
         """
         Process raw_content which is the content of a file to be visualized. visualizer_id is
-        guaranteed to be unique across different visualizers.
+        guaranteed to be unique across different visualizers. window_url is the url which serves
+        VisualizerManager.get_plot_window() for this file, visualizers without plots ignore it.
         """
         pass
 
-    def get_js_files(self):
+    @classmethod
+    def get_js_files(cls):
         """
         Return a list of strings, indicating the required javascript files. Note the order matters
-        because one javascript file may depend on another one.
+        because one javascript file may depend on another one. It does not depend on the content,
+        so that a page can import the files before the content is visualized.
         """
         pass
     
-    def get_css_files(self):
+    @classmethod
+    def get_css_files(cls):
         """
         Return a list of strings, indicating the required css files. Note the order matters because
-        one css file may depend on another one
+        one css file may depend on another one. It does not depend on the content either.
         """
         pass
 
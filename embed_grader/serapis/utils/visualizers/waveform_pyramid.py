@@ -0,0 +1,277 @@
+import numpy
+
+from serapis.utils.visualizers.fileio import waveform_cache
+
+"""
+WaveformPyramid downsamples an event series for plotting. A chart cannot show more than a couple
+of transitions per pixel, hence shipping every transition of a busy signal only costs bandwidth and
+rendering time.
+
+The pyramid divides the time range of the series into 2^k buckets at each level k, and remembers
+the minimum and the maximum bus value within each bucket. A bucket is drawn as a step from its
+minimum to its maximum, which keeps glitches visible. A query picks the coarsest level whose
+buckets are no wider than a pixel, so the size of the result is bounded by the number of pixels
+rather than by the length of the capture. When a window has few transitions, the exact transitions
+are returned instead. When a window is so narrow that even the finest buckets are wider than a
+pixel, the events of the window are downsampled directly (see downsample_event_series()).
+
+Building a pyramid touches every event of the series, hence the visualizers keep it along with the
+parsed waveform in the waveform cache, and zooming only costs a lookup. A zoom into a waveform
+whose pyramid is not cached (e.g., it has been evicted, or another process rendered the overview)
+only downsamples the events within the window (see get_plot_event_series()).
+"""
+
+# The finest level has at most this many buckets
+K_MAX_NUM_BUCKETS = 1 << 16
+
+# A window is not downsampled if it has no more than this many events per pixel
+K_MAX_NUM_EVENTS_PER_PIXEL = 2
+
+# The width of a plot on the task detail page. It does not have to be accurate.
+K_DEFAULT_NUM_PIXELS = 2000
+
+
+class WaveformPyramid(object):
+
+    def __init__(self, timestamps, values, max_num_buckets=K_MAX_NUM_BUCKETS):
+        """
+        Params:
+          timestamps: A list (or a numpy array) of real numbers in ascending order. The unit does
+              not matter.
+          values: A list (or a numpy array) of bus values, same length as timestamps
+          max_num_buckets: The number of buckets of the finest level is the smallest power of two
+              which is no less than the number of events, but no more than max_num_buckets
+        """
+        self.timestamps = numpy.asarray(timestamps, dtype=numpy.float64)
+        self.values = numpy.asarray(values, dtype=numpy.uint64)
+        if len(self.timestamps) == 0:
+            raise ValueError('The series is empty')
+
+        self.start_time = self.timestamps[0].item()
+        self.end_time = self.timestamps[-1].item()
+
+        # levels[k] is (min_values, max_values) of 2^k buckets
+        self.levels = []
+        if self.end_time > self.start_time:
+            num_buckets = 1
+            while num_buckets < min(len(self.timestamps), max_num_buckets):
+                num_buckets <<= 1
+            self.levels = self._build_levels(num_buckets)
+
+    def get_num_bytes(self):
+        """
+        Returns:
+          The size of the series and of all the levels, for the waveform cache to account for
+        """
+        num_bytes = self.timestamps.nbytes + self.values.nbytes
+        for min_values, max_values in self.levels:
+            num_bytes += min_values.nbytes + max_values.nbytes
+        return num_bytes
+
+    def _build_levels(self, num_buckets):
+        bucket_width = (self.end_time - self.start_time) / num_buckets
+        bucket_start_times = self.start_time + numpy.arange(num_buckets) * bucket_width
+
+        # the value at the beginning of each bucket is carried over from the event before
+        carried_idxs = numpy.searchsorted(self.timestamps, bucket_start_times, side='right') - 1
+        min_values = self.values[carried_idxs]
+        max_values = min_values.copy()
+
+        # the events in each bucket. Empty buckets are skipped, so that each segment of reduceat()
+        # ends right before the next non-empty bucket. The event at end_time joins the last bucket.
+        first_event_idxs = numpy.searchsorted(self.timestamps, bucket_start_times, side='left')
+        next_first_event_idxs = numpy.append(first_event_idxs[1:], len(self.timestamps))
+        non_empty_mask = first_event_idxs < next_first_event_idxs
+        segment_idxs = first_event_idxs[non_empty_mask]
+        min_values[non_empty_mask] = numpy.minimum(min_values[non_empty_mask],
+                numpy.minimum.reduceat(self.values, segment_idxs))
+        max_values[non_empty_mask] = numpy.maximum(max_values[non_empty_mask],
+                numpy.maximum.reduceat(self.values, segment_idxs))
+
+        # coarser levels are built by merging pairs of buckets
+        levels = [(min_values, max_values)]
+        while len(min_values) > 1:
+            min_values = min_values.reshape(-1, 2).min(axis=1)
+            max_values = max_values.reshape(-1, 2).max(axis=1)
+            levels.append((min_values, max_values))
+        levels.reverse()
+        return levels
+
+    def get_event_series(self, num_pixels, start_time=None, end_time=None):
+        """
+        Get the events within a time window, downsampled for a chart of num_pixels wide.
+
+        Params:
+          num_pixels: A positive integer
+          start_time: A real number, or None for the beginning of the series
+          end_time: A real number, or None for the end of the series
+        Returns:
+          (timestamps, bus_values), two numpy arrays. Like WaveformQueryBase._get_event_series(),
+              the series is aligned with both start_time and end_time, and consecutive events do
+              not share the same value. The number of events is bounded by about 4 * num_pixels.
+        """
+
+        start_time = self.start_time if start_time is None else max(start_time, self.start_time)
+        end_time = self.end_time if end_time is None else min(end_time, self.end_time)
+        end_time = max(start_time, end_time)
+
+        start_idx = numpy.searchsorted(self.timestamps, start_time, side='right')
+        end_idx = numpy.searchsorted(self.timestamps, end_time, side='right')
+        num_events = end_idx - start_idx
+        if (num_events <= K_MAX_NUM_EVENTS_PER_PIXEL * num_pixels or len(self.levels) == 0
+                or end_time == start_time):
+            timestamps, values = self._get_raw_events(start_idx, end_idx, start_time)
+        elif self._get_level(num_pixels, start_time, end_time) >= len(self.levels):
+            # even the finest buckets are wider than a pixel
+            timestamps, values = self._get_raw_events(start_idx, end_idx, start_time)
+            timestamps, values = self._finish_series(timestamps, values, end_time)
+            return downsample_event_series(timestamps, values, num_pixels)
+        else:
+            timestamps, values = self._get_bucket_events(num_pixels, start_time, end_time)
+
+        return self._finish_series(timestamps, values, end_time)
+
+    def _get_raw_events(self, start_idx, end_idx, start_time):
+        # the value at start_time is carried over from the event at or before it
+        timestamps = numpy.concatenate(([start_time], self.timestamps[start_idx:end_idx]))
+        values = numpy.concatenate(([self.values[start_idx-1]], self.values[start_idx:end_idx]))
+        return (timestamps, values)
+
+    def _get_level(self, num_pixels, start_time, end_time):
+        """
+        Returns:
+          The index of the coarsest level whose buckets are no wider than a pixel, which may be
+          beyond the finest level
+        """
+        min_num_buckets = num_pixels * (self.end_time - self.start_time) / (end_time - start_time)
+        return max(0, int(numpy.ceil(numpy.log2(min_num_buckets))))
+
+    def _get_bucket_events(self, num_pixels, start_time, end_time):
+        """
+        Returns:
+          (timestamps, bus_values), two events per bucket which overlaps the window. The buckets
+              on both ends are cropped to the window.
+        """
+
+        # the coarsest level whose buckets are no wider than a pixel, or the finest one
+        series_length = self.end_time - self.start_time
+        level = min(len(self.levels) - 1, self._get_level(num_pixels, start_time, end_time))
+        min_values, max_values = self.levels[level]
+        num_buckets = len(min_values)
+        bucket_width = series_length / num_buckets
+
+        first_bucket = min(num_buckets - 1, int((start_time - self.start_time) // bucket_width))
+        last_bucket = int(numpy.ceil((end_time - self.start_time) / bucket_width)) - 1
+        last_bucket = max(first_bucket, min(num_buckets - 1, last_bucket))
+        bucket_idxs = numpy.arange(first_bucket, last_bucket + 1)
+        bucket_start_times = self.start_time + bucket_idxs * bucket_width
+        segment_start_times = numpy.maximum(bucket_start_times, start_time)
+        segment_end_times = numpy.minimum(bucket_start_times + bucket_width, end_time)
+
+        # each bucket becomes a step from its minimum to its maximum
+        timestamps = numpy.empty(len(bucket_idxs) * 2, dtype=numpy.float64)
+        values = numpy.empty(len(bucket_idxs) * 2, dtype=numpy.uint64)
+        timestamps[0::2] = segment_start_times
+        timestamps[1::2] = (segment_start_times + segment_end_times) / 2.
+        values[0::2] = min_values[bucket_idxs]
+        values[1::2] = max_values[bucket_idxs]
+        return (timestamps, values)
+
+    def _finish_series(self, timestamps, values, end_time):
+        # filter out repeating transitions
+        keep_mask = numpy.empty(len(values), dtype=bool)
+        keep_mask[0] = True
+        numpy.not_equal(values[1:], values[:-1], out=keep_mask[1:])
+        timestamps, values = timestamps[keep_mask], values[keep_mask]
+
+        # handle end boundary
+        if timestamps[-1] < end_time:
+            timestamps = numpy.append(timestamps, end_time)
+            values = numpy.append(values, values[-1])
+        return (timestamps, values)
+
+
+def get_plot_pyramid(reader, plot_idx, time_scale=1.):
+    """
+    Get the pyramid of a plot of a waveform file, which is built once and then kept in the waveform
+    cache along with the parsed waveform.
+
+    Params:
+      reader: A waveform file reader which is successfully parsed
+      plot_idx: The index of the plot
+      time_scale: The timestamps of the reader are multiplied by it, e.g., 1e6 from second to
+          microsecond
+    Returns:
+      (plot_name, pyramid)
+    """
+    derived_name = _get_pyramid_name(plot_idx, time_scale)
+    plot_pyramid = waveform_cache.load_derived(reader, derived_name)
+    if plot_pyramid is None:
+        plot_name, timestamps, values = reader.get_event_series_columns(plot_idx)
+        if time_scale != 1.:
+            timestamps = timestamps * time_scale
+        pyramid = WaveformPyramid(timestamps, values)
+        plot_pyramid = (plot_name, pyramid)
+        waveform_cache.save_derived(reader, derived_name, plot_pyramid, pyramid.get_num_bytes())
+    return plot_pyramid
+
+def get_plot_event_series(reader, plot_idx, num_pixels, start_time=None, end_time=None,
+        time_scale=1.):
+    """
+    Get the events of a plot of a waveform file within a time window, downsampled for a chart of
+    num_pixels wide. The whole plot is served by its pyramid, which is built if it is not cached
+    yet. A window is served by the cached pyramid if there is one, otherwise only the events within
+    the window are extracted and downsampled.
+
+    Params:
+      reader: A waveform file reader which is successfully parsed
+      plot_idx: The index of the plot
+      num_pixels: A positive integer
+      start_time: A real number in the time unit of the plot, or None for the beginning
+      end_time: A real number in the time unit of the plot, or None for the end
+      time_scale: Same as get_plot_pyramid()
+    Returns:
+      (plot_name, timestamps, bus_values), same as WaveformPyramid.get_event_series()
+    """
+    plot_pyramid = None
+    if start_time is None and end_time is None:
+        plot_pyramid = get_plot_pyramid(reader, plot_idx, time_scale)
+    else:
+        plot_pyramid = waveform_cache.load_derived(reader, _get_pyramid_name(plot_idx, time_scale))
+
+    if plot_pyramid is not None:
+        plot_name, pyramid = plot_pyramid
+        timestamps, values = pyramid.get_event_series(num_pixels, start_time, end_time)
+        return (plot_name, timestamps, values)
+
+    if start_time is not None and end_time is not None:
+        end_time = max(start_time, end_time)
+    plot_name, timestamps, values = reader.get_event_series_columns(plot_idx,
+            None if start_time is None else start_time / time_scale,
+            None if end_time is None else end_time / time_scale)
+    if time_scale != 1.:
+        timestamps = timestamps * time_scale
+    timestamps, values = downsample_event_series(timestamps, values, num_pixels)
+    return (plot_name, timestamps, values)
+
+def downsample_event_series(timestamps, values, num_pixels):
+    """
+    Downsample the events of a window without keeping a pyramid, by building the finest level
+    that a chart of num_pixels wide needs over the window only. It costs as much as the number of
+    events, hence it is meant for a window which is either narrow or queried once.
+
+    Params:
+      timestamps: A numpy array of real numbers in ascending order, which starts and ends at the
+          two ends of the window (e.g., from WaveformQueryBase.get_event_series_columns())
+      values: A numpy array of bus values, same length as timestamps
+      num_pixels: A positive integer
+    Returns:
+      (timestamps, bus_values), same as WaveformPyramid.get_event_series()
+    """
+    num_buckets = 1
+    while num_buckets < num_pixels:
+        num_buckets <<= 1
+    return WaveformPyramid(timestamps, values, num_buckets).get_event_series(num_pixels)
+
+def _get_pyramid_name(plot_idx, time_scale):
+    return 'pyramid-%d-%r' % (plot_idx, time_scale)
@@ -210,7 +210,7 @@ def download_csv(request, course_id):
             last_submission = grading.get_last_submission(team, assignment)
         if last_submission is None:
             continue
-        _, score, max_possible_score_for_each_assignment[idx] = last_submission.retrieve_task_grading_status_and_score_sum(True)
+        score, max_possible_score_for_each_assignment[idx] = last_submission.retrieve_score_sum(True)
         team_students = [o.user_fk for o in TeamMember.objects.filter(team_fk=team)]
         for student in students:
             scores[student][idx] = score
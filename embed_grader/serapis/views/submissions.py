@@ -12,6 +12,7 @@ from django.template import RequestContext
 from django.forms import modelform_factory
 from django import forms
 from django.core.urlresolvers import reverse
+from django.utils.http import urlencode
 
 from django.contrib.auth.models import User, Group
 from guardian.decorators import permission_required_or_403
@@ -19,6 +20,7 @@ from guardian.compat import get_user_model
 from guardian.shortcuts import assign_perm
 
 from django.views.generic import TemplateView
+from django.utils.cache import patch_cache_control
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 
 from serapis.models import *
@@ -28,7 +30,17 @@ from serapis.utils import file_schema
 from serapis.utils import user_info_helper
 from serapis.utils import team_helper
 from serapis.utils import task_grading_status_helper
+from serapis.utils import visualization_artifacts
 from serapis.utils.visualizer_manager import VisualizerManager
+from serapis.utils.visualizers.waveform_pyramid import K_DEFAULT_NUM_PIXELS
+from serapis.utils.visualizers import typed_array_encoding
+from serapis.utils.visualizers.plain_text_visualizer import K_PAGE_SIZE as K_TEXT_PAGE_SIZE
+
+K_WAVEFORM_WINDOW_MAX_NUM_PIXELS = 10000
+
+# Output files do not change once the grading finishes, and the url of a visualization includes the
+# file name, so the browser can keep the visualizations for a while
+K_VISUALIZATION_MAX_AGE_SEC = 24 * 60 * 60
 
 
 @login_required(login_url='/login/')
@@ -139,11 +151,14 @@ def task_grading_detail(request, task_grading_id):
 
     visualizer_manager = VisualizerManager()
 
+    # the files are not read here, each visualization is fetched by the page separately
     for field_name in output_files:
         file = output_files[field_name].file
-        raw_content = file.read()
         url = file.url
-        visualizer_manager.add_file(field_name, raw_content, url)
+        visualization_url = '%s?%s' % (
+                reverse('ajax-get-task-grading-visualization', args=(task_grading_status.id,)),
+                urlencode({'field_name': field_name, 'file': file.name}))
+        visualizer_manager.add_lazy_file(field_name, url, visualization_url)
 
     if task_grading_status.grading_detail:
         feedback = task_grading_status.grading_detail.read()
@@ -166,6 +181,166 @@ def task_grading_detail(request, task_grading_id):
     return render(request, 'serapis/submission/task_grading_detail.html', template_context)
 
 
+@login_required(login_url='/login/')
+def ajax_get_task_grading_visualization(request, task_grading_id):
+    """
+    Serve the html of the visualization of one output file, which is fetched by the task grading
+    detail page after the page is loaded. The GET parameters are `field_name` and `visualizer_id`
+    (see VisualizerManager.add_lazy_file()). `file` is the name of the stored file, which is only
+    used to tell apart the visualizations of regraded files in the browser cache.
+    """
+    if not request.is_ajax():
+        return HttpResponseBadRequest("Not enough privilege")
+
+    try:
+        task_grading_status = TaskGradingStatus.objects.get(id=task_grading_id)
+    except TaskGradingStatus.DoesNotExist:
+        return HttpResponseBadRequest("Task grading detail cannot be found")
+
+    user = User.objects.get(username=request.user)
+    if not task_grading_status_helper.can_show_grading_details_to_user(task_grading_status, user):
+        return HttpResponseBadRequest("Not enough privilege")
+
+    try:
+        field_name = request.GET['field_name']
+        visualizer_id = int(request.GET['visualizer_id'])
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest("Invalid parameters")
+
+    output_files = file_schema.get_dict_schema_name_to_task_grading_status_schema_files(
+            task_grading_status, enforce_check=True)
+    if field_name not in output_files:
+        return HttpResponseBadRequest("Output file cannot be found")
+
+    schema_file = output_files[field_name]
+    if not schema_file or not schema_file.file:
+        return HttpResponseBadRequest("Output file cannot be found")
+
+    if VisualizerManager.can_render_from_file(field_name):
+        file = schema_file.file
+        file.open('rb')
+        try:
+            html = VisualizerManager.render_file_html_from_file(
+                    field_name, file, visualizer_id,
+                    window_url=visualization_artifacts.get_text_page_url(
+                            task_grading_status, field_name))
+        finally:
+            file.close()
+    else:
+        # the visualization is normally stored when the task finishes, it is only rendered here if
+        # it is missing or outdated
+        html = visualization_artifacts.get_stored_visualization_html(schema_file, visualizer_id)
+        if html is None:
+            html = visualization_artifacts.generate_visualization(
+                    task_grading_status, field_name, schema_file, visualizer_id)
+
+    # only a visualization is cached by the browser, an error (e.g., the privilege is not granted
+    # yet) is not
+    response = HttpResponse(html)
+    patch_cache_control(response, private=True, max_age=K_VISUALIZATION_MAX_AGE_SEC)
+    return response
+
+
+@login_required(login_url='/login/')
+def ajax_get_output_file_text_page(request, task_grading_id):
+    """
+    Serve a page of a plain text output file, which is fetched by the task grading detail page to
+    show the part of a large file that is hidden. The GET parameters are `field_name`, `offset`
+    (in byte), and optionally `length` and `end` (the offset where the page has to stop). The page
+    is aligned to line boundaries, see plain_text_visualizer.read_text_page().
+    """
+    if not request.is_ajax():
+        return HttpResponseBadRequest("Not enough privilege")
+
+    try:
+        task_grading_status = TaskGradingStatus.objects.get(id=task_grading_id)
+    except TaskGradingStatus.DoesNotExist:
+        return HttpResponseBadRequest("Task grading detail cannot be found")
+
+    user = User.objects.get(username=request.user)
+    if not task_grading_status_helper.can_show_grading_details_to_user(task_grading_status, user):
+        return HttpResponseBadRequest("Not enough privilege")
+
+    try:
+        field_name = request.GET['field_name']
+        offset = int(request.GET['offset'])
+        length = int(request.GET.get('length', K_TEXT_PAGE_SIZE))
+        end = int(request.GET['end']) if 'end' in request.GET else None
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest("Invalid parameters")
+
+    output_files = file_schema.get_dict_schema_name_to_task_grading_status_schema_files(
+            task_grading_status, enforce_check=True)
+    schema_file = output_files.get(field_name)
+    if not schema_file or not schema_file.file:
+        return HttpResponseBadRequest("Output file cannot be found")
+
+    file = schema_file.file
+    file.open('rb')
+    try:
+        ajax_json = VisualizerManager.get_text_page(field_name, file, offset, length, end)
+    finally:
+        file.close()
+    if ajax_json is None:
+        return HttpResponseBadRequest("The file is not a plain text file")
+
+    return JsonResponse(ajax_json)
+
+
+@login_required(login_url='/login/')
+def ajax_get_waveform_window(request, task_grading_id):
+    """
+    Serve the details of a waveform plot within a time window, which are fetched by the plots on
+    the task grading detail page when zooming in. The GET parameters are `field_name`, `plot_idx`,
+    `start` and `end` (in the time unit of the plot), and optionally `num_pixels` and `encoding`
+    ('json' by default, or 'base64' for typed arrays).
+    """
+    if not request.is_ajax():
+        return HttpResponseBadRequest("Not enough privilege")
+
+    try:
+        task_grading_status = TaskGradingStatus.objects.get(id=task_grading_id)
+    except TaskGradingStatus.DoesNotExist:
+        return HttpResponseBadRequest("Task grading detail cannot be found")
+
+    user = User.objects.get(username=request.user)
+    if not task_grading_status_helper.can_show_grading_details_to_user(task_grading_status, user):
+        return HttpResponseBadRequest("Not enough privilege")
+
+    try:
+        field_name = request.GET['field_name']
+        plot_idx = int(request.GET['plot_idx'])
+        start_time = float(request.GET['start'])
+        end_time = float(request.GET['end'])
+        num_pixels = int(request.GET.get('num_pixels', K_DEFAULT_NUM_PIXELS))
+        encoding = request.GET.get('encoding', typed_array_encoding.K_ENCODING_JSON)
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest("Invalid parameters")
+    if encoding not in (typed_array_encoding.K_ENCODING_JSON,
+            typed_array_encoding.K_ENCODING_BASE64):
+        return HttpResponseBadRequest("Invalid parameters")
+    num_pixels = min(max(num_pixels, 1), K_WAVEFORM_WINDOW_MAX_NUM_PIXELS)
+
+    output_files = file_schema.get_dict_schema_name_to_task_grading_status_schema_files(
+            task_grading_status, enforce_check=True)
+    schema_file = output_files.get(field_name)
+    if not schema_file or not schema_file.file:
+        return HttpResponseBadRequest("Output file cannot be found")
+
+    file = schema_file.file
+    file.open('rb')
+    try:
+        # the waveform cache is looked up by the stored file, which is only read on a miss
+        ajax_json = VisualizerManager.get_plot_window_from_file(field_name, file, plot_idx,
+                start_time, end_time, num_pixels, encoding, path=file.path)
+    finally:
+        file.close()
+    if ajax_json is None:
+        return HttpResponseBadRequest("The file cannot be plotted")
+
+    return JsonResponse(ajax_json)
+
+
 @login_required(login_url='/login/')
 def all_submission_logs_as_teacher(request):
     """